@@ -1,16 +1,29 @@
-from flask import Flask, redirect, url_for, session, request, jsonify
-from authlib.integrations.flask_client import OAuth
+import time
+# 记录本模块（含全部依赖）的导入耗时，导出为smartpark_startup_import_seconds
+_import_started = time.perf_counter()
+
+from flask import Flask, redirect, request, jsonify, Response, stream_with_context, g
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from functools import wraps
 import os
-import requests
 import logging
 from dotenv import load_dotenv
 from urllib.parse import urlencode
 from utils.ai_service import get_ai_recommendation, reroute_recommendation
-from parking_data import parking_lots, get_auckland_destinations
-import random
-import json
+from utils.resilience import get_dependency_states
+from utils.ratelimit import llm_admission, client_key
+from utils.fleet import allocate_fleet, allocate_block, FleetAllocationError
+from utils.blocks import cells_for_vehicle
+from utils import json_codec, metrics, profiling, tracing
+from parking_data import (
+    parking_lots, lots_lock, load_lot, get_available_spots, find_nearby_lots,
+    vehicles_catalog, destinations_catalog,
+    lot_etag, lot_occupancy, get_layout_body, claim_spot, reset_lot,
+    changes_since, add_occupancy_listener, release_block, occupancy_history
+)
+from utils.pubsub import occupancy_broker, occupancy_events
+from utils.lot_codec import encode_compact, encode_msgpack, msgpack, COMPACT_MIMETYPE, MSGPACK_MIMETYPE
 
 # 加载环境变量
 load_dotenv()
@@ -19,7 +32,21 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class FastJSONProvider(JSONProvider):
+    """Flask JSON提供者：使用utils.json_codec（orjson优先）直接输出字节"""
+
+    def dumps(self, obj, **kwargs):
+        return json_codec.dumps_str(obj)
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_codec.dumps(obj), mimetype="application/json")
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 # 从环境变量获取密钥，如果不存在则生成一个（仅用于开发环境）
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', os.urandom(24))
 
@@ -41,6 +68,45 @@ CORS(app,
      max_age=3600
 )
 
+# 记录每个路由的请求延迟（按路由模板而非实际路径，避免标签基数过大），
+# 并为请求创建根span（延续上游traceparent）
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.request_span = tracing.start_request(
+        f"{request.method} {route}",
+        request.headers.get(tracing.TRACEPARENT_HEADER),
+        {"http.method": request.method, "http.route": route}
+    )
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request('flask', request.method, route, response.status_code,
+                                time.perf_counter() - started)
+    span = g.get('request_span')
+    if span is not None and span.trace_id:
+        span.set_attribute("http.status_code", response.status_code)
+        response.headers['X-Trace-Id'] = span.trace_id
+    return response
+
+@app.teardown_request
+def end_request_span(exc):
+    span = g.pop('request_span', None)
+    if span is not None:
+        if exc is not None:
+            span.set_error(f"{type(exc).__name__}: {exc}")
+        span.end()
+
+# 按需性能剖析：仅在配置了PROFILE_TOKEN或采样率时注册
+if profiling.ENABLED:
+    @app.before_request
+    def mark_profile_request():
+        profiling.mark_request(request.headers.get(profiling.PROFILE_HEADER))
+
 # ============================================
 # 注释掉手动设置CORS头部的代码，避免重复设置
 # ============================================
@@ -66,6 +132,12 @@ COGNITO_CLIENT_ID = os.environ.get('COGNITO_CLIENT_ID', '4r2ui82gb5gigfrfjl18tq1
 COGNITO_CLIENT_SECRET = os.environ.get('COGNITO_CLIENT_SECRET', 'h1bsjhhc0skjr9leug1tkru3upe4s1hsqj01qnbplhc2k6819c2')
 COGNITO_DOMAIN = f"https://ap-southeast-2bxhdowudl.auth.ap-southeast-2.amazoncognito.com"
 
+# 静态目录响应的浏览器缓存时间（秒），过期后凭ETag重新验证
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', 300))
+
+# 占用变化推送给所有订阅了该停车场的客户端
+add_occupancy_listener(occupancy_broker.publish)
+
 # 支持多个重定向 URI
 ALLOWED_REDIRECT_URIS = [
     'http://localhost:5173/authorize',
@@ -80,15 +152,23 @@ def get_redirect_uri(request_uri=None):
         return request_uri
     return ALLOWED_REDIRECT_URIS[0]  # 默认使用第一个 URI
 
-# 配置OAuth
-oauth = OAuth(app)
-oauth.register(
-    name='cognito',
-    server_metadata_url=f'{COGNITO_DOMAIN}/.well-known/openid-configuration',
-    client_id=COGNITO_CLIENT_ID,
-    client_secret=COGNITO_CLIENT_SECRET,
-    client_kwargs={'scope': 'email openid phone profile'}
-)
+# 配置OAuth（authlib在首次使用时才导入并注册）
+_oauth = None
+
+def get_oauth():
+    global _oauth
+    if _oauth is None:
+        from authlib.integrations.flask_client import OAuth
+        oauth = OAuth(app)
+        oauth.register(
+            name='cognito',
+            server_metadata_url=f'{COGNITO_DOMAIN}/.well-known/openid-configuration',
+            client_id=COGNITO_CLIENT_ID,
+            client_secret=COGNITO_CLIENT_SECRET,
+            client_kwargs={'scope': 'email openid phone profile'}
+        )
+        _oauth = oauth
+    return _oauth
 
 # Token verification middleware
 def token_required(f):
@@ -108,11 +188,14 @@ def token_required(f):
             token = parts[1]
             
             # Verify token
+            import requests
             userinfo_endpoint = f'{COGNITO_DOMAIN}/userInfo'
-            response = requests.get(
-                userinfo_endpoint,
-                headers={'Authorization': f'Bearer {token}'}
-            )
+            with metrics.dependency_timer('cognito', 'userinfo') as call:
+                response = requests.get(
+                    userinfo_endpoint,
+                    headers={'Authorization': f'Bearer {token}'}
+                )
+                call.error = response.status_code >= 500
             
             if response.status_code != 200:
                 logger.warning(f"Token verification failed: {response.status_code} - {response.text}")
@@ -169,8 +252,11 @@ def exchange_token():
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
         
         # 发送 token 请求
+        import requests
         logger.info("Sending token request to Cognito")
-        response = requests.post(token_endpoint, data=token_data, auth=auth, headers=headers)
+        with metrics.dependency_timer('cognito', 'token') as call:
+            response = requests.post(token_endpoint, data=token_data, auth=auth, headers=headers)
+            call.error = response.status_code >= 500
         
         if response.status_code != 200:
             logger.error(f"Token exchange failed: {response.status_code} - {response.text}")
@@ -179,10 +265,12 @@ def exchange_token():
         tokens = response.json()
         
         # 获取用户信息
-        userinfo_response = requests.get(
-            f"{COGNITO_DOMAIN}/oauth2/userInfo",
-            headers={'Authorization': f"Bearer {tokens['access_token']}"}
-        )
+        with metrics.dependency_timer('cognito', 'userinfo') as call:
+            userinfo_response = requests.get(
+                f"{COGNITO_DOMAIN}/oauth2/userInfo",
+                headers={'Authorization': f"Bearer {tokens['access_token']}"}
+            )
+            call.error = userinfo_response.status_code >= 500
         
         if userinfo_response.status_code != 200:
             logger.error(f"Failed to get user info: {userinfo_response.status_code} - {userinfo_response.text}")
@@ -232,7 +320,36 @@ def update_user_profile(user):
 # Health check endpoint
 @app.route('/api/health')
 def health_check():
-    return jsonify({'status': 'healthy'})
+    # 附带外部依赖的熔断器状态，LLM不可用时服务仍以确定性评分降级运行
+    dependencies = get_dependency_states()
+    degraded = any(d["circuit"]["state"] != "closed" for d in dependencies.values())
+    return jsonify({
+        'status': 'degraded' if degraded else 'healthy',
+        'dependencies': dependencies
+    })
+
+# Prometheus metrics endpoint
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.expose(), mimetype=metrics.CONTENT_TYPE)
+
+# 剖析结果管理接口（需要X-Profile-Token）
+@app.route('/api/admin/profiles')
+def list_profiles():
+    if not profiling.authorized(request.headers.get(profiling.PROFILE_HEADER)):
+        return jsonify({"status": "error", "message": "Not found"}), 404
+    return jsonify({"status": "success", "data": profiling.list_profiles()})
+
+@app.route('/api/admin/profiles/<int:profile_id>')
+def get_profile(profile_id):
+    if not profiling.authorized(request.headers.get(profiling.PROFILE_HEADER)):
+        return jsonify({"status": "error", "message": "Not found"}), 404
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        return jsonify({"status": "error", "message": "Profile not found"}), 404
+    if request.args.get('format') == 'text':
+        return Response(profile["stats"], mimetype='text/plain')
+    return jsonify({"status": "success", "data": profile})
 
 # Login endpoint
 @app.route('/api/auth/login')
@@ -270,168 +387,185 @@ def logout():
         logger.error(f"Error during logout: {str(e)}")
         return jsonify({'error': f'Error during logout: {str(e)}'}), 500
 
+def catalog_response(catalog):
+    """返回预序列化的目录响应，带强ETag；If-None-Match命中时返回304"""
+    snapshot = catalog.current()
+    response = Response(snapshot.body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = CATALOG_MAX_AGE
+    return response.make_conditional(request)
+
 @app.route('/api/vehicles', methods=['GET'])
 def get_vehicles():
     """Get available vehicle types"""
-    vehicles = [
-        {
-            "id": "sedan",
-            "name": "Sedan",
-            "description": "Standard four-door sedan, suitable for city driving",
-            "image": "/models/thumbnails/sedan.jpg",
-            "width": 1.8,
-            "length": 4.5,
-            "height": 1.5,
-            "model_path": "/models/sedan.glb"
-        },
-        {
-            "id": "suv",
-            "name": "SUV",
-            "description": "Sport Utility Vehicle, providing more space and clearance",
-            "image": "/models/thumbnails/suv.jpg",
-            "width": 1.9,
-            "length": 4.7,
-            "height": 1.7,
-            "model_path": "/models/suv.glb"
-        },
-        {
-            "id": "pickup",
-            "name": "Pickup Truck",
-            "description": "Truck with an open-air cargo area",
-            "image": "/models/thumbnails/pickup.jpg",
-            "width": 2.0,
-            "length": 5.3,
-            "height": 1.9,
-            "model_path": "/models/pickup.glb"
-        },
-        {
-            "id": "van",
-            "name": "Van",
-            "description": "Enclosed box-like vehicle suitable for transporting goods",
-            "image": "/models/thumbnails/van.jpg",
-            "width": 2.0,
-            "length": 5.5,
-            "height": 2.2,
-            "model_path": "/models/van.glb"
-        },
-        {
-            "id": "truck",
-            "name": "Truck",
-            "description": "Large transport vehicle with ample space",
-            "image": "/models/thumbnails/truck.jpg",
-            "width": 2.5,
-            "length": 7.0,
-            "height": 2.8,
-            "model_path": "/models/truck.glb"
-        },
-        {
-            "id": "rv",
-            "name": "RV",
-            "description": "Recreational Vehicle with living space, suitable for long journeys",
-            "image": "/models/thumbnails/rv.jpg",
-            "width": 2.3,
-            "length": 6.8,
-            "height": 3.0,
-            "model_path": "/models/rv.glb"
-        }
-    ]
-    
-    return jsonify({"status": "success", "data": vehicles})
+    return catalog_response(vehicles_catalog)
 
 @app.route('/api/destinations', methods=['GET'])
 def get_destinations():
     """获取奥克兰热门目的地"""
-    destinations = get_auckland_destinations()
-    return jsonify({"status": "success", "data": destinations})
+    return catalog_response(destinations_catalog)
 
 @app.route('/api/parking-lots/nearby', methods=['GET'])
 def get_nearby_parking_lots():
-    """获取目的地附近的停车场"""
+    """获取目的地附近的停车场（空间索引查询，支持半径、k近邻、设施筛选和分页）"""
     lat = float(request.args.get('lat', -36.8485))
     lng = float(request.args.get('lng', 174.7630))
     radius = float(request.args.get('radius', 1000))  # 默认1公里半径
+    k = request.args.get('k', type=int)
+    features = [f for f in request.args.get('features', '').split(',') if f]
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', 20, type=int)
     
-    # 简单模拟：为每个请求的位置生成一个附近停车场
     destination_name = request.args.get('name', '未知位置')
     
-    # 生成一个随机但稳定的停车场ID (基于位置)
-    lot_id = f"parking_{int((lat+36)*1000)}_{int((lng-174)*1000)}"
-    
-    nearby_lot = {
-        "id": lot_id,
-        "name": f"{destination_name}停车场",
-        "location": {
-            "lat": lat + random.uniform(-0.001, 0.001),
-            "lng": lng + random.uniform(-0.001, 0.001)
-        },
-        "total_spots": random.randint(50, 300),
-        "available_spots": random.randint(10, 50),
-        "hourly_rate": round(random.uniform(2, 8), 1),
-        "distance_to_destination": int(random.uniform(50, 300)),
-        "features": random.sample(["covered", "security", "disabled_access", 
-                                   "ev_charging", "valet", "24h"], 
-                                 k=random.randint(2, 4))
-    }
-    
-    return jsonify({
-        "status": "success", 
-        "data": {"parkings": [nearby_lot]}
-    })
+    data = find_nearby_lots(lat, lng, radius, k=k, features=features,
+                            page=page, page_size=page_size, destination_name=destination_name)
+    return jsonify({"status": "success", "data": data})
+
+def not_modified(etag):
+    """If-None-Match命中时的304响应"""
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+def _lot_format():
+    """根据?format=或Accept头选择停车场数据的表示：json、compact或msgpack"""
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt
+    best = request.accept_mimetypes.best_match(
+        ['application/json', COMPACT_MIMETYPE, MSGPACK_MIMETYPE], default='application/json'
+    )
+    return {COMPACT_MIMETYPE: 'compact', MSGPACK_MIMETYPE: 'msgpack'}.get(best, 'json')
 
 @app.route('/api/parking-lot/<lot_id>', methods=['GET'])
 def get_parking_lot(lot_id):
-    """获取停车场详情和布局"""
+    """获取停车场详情和布局（版本未变化时返回304），支持紧凑和二进制表示"""
+    parking_lot = load_lot(lot_id)
+    fmt = _lot_format()
+    if fmt not in ('json', 'compact', 'msgpack'):
+        return jsonify({"status": "error", "message": f"Unsupported format: {fmt}"}), 400
+    if fmt == 'msgpack' and msgpack is None:
+        return jsonify({"status": "error", "message": "msgpack format is not available"}), 406
+    
+    etag = lot_etag(parking_lot) if fmt == 'json' else f"{lot_etag(parking_lot)}-{fmt}"
+    if request.if_none_match.contains(etag):
+        response = not_modified(etag)
+        response.vary.add('Accept')
+        return response
+    
+    with lots_lock:
+        if fmt == 'compact':
+            response = Response(
+                json_codec.dumps({"status": "success", "data": encode_compact(parking_lot)}),
+                mimetype=COMPACT_MIMETYPE
+            )
+        elif fmt == 'msgpack':
+            response = Response(encode_msgpack(parking_lot), mimetype=MSGPACK_MIMETYPE)
+        else:
+            response = jsonify({"status": "success", "data": parking_lot})
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    response.vary.add('Accept')
+    return response
+
+@app.route('/api/parking-lot/<lot_id>/layout', methods=['GET'])
+def get_parking_lot_layout(lot_id):
+    """获取停车场静态布局（不含占用状态）；带?v=<layout_etag>的请求可永久缓存"""
+    load_lot(lot_id)
+    layout_etag, body = get_layout_body(lot_id)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(layout_etag)
+    if request.args.get('v') == layout_etag:
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/api/parking-lot/<lot_id>/occupancy', methods=['GET'])
+def get_parking_lot_occupancy(lot_id):
+    """获取停车场当前版本和已占用车位列表"""
+    parking_lot = load_lot(lot_id)
+    etag = lot_etag(parking_lot)
+    if request.if_none_match.contains(etag):
+        return not_modified(etag)
+    
+    response = jsonify({"status": "success", "data": lot_occupancy(parking_lot)})
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/api/parking-lot/<lot_id>/changes', methods=['GET'])
+def get_parking_lot_changes(lot_id):
+    """获取某版本之后的占用变化（?since=版本号&layout=layout_etag），落后太多时返回完整快照"""
     if lot_id not in parking_lots:
-        # 如果还没有这个停车场，生成一个新的
-        rows = random.randint(6, 10)
-        cols = random.randint(8, 12)
-        
-        # 创建新停车场
-        parking_lot = {
-            "id": lot_id,
-            "name": f"停车场 {lot_id}",
-            "rows": rows,
-            "cols": cols,
-            "entrance": {"row": 0, "col": cols // 2},
-            "exit": {"row": rows - 1, "col": cols // 2},
-            "spots": {}
-        }
-        
-        # 生成车位
-        occupied_count = int(rows * cols * 0.7)  # 70%的车位已占用
-        for row in range(rows):
-            for col in range(cols):
-                # 跳过入口和出口位置
-                if ((row == 0 and col == cols // 2) or 
-                    (row == rows - 1 and col == cols // 2)):
-                    continue
-                
-                spot_id = f"spot_{row}_{col}"
-                is_occupied = occupied_count > 0
-                if is_occupied:
-                    occupied_count -= 1
-                
-                # 随机指定一些特殊车位类型
-                spot_type = "standard"
-                if random.random() < 0.1:
-                    spot_type = random.choice(["disabled", "ev_charging", "compact", "large"])
-                
-                parking_lot["spots"][spot_id] = {
-                    "id": spot_id,
-                    "row": row,
-                    "col": col,
-                    "type": spot_type,
-                    "is_occupied": is_occupied,
-                    "distance_to_entrance": abs(row) + abs(col - cols // 2),
-                    "distance_to_exit": abs(row - (rows - 1)) + abs(col - cols // 2)
-                }
-        
-        # 保存到内存中的停车场数据
-        parking_lots[lot_id] = parking_lot
+        return jsonify({"status": "error", "message": "Parking lot not found"}), 404
     
-    return jsonify({"status": "success", "data": parking_lots[lot_id]})
+    since = request.args.get('since', 0, type=int)
+    layout_etag = request.args.get('layout')
+    return jsonify({"status": "success", "data": changes_since(lot_id, since, layout_etag)})
+
+@app.route('/api/parking-lot/<lot_id>/occupancy-history', methods=['GET'])
+def get_parking_lot_occupancy_history(lot_id):
+    """获取停车场最近的占用时间序列（?window=秒数&step=秒数，未指定步长时自动降采样）"""
+    window = request.args.get('window', 86400, type=int)
+    step = request.args.get('step', None, type=int)
+    if window <= 0 or (step is not None and step <= 0):
+        return jsonify({"status": "error", "message": "window and step must be positive"}), 400
+    
+    history = occupancy_history.query(lot_id, window, step)
+    if history is None:
+        return jsonify({"status": "error", "message": "Parking lot not found"}), 404
+    return jsonify({"status": "success", "data": history})
+
+@app.route('/api/parking-lot/<lot_id>/stream', methods=['GET'])
+def stream_parking_lot(lot_id):
+    """
+    通过Server-Sent Events推送停车场占用变化：先发送快照（断线重连时根据Last-Event-ID补发增量），
+    之后推送合并后的变化批次
+    """
+    parking_lot = load_lot(lot_id)
+    subscription = occupancy_broker.subscribe(lot_id)
+    if subscription is None:
+        response = jsonify({"status": "error", "message": "Too many subscribers, please poll /changes"})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    # 订阅之后再取初始状态，避免漏掉两者之间的变化
+    if last_event_id is not None:
+        initial = changes_since(lot_id, last_event_id)
+    else:
+        initial = dict(lot_occupancy(parking_lot), mode="snapshot")
+    events = occupancy_events(
+        subscription, initial, lambda: dict(lot_occupancy(parking_lot), mode="snapshot")
+    )
+    
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _admit_llm(endpoint):
+    """LLM接口的准入检查，超出客户端请求总量时返回429响应，否则返回准入结果"""
+    admission = llm_admission.admit(
+        client_key(request.remote_addr, request.headers.get('X-Forwarded-For')),
+        endpoint
+    )
+    if admission.refused:
+        response = jsonify({"status": "error", "message": "Too many requests, please retry later"})
+        response.status_code = 429
+        response.headers['Retry-After'] = admission.retry_after_header
+        return None, response
+    return admission, None
 
 @app.route('/api/allocate-spot', methods=['POST'])
+@profiling.profiled('allocate_spot')
 def allocate_spot():
     """为车辆分配最佳停车位"""
     data = request.json
@@ -444,25 +578,38 @@ def allocate_spot():
         return jsonify({"status": "error", "message": "Parking lot not found"}), 404
     
     # 获取可用车位
-    available_spots = [
-        spot for spot_id, spot in parking_lots[lot_id]["spots"].items()
-        if not spot["is_occupied"]
-    ]
+    available_spots = get_available_spots(lot_id)
     
     if not available_spots:
         return jsonify({"status": "error", "message": "No available spots"}), 400
     
-    # 使用AI服务获取推荐
+    # 超长车辆需要多个连续车位，直接按连续车位分配，不走单车位推荐
+    size = cells_for_vehicle(vehicle_info)
+    if size > 1:
+        try:
+            block = allocate_block(lot_id, size)
+        except FleetAllocationError as e:
+            return jsonify({"status": "error", "message": str(e)}), 409
+        block["reasoning"] = f"为您的{vehicle_info.get('name', '车辆')}分配了{size}个相邻车位。"
+        return jsonify({"status": "success", "data": block})
+    
+    admission, refused = _admit_llm('allocate_spot')
+    if refused is not None:
+        return refused
+    
+    # 使用AI服务获取推荐（超出LLM限流时使用回退算法）
     recommendation = get_ai_recommendation(
         available_spots, 
         vehicle_info, 
         user_preferences, 
-        parking_lots[lot_id]
+        parking_lots[lot_id],
+        allow_llm=admission.allow_llm
     )
     
-    # 标记车位为已占用
+    # 标记车位为已占用（等待AI期间可能已被其他请求占用）
     spot_id = recommendation["spot"]["id"]
-    parking_lots[lot_id]["spots"][spot_id]["is_occupied"] = True
+    if not claim_spot(lot_id, spot_id):
+        return jsonify({"status": "error", "message": "Spot was just taken, please retry"}), 409
     
     return jsonify({
         "status": "success",
@@ -470,6 +617,7 @@ def allocate_spot():
     })
 
 @app.route('/api/reroute-spot', methods=['POST'])
+@profiling.profiled('reroute_spot')
 def reroute_spot():
     """重新路由到新的停车位"""
     data = request.json
@@ -482,41 +630,95 @@ def reroute_spot():
         return jsonify({"status": "error", "message": "Parking lot not found"}), 404
     
     # 获取可用车位
-    available_spots = [
-        spot for spot_id, spot in parking_lots[lot_id]["spots"].items()
-        if not spot["is_occupied"]
-    ]
+    available_spots = get_available_spots(lot_id)
     
     if not available_spots:
         return jsonify({"status": "error", "message": "No available spots"}), 400
     
+    admission, refused = _admit_llm('reroute_spot')
+    if refused is not None:
+        return refused
+    
     # 使用AI服务获取新推荐
     new_recommendation = reroute_recommendation(
         available_spots, 
         vehicle_info, 
         current_position, 
         destination,
-        parking_lots[lot_id]
+        parking_lots[lot_id],
+        allow_llm=admission.allow_llm
     )
     
     # 标记新车位为已占用
     spot_id = new_recommendation["spot"]["id"]
-    parking_lots[lot_id]["spots"][spot_id]["is_occupied"] = True
+    if not claim_spot(lot_id, spot_id):
+        return jsonify({"status": "error", "message": "Spot was just taken, please retry"}), 409
     
     return jsonify({
         "status": "success",
         "data": new_recommendation
     })
 
+@app.route('/api/allocate-fleet', methods=['POST'])
+@profiling.profiled('allocate_fleet')
+def allocate_fleet_spots():
+    """为同时到达的一组车辆联合分配车位（总代价最小），全部成功或全部不占用"""
+    data = request.json
+    lot_id = data.get('parking_id')
+    vehicles = data.get('vehicles', [])
+    
+    if lot_id not in parking_lots:
+        return jsonify({"status": "error", "message": "Parking lot not found"}), 404
+    
+    try:
+        result = allocate_fleet(lot_id, vehicles)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except FleetAllocationError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    
+    return jsonify({
+        "status": "success",
+        "data": result
+    })
+
+@app.route('/api/allocate-block', methods=['POST'])
+def allocate_block_spots():
+    """占用同一行或同一列的连续车位（超长车辆或团体），size缺省时按车辆长度计算"""
+    data = request.json
+    lot_id = data.get('parking_id')
+    size = data.get('size') or cells_for_vehicle(data.get('vehicle_info', {}))
+    
+    if lot_id not in parking_lots:
+        return jsonify({"status": "error", "message": "Parking lot not found"}), 404
+    
+    try:
+        block = allocate_block(lot_id, size, data.get('orientation'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except FleetAllocationError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    
+    return jsonify({"status": "success", "data": block})
+
+@app.route('/api/release-block/<block_id>', methods=['POST'])
+def release_block_spots(block_id):
+    """释放连续车位分配中的所有车位"""
+    released = release_block(block_id)
+    if released is None:
+        return jsonify({"status": "error", "message": "Block not found"}), 404
+    return jsonify({"status": "success", "data": {"released": released}})
+
 @app.route('/api/reset-parking-lot/<lot_id>', methods=['POST'])
 def reset_parking_lot(lot_id):
     """重置停车场（所有车位变为可用）"""
     if lot_id in parking_lots:
-        for spot_id in parking_lots[lot_id]["spots"]:
-            parking_lots[lot_id]["spots"][spot_id]["is_occupied"] = False
+        reset_lot(lot_id)
     
     return jsonify({"status": "success", "message": f"Parking lot {lot_id} reset"})
 
+metrics.record_startup('flask', time.perf_counter() - _import_started)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     debug = os.environ.get('FLASK_ENV', 'production') == 'development'
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends, Body
+from fastapi import APIRouter, HTTPException, Depends, Body, Request
 from pydantic import BaseModel
 from typing import List, Optional
-from openai import OpenAI
 import os
 import json
 import logging
 from dotenv import load_dotenv
+from utils.resilience import deepseek_guard
+from utils.ai_service import get_async_client
+from utils.ratelimit import llm_admission, client_key
 
 # 加载环境变量
 load_dotenv()
@@ -34,15 +36,40 @@ class ParkingRecommendationResponse(BaseModel):
     recommendedParkingId: str
     reason: str
 
+def _default_recommendation(request):
+    """不调用LLM时的默认推荐：第一个停车场"""
+    default_parking = request.parkingOptions[0] if request.parkingOptions else None
+    if not default_parking:
+        raise HTTPException(status_code=404, detail="No available parking lots")
+    
+    default_response = {
+        "recommendedParkingId": default_parking.id,
+        "reason": "Closest option with sufficient available spots"
+    }
+    logger.info("Using default recommendation: %s", default_response)
+    return default_response
+
 @router.post("/parking-recommendation", response_model=ParkingRecommendationResponse)
-async def get_parking_recommendation(request: ParkingRecommendationRequest = Body(...)):
+async def get_parking_recommendation(http_request: Request, request: ParkingRecommendationRequest = Body(...)):
     """
     使用Deepseek API分析并推荐最佳停车场
     """
     # 记录请求参数
     logger.info(f"Received parking recommendation request for destination: {request.destination}")
-    request_json = json.dumps(request.dict(), indent=2)
-    logger.info(f"Request JSON: {request_json}")
+    # 仅在DEBUG级别输出完整请求，避免每次请求都额外序列化
+    logger.debug("Request payload: %s", request)
+    
+    # 准入控制：超出客户端请求总量时拒绝，超出LLM预算时直接返回默认推荐
+    admission = llm_admission.admit(
+        client_key(http_request.client.host if http_request.client else None,
+                   http_request.headers.get("x-forwarded-for")),
+        "parking_recommendation"
+    )
+    if admission.refused:
+        raise HTTPException(status_code=429, detail="Too many requests, please retry later",
+                            headers={"Retry-After": admission.retry_after_header})
+    if not admission.allow_llm:
+        return _default_recommendation(request)
     
     try:
         # 获取API密钥
@@ -51,8 +78,8 @@ async def get_parking_recommendation(request: ParkingRecommendationRequest = Bod
             logger.error("Deepseek API key not configured")
             raise HTTPException(status_code=500, detail="Deepseek API key not configured")
         
-        # 初始化客户端
-        client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+        # 共享的DeepSeek异步客户端（首次使用时创建，复用连接池），等待响应时不阻塞事件循环
+        client = get_async_client()
         
         # 为每个停车场创建英文描述
         parking_descriptions = []
@@ -63,6 +90,7 @@ async def get_parking_recommendation(request: ParkingRecommendationRequest = Bod
                          f"Available spots: {p.available_spots}/{p.total_spots}\n" \
                          f"Hourly rate: ${p.hourly_rate}"
             parking_descriptions.append(description)
+        options = "".join(f"{i+1}. {desc}\n\n" for i, desc in enumerate(parking_descriptions))
         
         # 构建完整的英文提示
         prompt = f"""As a smart parking assistant, please recommend the best parking lot based on the following information:
@@ -70,7 +98,7 @@ async def get_parking_recommendation(request: ParkingRecommendationRequest = Bod
 Destination: {request.destination}
 
 Available Parking Options:
-{"".join([f"{i+1}. {desc}\n\n" for i, desc in enumerate(parking_descriptions)])}
+{options}
 
 Please analyze each parking lot considering distance, available spots, and price to select the optimal option.
 Response format:
@@ -83,15 +111,17 @@ Note: Only return the JSON format without any additional text.
 """
         logger.info(f"Prompt sent to Deepseek API:\n{prompt}")
         
-        # 调用Deepseek API
-        response = client.chat.completions.create(
+        # 调用Deepseek API（与ai_service共享熔断器，不健康时直接走默认推荐）
+        response = await deepseek_guard.call_async(
+            client.chat.completions.create,
             model="deepseek-chat",
             messages=[
                 {"role": "system", "content": "You are a professional parking recommendation assistant. Analyze the data provided and make the most logical recommendation. Always respond in English."},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.3,
-            max_tokens=300
+            max_tokens=300,
+            timeout=deepseek_guard.timeout
         )
         
         # 解析API返回的内容
@@ -99,7 +129,7 @@ Note: Only return the JSON format without any additional text.
         logger.info(f"Deepseek API raw response: {content}")
         
         recommendation = json.loads(content)
-        logger.info(f"Parsed recommendation: {json.dumps(recommendation, indent=2)}")
+        logger.debug("Parsed recommendation: %s", recommendation)
         
         # 验证返回的ID是否存在于选项中
         valid_ids = [p.id for p in request.parkingOptions]
@@ -110,19 +140,10 @@ Note: Only return the JSON format without any additional text.
             recommendation["reason"] = "Closest option with sufficient available spots"
         
         # 记录最终响应
-        logger.info(f"Final recommendation response: {json.dumps(recommendation, indent=2)}")
+        logger.info("Final recommendation response: %s", recommendation)
         return recommendation
         
     except Exception as e:
         # 错误处理，返回默认推荐
         logger.error(f"Error processing recommendation: {str(e)}", exc_info=True)
-        default_parking = request.parkingOptions[0] if request.parkingOptions else None
-        if not default_parking:
-            raise HTTPException(status_code=404, detail="No available parking lots")
-        
-        default_response = {
-            "recommendedParkingId": default_parking.id,
-            "reason": "Closest option with sufficient available spots"
-        }
-        logger.info(f"Using default recommendation: {json.dumps(default_response, indent=2)}")
-        return default_response 
\ No newline at end of file
+        return _default_recommendation(request) 
\ No newline at end of file
@@ -4,12 +4,18 @@ from .api import users, auth, vehicles, destinations, routes, parking_lots
 from .api import parking_ai  # 导入新创建的停车场AI推荐模块
 from .database.db import init_db
 import logging
+from utils.fastapi_json import FastJSONResponse
 
 # 设置日志记录
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="SmartPark API", description="智能停车应用API服务", version="1.0.0")
+app = FastAPI(
+    title="SmartPark API",
+    description="智能停车应用API服务",
+    version="1.0.0",
+    default_response_class=FastJSONResponse
+)
 
 # 添加CORS中间件
 app.add_middleware(
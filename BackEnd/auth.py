@@ -1,13 +1,10 @@
-import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
 import logging
-import requests
-from jose import jwk, jwt as jose_jwt
-from jose.utils import base64url_decode
 import json
 from typing import Dict, Any, Optional
+from utils.metrics import dependency_timer
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -21,6 +18,11 @@ COGNITO_REGION = os.environ.get('COGNITO_REGION', 'ap-southeast-2')
 COGNITO_USER_POOL_ID = os.environ.get('COGNITO_USER_POOL_ID', 'ap-southeast-2_BXhdoWuDl')
 COGNITO_CLIENT_ID = os.environ.get('COGNITO_CLIENT_ID', '4r2ui82gb5gigfrfjl18tq1i6i')
 COGNITO_DOMAIN = f"https://ap-southeast-2bxhdowudl.auth.ap-southeast-2.amazoncognito.com"
+# JWKS地址可覆盖（如压测时指向本地桩服务）
+COGNITO_JWKS_URL = os.environ.get(
+    'COGNITO_JWKS_URL',
+    f'https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}/.well-known/jwks.json'
+)
 
 # 缓存JWKS以避免频繁请求
 jwks_cache = None
@@ -33,10 +35,14 @@ def get_jwks():
     # 如果缓存的JWKS不存在或已过期（1小时），则刷新
     current_time = time.time()
     if jwks_cache is None or (current_time - jwks_cache_time) > 3600:
-        jwks_url = f'https://cognito-idp.{COGNITO_REGION}.amazonaws.com/{COGNITO_USER_POOL_ID}/.well-known/jwks.json'
+        jwks_url = COGNITO_JWKS_URL
         logger.info(f"Fetching JWKS from: {jwks_url}")
         
-        response = requests.get(jwks_url)
+        # requests在首次刷新JWKS时才导入
+        import requests
+        with dependency_timer("cognito", "jwks") as call:
+            response = requests.get(jwks_url)
+            call.error = response.status_code >= 500
         jwks_cache = response.json()
         jwks_cache_time = current_time
         
@@ -47,6 +53,8 @@ def decode_token(token: str) -> Dict[str, Any]:
     解码并验证JWT令牌
     """
     try:
+        from jose import jwt as jose_jwt
+
         # 获取令牌的头部（未验证）
         header = jose_jwt.get_unverified_header(token)
         
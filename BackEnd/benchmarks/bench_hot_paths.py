@@ -0,0 +1,225 @@
+"""
+每个请求都会经过的纯Python热点路径的微基准，按停车场规模（车位数）参数化，
+结果与benchmarks/baselines/hot_paths.json中的基线比较
+
+用法（在BackEnd目录下）:
+    python -m benchmarks.bench_hot_paths                       # 运行并与基线比较
+    python -m benchmarks.bench_hot_paths --sizes 100,1000      # 只跑部分规模
+    python -m benchmarks.bench_hot_paths --save                # 覆盖基线（在同一台机器上记录，需要安装全部依赖）
+    python -m benchmarks.bench_hot_paths --threshold 0.25      # 变慢超过25%时返回非零
+"""
+import os
+import sys
+import json
+import math
+import time
+import timeit
+import argparse
+import platform
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parking_data
+from parking_data import generate_parking_lot, get_available_spots, get_auckland_destinations
+from utils import navigation
+from utils.navigation import generate_navigation_instructions, get_layout
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "hot_paths.json")
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+
+VEHICLE = {"id": "sedan", "name": "Sedan", "width": 1.8, "length": 4.5, "height": 1.5}
+
+
+def grid_for_spots(spots):
+    """约2/3的格子是车位（每三行一条横向通道，加一条纵向主通道），据此估算正方形网格边长"""
+    side = max(4, math.ceil(math.sqrt(spots * 1.5)) + 1)
+    return side, side
+
+
+def measure(fn, setup=None, repeat=3, min_time=0.2):
+    """返回单次调用的最佳耗时（微秒）；setup在每次调用前执行且不计时"""
+    if setup is None:
+        number, _ = timeit.Timer(fn).autorange()
+        number = max(1, int(number * min_time / 0.2))
+        best = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+        return best * 1e6
+    timings = []
+    for _ in range(repeat):
+        setup()
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1e6
+
+
+def _ai_service():
+    # 缺少ai_service的依赖时跳过相关基准
+    try:
+        from utils import ai_service
+    except ImportError as e:
+        return None, f"ai_service unavailable: {e}"
+    return ai_service, None
+
+
+def lot_cases(spots):
+    """与停车场规模相关的基准"""
+    rows, cols = grid_for_spots(spots)
+    lot_id = f"bench_{spots}"
+    lot = generate_parking_lot(lot_id, rows=rows, cols=cols)
+    parking_data.parking_lots[lot_id] = lot
+    available = get_available_spots(lot_id)
+    far_spot = max(lot["spots"].values(), key=lambda s: s["distance_to_entrance"])
+    layout = get_layout(lot)
+
+    cases = {
+        # 布局缓存命中：同尺寸停车场共享距离场
+        "generate_parking_lot": lambda: generate_parking_lot(lot_id, rows=rows, cols=cols),
+        "get_available_spots": lambda: get_available_spots(lot_id),
+        "navigation_cached": lambda: generate_navigation_instructions(lot["entrance"], far_spot, lot),
+        "navigation_uncached": lambda: navigation._build_instructions(
+            layout, lot["entrance"]["row"], lot["entrance"]["col"],
+            far_spot["row"], far_spot["col"], far_spot["id"], far_spot["type"]
+        ),
+    }
+    setups = {}
+
+    # 连续车位查询走空闲段索引（索引在首次查询时建立）
+    parking_data.find_block(lot_id, 2)
+    cases["find_block_2"] = lambda: parking_data.find_block(lot_id, 2)
+
+    # 新尺寸的停车场需要计算距离场
+    cases["generate_parking_lot_cold"] = lambda: generate_parking_lot(lot_id, rows=rows, cols=cols)
+    setups["generate_parking_lot_cold"] = navigation._layout_cache.clear
+
+    ai_service, skipped = _ai_service()
+    if ai_service is not None:
+        context = ai_service._RerouteContext([cols * 1.5, 0, rows * 1.5], lot)
+        cases["fallback_allocation"] = lambda: ai_service._fallback_allocation(available, VEHICLE, lot)
+        cases["fallback_reroute"] = lambda: ai_service._fallback_reroute(context, available, VEHICLE)
+
+    results = {"spots": len(lot["spots"]), "grid": f"{rows}x{cols}"}
+    for name, fn in cases.items():
+        results[name] = round(measure(fn, setups.get(name)), 2)
+    if skipped:
+        results["skipped"] = skipped
+
+    del parking_data.parking_lots[lot_id]
+    return results
+
+
+def _jwt_case():
+    """auth.decode_token，使用本地生成的RSA密钥签发令牌并替换JWKS获取"""
+    try:
+        import auth
+        from benchmarks.stubs import CognitoStub
+        stub = CognitoStub(auth.COGNITO_CLIENT_ID)
+    except ImportError as e:
+        return None, f"auth unavailable: {e}"
+
+    token = stub.issue_token("bench-user")
+    auth.get_jwks = lambda: stub.jwks
+    return (lambda: auth.decode_token(token)), None
+
+
+def fixed_cases():
+    """与停车场规模无关的基准"""
+    results = {"get_auckland_destinations": round(measure(get_auckland_destinations), 2)}
+    decode, skipped = _jwt_case()
+    if decode is not None:
+        results["jwt_decode"] = round(measure(decode), 2)
+    else:
+        results["skipped"] = skipped
+    return results
+
+
+def run(sizes=DEFAULT_SIZES):
+    return {
+        "unit": "microseconds per call (best of 3)",
+        "machine": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine()
+        },
+        "fixed": fixed_cases(),
+        "by_spots": {str(size): lot_cases(size) for size in sizes}
+    }
+
+
+def compare(results, baseline, threshold):
+    """逐项比较，返回变慢超过threshold比例的条目"""
+    regressions = []
+
+    def check(label, current, previous):
+        for name, value in current.items():
+            old = previous.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or name == "spots":
+                continue
+            ratio = value / old if old else 1.0
+            marker = "  REGRESSION" if ratio > 1 + threshold else ""
+            print(f"  {label:>8} {name:28s} {old:>14.2f} -> {value:>14.2f} us  x{ratio:.2f}{marker}")
+            if marker:
+                regressions.append(f"{label} {name}")
+
+    check("fixed", results["fixed"], baseline.get("fixed", {}))
+    for size, current in results["by_spots"].items():
+        check(size, current, baseline.get("by_spots", {}).get(size, {}))
+    return regressions
+
+
+def print_results(results):
+    print(f"units: {results['unit']}")
+    for name, value in results["fixed"].items():
+        print(f"  {name:28s} {value}")
+    for size, row in results["by_spots"].items():
+        print(f"{row['spots']} spots ({row['grid']}):")
+        for name, value in row.items():
+            if name not in ("spots", "grid"):
+                print(f"  {name:28s} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path microbenchmarks")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma separated lot sizes in spots")
+    parser.add_argument("--save", action="store_true", help="overwrite the stored baseline")
+    parser.add_argument("--allow-skipped", action="store_true",
+                        help="save the baseline even if some cases were skipped for missing dependencies")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="allowed slowdown ratio before reporting a regression")
+    args = parser.parse_args()
+
+    results = run([int(s) for s in args.sizes.split(",") if s])
+
+    if args.save:
+        # 缺少依赖时基线里会少掉这些条目，之后的比较也就不再覆盖它们
+        skipped = {row["skipped"] for row in [results["fixed"], *results["by_spots"].values()] if "skipped" in row}
+        if skipped and not args.allow_skipped:
+            print("refusing to save a baseline with skipped cases: " + "; ".join(sorted(skipped)))
+            sys.exit(1)
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print_results(results)
+        print(f"baseline written to {BASELINE_FILE}")
+        return
+
+    if not os.path.exists(BASELINE_FILE):
+        print_results(results)
+        return
+
+    with open(BASELINE_FILE, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"baseline recorded on {baseline['machine']['platform']}, python {baseline['machine']['python']}")
+    regressions = compare(results, baseline, args.threshold)
+    for label, row in [("fixed", results["fixed"]), *results["by_spots"].items()]:
+        if "skipped" in row:
+            print(f"  {label:>8} skipped: {row['skipped']}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+JSON序列化吞吐量对比：标准库json vs utils.json_codec（orjson优先）
+
+用法（在BackEnd目录下）:
+    python -m benchmarks.bench_json
+"""
+import os
+import sys
+import json
+import timeit
+import uuid
+import datetime
+from decimal import Decimal
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parking_data import generate_parking_lot
+from utils import json_codec
+
+
+def _stdlib_dumps(obj):
+    # 与Flask默认jsonify相同的行为：ensure_ascii并处理datetime/Decimal
+    return json.dumps(obj, default=json_codec._default).encode("utf-8")
+
+
+def reservation_rows(count):
+    """模拟get_user_reservations返回的行（含datetime和Decimal）"""
+    start = datetime.datetime(2025, 3, 1, 8, 0, 0)
+    return [
+        {
+            "id": str(uuid.UUID(int=i)),
+            "user_id": "test-user-id",
+            "parking_lot_id": f"parking_{i % 40}",
+            "parking_lot_name": f"停车场 parking_{i % 40}",
+            "spot_id": f"spot_{i % 10}_{i % 12}",
+            "spot_type": "standard",
+            "destination_name": "Auckland CBD",
+            "hourly_rate": Decimal("4.50"),
+            "reservation_time": start + datetime.timedelta(hours=i),
+            "expiration_time": start + datetime.timedelta(hours=i + 2),
+            "status": "active",
+            "created_at": start + datetime.timedelta(hours=i, minutes=-5)
+        }
+        for i in range(count)
+    ]
+
+
+def payloads():
+    return {
+        "lot_10x12": {"status": "success", "data": generate_parking_lot("bench", rows=10, cols=12)},
+        "lot_100x100": {"status": "success", "data": generate_parking_lot("bench_big", rows=100, cols=100)},
+        "reservations_500": {"status": "success", "data": reservation_rows(500)},
+    }
+
+
+def run(repeat=5):
+    results = {}
+    for name, payload in payloads().items():
+        number = max(1, 2000 // max(1, len(_stdlib_dumps(payload)) // 1000))
+        row = {}
+        for label, fn in (("stdlib", _stdlib_dumps), (json_codec.BACKEND, json_codec.dumps)):
+            best = min(timeit.repeat(lambda: fn(payload), number=number, repeat=repeat)) / number
+            row[label] = {"ops_per_sec": round(1 / best), "bytes": len(fn(payload))}
+        results[name] = row
+    return results
+
+
+if __name__ == "__main__":
+    for name, row in run().items():
+        parts = ", ".join(f"{label}: {r['ops_per_sec']} ops/s ({r['bytes']} B)" for label, r in row.items())
+        print(f"{name:18s} {parts}")
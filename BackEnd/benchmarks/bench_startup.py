@@ -0,0 +1,157 @@
+"""
+测量API进程的启动导入耗时：在子进程中以-X importtime导入app（Flask）和main（FastAPI），
+汇总总耗时、最慢的模块以及被提前导入的重依赖，结果与benchmarks/baselines/startup.json比较
+
+用法（在BackEnd目录下）:
+    python -m benchmarks.bench_startup                    # 运行并与基线比较
+    python -m benchmarks.bench_startup --modules main     # 只测FastAPI应用
+    python -m benchmarks.bench_startup --save             # 覆盖基线（在同一台机器上记录）
+    python -m benchmarks.bench_startup --threshold 0.25   # 变慢超过25%时返回非零
+"""
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "startup.json")
+DEFAULT_MODULES = ("app", "main")
+
+# 这些依赖应在首次使用时才导入，出现在启动导入中即视为回归
+DEFERRED_MODULES = ("openai", "mysql.connector", "cryptography", "authlib", "requests", "jose", "jwt", "pyarrow")
+
+
+def parse_importtime(stderr):
+    """解析-X importtime输出，返回{模块名: 累计耗时（微秒）}，同一模块取首次导入"""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            value = int(parts[1])
+        except ValueError:
+            # 表头行
+            continue
+        cumulative.setdefault(parts[2].strip(), value)
+    return cumulative
+
+
+def measure_import(module, repeat=3):
+    """在全新的解释器中导入module，取repeat次中总耗时最短的一次"""
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=BACKEND_DIR, capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "unknown error"
+            return {"error": error}
+        times = parse_importtime(proc.stderr)
+        if module not in times:
+            return {"error": f"{module} missing from importtime output"}
+        if best is None or times[module] < best[module]:
+            best = times
+    return best
+
+
+def summarize(module, times, top=15):
+    if "error" in times:
+        return {"skipped": times["error"]}
+    slowest = sorted(
+        ((name, value) for name, value in times.items() if name != module),
+        key=lambda item: item[1], reverse=True
+    )[:top]
+    return {
+        "total_ms": round(times[module] / 1000, 2),
+        "modules": len(times),
+        "deferred_loaded": [name for name in DEFERRED_MODULES if name in times],
+        "slowest_ms": {name: round(value / 1000, 2) for name, value in slowest}
+    }
+
+
+def run(modules=DEFAULT_MODULES):
+    return {
+        "unit": "milliseconds, cumulative import time (best of 3)",
+        "machine": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine()
+        },
+        "modules": {module: summarize(module, measure_import(module)) for module in modules}
+    }
+
+
+def compare(results, baseline, threshold):
+    """返回总耗时变慢超过threshold比例或新出现提前导入的重依赖的条目"""
+    regressions = []
+    for module, current in results["modules"].items():
+        previous = baseline.get("modules", {}).get(module, {})
+        if "total_ms" not in current or "total_ms" not in previous:
+            continue
+        ratio = current["total_ms"] / previous["total_ms"] if previous["total_ms"] else 1.0
+        marker = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"  {module:8s} {previous['total_ms']:>10.2f} -> {current['total_ms']:>10.2f} ms  x{ratio:.2f}{marker}")
+        if marker:
+            regressions.append(f"{module} total_ms")
+        for name in current["deferred_loaded"]:
+            if name not in previous.get("deferred_loaded", []):
+                print(f"  {module:8s} now imports {name} at startup  REGRESSION")
+                regressions.append(f"{module} imports {name}")
+    return regressions
+
+
+def print_results(results):
+    print(f"units: {results['unit']}")
+    for module, row in results["modules"].items():
+        if "skipped" in row:
+            print(f"{module}: skipped ({row['skipped']})")
+            continue
+        print(f"{module}: {row['total_ms']} ms, {row['modules']} modules")
+        if row["deferred_loaded"]:
+            print(f"  loaded at startup: {', '.join(row['deferred_loaded'])}")
+        for name, value in row["slowest_ms"].items():
+            print(f"  {name:40s} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup import-time report")
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES),
+                        help="comma separated application modules to import")
+    parser.add_argument("--save", action="store_true", help="overwrite the stored baseline")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="allowed slowdown ratio before reporting a regression")
+    args = parser.parse_args()
+
+    results = run([m for m in args.modules.split(",") if m])
+
+    if args.save:
+        os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print_results(results)
+        print(f"baseline written to {BASELINE_FILE}")
+        return
+
+    print_results(results)
+    if not os.path.exists(BASELINE_FILE):
+        return
+
+    with open(BASELINE_FILE, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nbaseline recorded on {baseline['machine']['platform']}, python {baseline['machine']['python']}")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+离线压测：在本机启动FastAPI应用，DeepSeek、Cognito和MySQL全部替换为benchmarks.stubs中的桩，
+按脚本场景（到达分配、重新路由、预约创建/查询/取消）并发发起请求，
+报告各接口的吞吐量、p50/p95/p99延迟和错误率
+
+用法（在BackEnd目录下）:
+    python -m benchmarks.loadtest --duration 30 --concurrency 50
+    python -m benchmarks.loadtest --deepseek-latency 0.8 --db-latency 0.005 --json report.json
+    python -m benchmarks.loadtest --baseline report.json   # 与上次结果比较，退化超过阈值时返回非零
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import socket
+import asyncio
+import argparse
+import datetime
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import Latency, DeepSeekStub, CognitoStub, FakeDatabase
+
+# 场景默认权重：大部分流量是到达分配
+DEFAULT_MIX = {"arrival": 6, "reroute": 2, "reservation": 2}
+
+
+def percentile(sorted_values, pct):
+    """最近秩百分位，sorted_values须已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """按接口记录每个请求的延迟与结果"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+        self.recording = False
+
+    def record(self, endpoint, latency, status):
+        if not self.recording:
+            return
+        self.latencies.setdefault(endpoint, []).append(latency)
+        codes = self.statuses.setdefault(endpoint, {})
+        codes[str(status)] = codes.get(str(status), 0) + 1
+        if status == "exception" or status >= 400:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values.sort()
+            endpoints[endpoint] = {
+                "requests": len(values),
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "error_rate": round(self.errors.get(endpoint, 0) / len(values), 4),
+                "statuses": self.statuses[endpoint]
+            }
+        total = sum(e["requests"] for e in endpoints.values())
+        errors = sum(self.errors.values())
+        return {
+            "duration_seconds": round(elapsed, 2),
+            "total_requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+            "error_rate": round(errors / total, 4) if total else 0,
+            "endpoints": endpoints
+        }
+
+
+class VirtualUser:
+    """一个压测用户：持有令牌，按场景权重循环执行脚本"""
+
+    def __init__(self, client, recorder, token, user_id, vehicles, destinations, mix):
+        self.client = client
+        self.recorder = recorder
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.user_id = user_id
+        self.vehicles = vehicles
+        self.destinations = destinations
+        self.scenarios = list(mix)
+        self.weights = [mix[name] for name in self.scenarios]
+        self.lot = None
+
+    async def _request(self, endpoint, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception:
+            self.recorder.record(endpoint, time.perf_counter() - started, "exception")
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def _ensure_lot(self):
+        destination = random.choice(self.destinations)
+        response = await self._request(
+            "GET /api/parking-lots/nearby", "GET", "/api/parking-lots/nearby",
+            params={"lat": destination["location"]["lat"], "lng": destination["location"]["lng"],
+                    "radius": 1500, "name": destination["name"]}
+        )
+        if response is None or response.status_code != 200:
+            return None
+        parkings = response.json()["data"]["parkings"]
+        if not parkings:
+            return None
+        lot_id = random.choice(parkings[:3])["id"]
+
+        response = await self._request(
+            "GET /api/parking-lot/{id}", "GET", f"/api/parking-lot/{lot_id}"
+        )
+        if response is None or response.status_code != 200:
+            return None
+        self.lot = response.json()["data"]
+        return self.lot
+
+    async def arrival(self):
+        """到达：查询附近停车场、获取布局、分配车位，之后车辆离开释放车位"""
+        lot = await self._ensure_lot()
+        if lot is None:
+            return
+        response = await self._request(
+            "POST /api/allocate-spot", "POST", "/api/allocate-spot", headers=self.headers,
+            json={"parking_id": lot["id"], "vehicle_info": random.choice(self.vehicles),
+                  "user_preferences": {"priority": random.choice(["optimal", "distance", "safety"])}}
+        )
+        if response is not None and response.status_code == 200:
+            _depart(lot["id"], response.json()["data"]["spot"]["id"])
+
+    async def reroute(self):
+        """偏离路线：从停车场内随机位置重新分配"""
+        lot = self.lot or await self._ensure_lot()
+        if lot is None:
+            return
+        position = [random.uniform(0, lot["cols"] * 3), 0, random.uniform(0, lot["rows"] * 3)]
+        response = await self._request(
+            "POST /api/reroute-spot", "POST", "/api/reroute-spot", headers=self.headers,
+            json={"parking_id": lot["id"], "vehicle_info": random.choice(self.vehicles),
+                  "current_position": position, "destination": random.choice(self.destinations)}
+        )
+        if response is not None and response.status_code == 200:
+            _depart(lot["id"], response.json()["data"]["spot"]["id"])
+
+    async def reservation(self):
+        """预约：创建、查询自己的预约列表、取消"""
+        lot = self.lot or await self._ensure_lot()
+        if lot is None:
+            return
+        free_spots = [spot for spot in lot["spots"].values() if not spot["is_occupied"]]
+        if not free_spots:
+            return
+        spot = random.choice(free_spots)
+        now = datetime.datetime.now()
+        response = await self._request(
+            "POST /api/reservations/", "POST", "/api/reservations/", headers=self.headers,
+            json={
+                "user_id": self.user_id,
+                "parking_lot_id": lot["id"],
+                "parking_lot_name": lot["name"],
+                "spot_id": spot["id"],
+                "spot_type": spot["type"],
+                "destination_name": random.choice(self.destinations)["name"],
+                "hourly_rate": 4.5,
+                "reservation_time": now.isoformat(),
+                "expiration_time": (now + datetime.timedelta(hours=2)).isoformat()
+            }
+        )
+        if response is None or response.status_code != 200:
+            return
+        reservation_id = response.json()["data"]["id"]
+
+        await self._request("GET /api/reservations/", "GET", "/api/reservations/", headers=self.headers)
+        await self._request(
+            "POST /api/reservations/{id}/cancel", "POST",
+            f"/api/reservations/{reservation_id}/cancel", headers=self.headers
+        )
+
+    async def run(self, deadline):
+        while time.monotonic() < deadline:
+            scenario = random.choices(self.scenarios, self.weights)[0]
+            await getattr(self, scenario)()
+
+
+def _depart(lot_id, spot_id):
+    # 没有离场接口，直接在进程内释放车位，使停车场保持稳定的空位比例
+    from parking_data import set_spots_occupancy
+    set_spots_occupancy(lot_id, [(spot_id, False)])
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(port):
+    """在后台线程启动uvicorn，返回server对象"""
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("server failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+async def run_load(base_url, users, args, mix):
+    import httpx
+    from parking_data import vehicles_catalog, get_auckland_destinations
+    from utils.catalog import thaw
+
+    vehicles = thaw(vehicles_catalog.current().data)
+    destinations = get_auckland_destinations()
+    recorder = Recorder()
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        workers = [
+            VirtualUser(client, recorder, token, user_id, vehicles, destinations, mix)
+            for user_id, token in (users[i % len(users)] for i in range(args.concurrency))
+        ]
+        start = time.monotonic()
+        deadline = start + args.warmup + args.duration
+        tasks = [asyncio.create_task(worker.run(deadline)) for worker in workers]
+
+        # 预热期间的请求不计入统计
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        measured_from = time.monotonic()
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - measured_from
+    return recorder.report(elapsed)
+
+
+def compare(report, baseline, max_regression):
+    """与基线比较：吞吐量下降或p95延迟上升超过max_regression比例视为退化"""
+    regressions = []
+    for endpoint, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if previous is None:
+            continue
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - max_regression):
+            regressions.append(
+                f"{endpoint}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} rps"
+            )
+        if current["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{endpoint}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if current["error_rate"] > previous["error_rate"] + 0.01:
+            regressions.append(
+                f"{endpoint}: error rate {previous['error_rate']:.2%} -> {current['error_rate']:.2%}"
+            )
+    return regressions
+
+
+def print_report(report, stubs):
+    print(f"\n{report['total_requests']} requests in {report['duration_seconds']}s, "
+          f"{report['throughput_rps']} req/s, error rate {report['error_rate']:.2%}")
+    print(f"{'endpoint':<40}{'reqs':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"{endpoint:<40}{stats['requests']:>8}{stats['throughput_rps']:>10}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+              f"{stats['error_rate']:>9.2%}")
+    print("stub calls: " + ", ".join(f"{name}={count}" for name, count in stubs.items()))
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown scenario: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the SmartPark FastAPI app")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds excluded from stats")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--users", type=int, default=10, help="distinct authenticated users")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="scenario weights, e.g. arrival=6,reroute=2,reservation=2")
+    parser.add_argument("--deepseek-latency", type=float, default=0.5)
+    parser.add_argument("--deepseek-jitter", type=float, default=0.2)
+    parser.add_argument("--deepseek-error-rate", type=float, default=0.0)
+    parser.add_argument("--cognito-latency", type=float, default=0.05)
+    parser.add_argument("--db-latency", type=float, default=0.003)
+    parser.add_argument("--db-jitter", type=float, default=0.001)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="keep LLM admission control on (off by default so runs measure the LLM path)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json report")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    deepseek = DeepSeekStub(Latency(args.deepseek_latency, args.deepseek_jitter),
+                            args.deepseek_error_rate).start()
+    client_id = os.environ.get('COGNITO_CLIENT_ID', '4r2ui82gb5gigfrfjl18tq1i6i')
+    cognito = CognitoStub(client_id, Latency(args.cognito_latency)).start()
+
+    # 必须在导入应用之前设置，ai_service和auth在导入时读取这些配置
+    os.environ["DEEPSEEK_BASE_URL"] = deepseek.url
+    os.environ["DEEPSEEK_API_KEY"] = "loadtest"
+    os.environ["COGNITO_JWKS_URL"] = cognito.jwks_url
+    os.environ["COGNITO_CLIENT_ID"] = client_id
+    os.environ["RATE_LIMIT_ENABLED"] = "true" if args.rate_limit else "false"
+    fake_db = FakeDatabase(Latency(args.db_latency, args.db_jitter)).install()
+
+    server, thread = start_app(_free_port())
+    users = [(f"loadtest-user-{i}", cognito.issue_token(f"loadtest-user-{i}")) for i in range(args.users)]
+    base_url = f"http://127.0.0.1:{server.config.port}"
+
+    try:
+        report = asyncio.run(run_load(base_url, users, args, args.mix))
+    finally:
+        server.should_exit = True
+        thread.join()
+        deepseek.stop()
+        cognito.stop()
+
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("json", "baseline")}
+    print_report(report, {"deepseek": deepseek.requests, "cognito": cognito.requests, "mysql": fake_db.queries})
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
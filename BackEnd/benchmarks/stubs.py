@@ -0,0 +1,265 @@
+"""
+压测用的外部依赖桩：DeepSeek与Cognito JWKS为本地HTTP服务，MySQL为内存实现。
+每个桩都可以配置固定延迟加随机抖动，用于模拟不同的依赖响应时间
+"""
+import re
+import json
+import time
+import uuid
+import base64
+import random
+import datetime
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Latency:
+    """固定延迟加均匀抖动，单位为秒"""
+
+    def __init__(self, base=0.0, jitter=0.0):
+        self.base = base
+        self.jitter = jitter
+
+    def sample(self):
+        return max(0.0, self.base + random.uniform(-self.jitter, self.jitter))
+
+    def sleep(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+
+class _StubServer:
+    """在后台线程运行的本地HTTP服务"""
+
+    def __init__(self, handler_class):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self.requests = 0
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# prompt中车位JSON里的第一个车位ID
+_SPOT_ID_PATTERN = re.compile(r'"id": "(spot_\d+_\d+)"')
+
+
+class _DeepSeekHandler(_QuietHandler):
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        stub.requests += 1
+        stub.latency.sleep()
+
+        if random.random() < stub.error_rate:
+            self._send_json(503, {"error": {"message": "stub overloaded", "type": "server_error"}})
+            return
+
+        # 与真实模型一样从prompt列出的候选车位中选择第一个
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        match = _SPOT_ID_PATTERN.search(prompt)
+        content = json.dumps({
+            "selected_spot_id": match.group(1) if match else "",
+            "reasoning": "压测桩推荐的车位"
+        }, ensure_ascii=False)
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "deepseek-chat"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 30,
+                      "total_tokens": len(prompt) // 4 + 30}
+        })
+
+
+class DeepSeekStub(_StubServer):
+    """兼容OpenAI chat completions接口的DeepSeek桩，按比例返回503模拟上游故障"""
+
+    def __init__(self, latency=None, error_rate=0.0):
+        super().__init__(_DeepSeekHandler)
+        self.latency = latency or Latency()
+        self.error_rate = error_rate
+
+
+def _b64url_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+class _CognitoHandler(_QuietHandler):
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.requests += 1
+        stub.latency.sleep()
+        self._send_json(200, stub.jwks)
+
+
+class CognitoStub(_StubServer):
+    """提供JWKS的Cognito桩，并用对应私钥签发压测用户的访问令牌"""
+
+    KEY_ID = "loadtest"
+
+    def __init__(self, client_id, latency=None):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        super().__init__(_CognitoHandler)
+        self.client_id = client_id
+        self.latency = latency or Latency()
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._private_pem = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        numbers = key.public_key().public_numbers()
+        self.jwks = {"keys": [{
+            "kty": "RSA", "kid": self.KEY_ID, "use": "sig", "alg": "RS256",
+            "n": _b64url_uint(numbers.n), "e": _b64url_uint(numbers.e)
+        }]}
+
+    @property
+    def jwks_url(self):
+        return f"{self.url}/.well-known/jwks.json"
+
+    def issue_token(self, user_id, ttl=3600):
+        from jose import jwt as jose_jwt
+
+        now = int(time.time())
+        claims = {
+            "sub": user_id,
+            "aud": self.client_id,
+            "email": f"{user_id}@loadtest.local",
+            "name": user_id,
+            "iat": now,
+            "exp": now + ttl
+        }
+        return jose_jwt.encode(claims, self._private_pem, algorithm="RS256",
+                               headers={"kid": self.KEY_ID})
+
+
+class FakeDatabase:
+    """
+    parking_reservations的内存实现，函数签名和返回值与database模块一致；
+    install()替换database模块中的对应函数
+    """
+
+    FUNCTIONS = (
+        "save_reservation", "get_user_reservations", "cancel_reservation",
+        "iter_active_reservations", "get_db_time", "get_reservation_changes",
+        "expire_reservations"
+    )
+
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self._lock = threading.Lock()
+        self._rows = {}
+        self.queries = 0
+
+    def _query(self):
+        with self._lock:
+            self.queries += 1
+        self.latency.sleep()
+
+    def _now(self):
+        return datetime.datetime.now()
+
+    def install(self):
+        import database
+
+        for name in self.FUNCTIONS:
+            setattr(database, name, getattr(self, name))
+        return self
+
+    def save_reservation(self, reservation_data):
+        self._query()
+        reservation_id = str(uuid.uuid4())
+        now = self._now()
+        row = dict(reservation_data, id=reservation_id, created_at=now, updated_at=now)
+        row.setdefault("status", "active")
+        with self._lock:
+            self._rows[reservation_id] = row
+        return {"status": "success", "message": "Reservation saved successfully",
+                "data": {"id": reservation_id}}
+
+    def get_user_reservations(self, user_id):
+        self._query()
+        with self._lock:
+            rows = [dict(row) for row in self._rows.values() if row["user_id"] == user_id]
+        rows.sort(key=lambda row: row["reservation_time"], reverse=True)
+        return {"status": "success", "data": rows}
+
+    def cancel_reservation(self, reservation_id):
+        self._query()
+        with self._lock:
+            row = self._rows.get(reservation_id)
+            if row is not None:
+                row["status"] = "canceled"
+                row["updated_at"] = self._now()
+        return {"status": "success", "message": "Reservation canceled successfully"}
+
+    def iter_active_reservations(self, batch_size=1000):
+        self._query()
+        with self._lock:
+            rows = [dict(row) for row in self._rows.values() if row["status"] == "active"]
+        yield from rows
+
+    def get_db_time(self):
+        return self._now()
+
+    def get_reservation_changes(self, since, limit=1000, since_id=""):
+        self._query()
+        with self._lock:
+            rows = [dict(row) for row in self._rows.values() if (row["updated_at"], row["id"]) > (since, since_id)]
+        rows.sort(key=lambda row: (row["updated_at"], row["id"]))
+        return {"status": "success", "data": rows[:limit]}
+
+    def expire_reservations(self, reservation_ids):
+        self._query()
+        expired = 0
+        now = self._now()
+        with self._lock:
+            for reservation_id in reservation_ids:
+                row = self._rows.get(reservation_id)
+                if row is not None and row["status"] == "active":
+                    row["status"] = "expired"
+                    row["updated_at"] = now
+                    expired += 1
+        return {"status": "success", "data": {"expired": expired}}
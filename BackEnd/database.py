@@ -1,8 +1,7 @@
 import os
-import mysql.connector
-from mysql.connector import Error
-from cryptography.fernet import Fernet
 import logging
+from utils.metrics import timed_dependency
+from utils import tracing
 
 # 配置日志
 logging.basicConfig(
@@ -11,9 +10,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# mysql.connector和cryptography在首次连接时才导入，缩短进程启动时间。
+# 导入前except子句使用这个占位类型，导入后替换为mysql.connector.Error
+class Error(Exception):
+    pass
+
+def _connector():
+    global Error
+    import mysql.connector
+    Error = mysql.connector.Error
+    return mysql.connector
+
 # 解密数据库密码
 def decrypt_password(encrypted_password, key):
     try:
+        from cryptography.fernet import Fernet
         f = Fernet(key)
         return f.decrypt(encrypted_password.encode()).decode()
     except Exception as e:
@@ -21,6 +32,7 @@ def decrypt_password(encrypted_password, key):
         raise
 
 # 数据库连接函数
+@tracing.traced("mysql.connect")
 def get_db_connection():
     try:
         # 从环境变量获取数据库连接信息
@@ -36,7 +48,7 @@ def get_db_connection():
         password = decrypt_password(encrypted_password, db_key)
         
         # 建立连接
-        connection = mysql.connector.connect(
+        connection = _connector().connect(
             host=host,
             port=port,
             database=database,
@@ -53,6 +65,7 @@ def get_db_connection():
         return None
 
 # 确保数据库表已创建
+@timed_dependency("mysql")
 def ensure_tables_exist():
     try:
         connection = get_db_connection()
@@ -86,9 +99,27 @@ def ensure_tables_exist():
             expiration_time TIMESTAMP NOT NULL,
             status VARCHAR(20) DEFAULT 'active',
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id)
+            updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            INDEX idx_status_expiration (status, expiration_time),
+            INDEX idx_updated_at (updated_at)
         )
         ''')
+
+        # 旧表补充过期扫描和增量同步所需的列与索引
+        cursor.execute("SHOW COLUMNS FROM parking_reservations LIKE 'updated_at'")
+        if cursor.fetchone() is None:
+            cursor.execute('''
+            ALTER TABLE parking_reservations
+            ADD COLUMN updated_at TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+            ADD INDEX idx_updated_at (updated_at)
+            ''')
+        cursor.execute("SHOW INDEX FROM parking_reservations WHERE Key_name = 'idx_status_expiration'")
+        if not cursor.fetchall():
+            cursor.execute('''
+            ALTER TABLE parking_reservations
+            ADD INDEX idx_status_expiration (status, expiration_time)
+            ''')
         
         connection.commit()
         logger.info("Database tables checked/created successfully")
@@ -103,6 +134,7 @@ def ensure_tables_exist():
             connection.close()
 
 # 保存新的预约记录
+@timed_dependency("mysql")
 def save_reservation(reservation_data):
     try:
         connection = get_db_connection()
@@ -139,8 +171,9 @@ def save_reservation(reservation_data):
             reservation_data.get('status', 'active')
         )
         
-        cursor.execute(sql, values)
-        connection.commit()
+        with tracing.span("mysql.query", statement="insert_reservation"):
+            cursor.execute(sql, values)
+            connection.commit()
         
         return {
             "status": "success", 
@@ -159,6 +192,7 @@ def save_reservation(reservation_data):
             connection.close()
 
 # 获取用户的所有预约记录
+@timed_dependency("mysql")
 def get_user_reservations(user_id):
     try:
         connection = get_db_connection()
@@ -174,8 +208,9 @@ def get_user_reservations(user_id):
         ORDER BY reservation_time DESC
         '''
         
-        cursor.execute(sql, (user_id,))
-        reservations = cursor.fetchall()
+        with tracing.span("mysql.query", statement="select_user_reservations"):
+            cursor.execute(sql, (user_id,))
+            reservations = cursor.fetchall()
         
         return {
             "status": "success",
@@ -191,6 +226,7 @@ def get_user_reservations(user_id):
             connection.close()
 
 # 取消预约
+@timed_dependency("mysql")
 def cancel_reservation(reservation_id):
     try:
         connection = get_db_connection()
@@ -206,8 +242,9 @@ def cancel_reservation(reservation_id):
         WHERE id = %s
         '''
         
-        cursor.execute(sql, (reservation_id,))
-        connection.commit()
+        with tracing.span("mysql.query", statement="cancel_reservation"):
+            cursor.execute(sql, (reservation_id,))
+            connection.commit()
         
         return {
             "status": "success",
@@ -222,6 +259,155 @@ def cancel_reservation(reservation_id):
             cursor.close()
             connection.close()
 
+# 流式读取所有有效预约（非缓冲游标分批获取，避免一次性加载到内存）
+def iter_active_reservations(batch_size=1000):
+    connection = get_db_connection()
+    if connection is None:
+        return
+
+    cursor = connection.cursor(dictionary=True, buffered=False)
+    try:
+        cursor.execute('''
+        SELECT id, parking_lot_id, spot_id, expiration_time
+        FROM parking_reservations
+        WHERE status = 'active'
+        ''')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
+    except Error as e:
+        logger.error(f"Error reading active reservations: {e}")
+    finally:
+        cursor.close()
+        connection.close()
+
+# 流式读取某时间点之后（含）变化的预约完整记录（按updated_at递增），用于归档导出；since为None时读取全部
+def iter_reservation_changes(since=None, batch_size=1000):
+    connection = get_db_connection()
+    if connection is None:
+        return
+
+    cursor = connection.cursor(dictionary=True, buffered=False)
+    try:
+        sql = '''
+        SELECT id, parking_lot_id, parking_lot_name, spot_id, spot_type, destination_name,
+               hourly_rate, reservation_time, expiration_time, status, created_at, updated_at
+        FROM parking_reservations
+        '''
+        if since is None:
+            cursor.execute(sql + ' ORDER BY updated_at')
+        else:
+            cursor.execute(sql + ' WHERE updated_at >= %s ORDER BY updated_at', (since,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+
+    except Error as e:
+        logger.error(f"Error reading reservation changes: {e}")
+    finally:
+        cursor.close()
+        connection.close()
+
+# 数据库当前时间，作为增量同步的起点
+@timed_dependency("mysql")
+def get_db_time():
+    try:
+        connection = get_db_connection()
+        if connection is None:
+            return None
+
+        cursor = connection.cursor()
+        cursor.execute("SELECT CURRENT_TIMESTAMP(6)")
+        return cursor.fetchone()[0]
+
+    except Error as e:
+        logger.error(f"Error getting database time: {e}")
+        return None
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+# 获取(updated_at, id)键集位置之后发生变化的预约（按updated_at、id递增），用于增量同步；
+# 同一时间戳上的行再多也能逐页读完（InnoDB二级索引idx_updated_at隐含主键id，排序走索引）
+@timed_dependency("mysql")
+def get_reservation_changes(since, limit=1000, since_id=""):
+    try:
+        connection = get_db_connection()
+        if connection is None:
+            return {"status": "error", "message": "Could not connect to database"}
+
+        cursor = connection.cursor(dictionary=True)
+
+        sql = '''
+        SELECT id, parking_lot_id, spot_id, expiration_time, status, updated_at
+        FROM parking_reservations
+        WHERE updated_at >= %s AND (updated_at > %s OR id > %s)
+        ORDER BY updated_at, id
+        LIMIT %s
+        '''
+
+        with tracing.span("mysql.query", statement="select_reservation_changes"):
+            cursor.execute(sql, (since, since, since_id, limit))
+            rows = cursor.fetchall()
+
+        return {
+            "status": "success",
+            "data": rows
+        }
+
+    except Error as e:
+        logger.error(f"Error getting reservation changes: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
+# 批量将到期预约标记为expired（单条UPDATE，已取消的预约不受影响）
+@timed_dependency("mysql")
+def expire_reservations(reservation_ids):
+    if not reservation_ids:
+        return {"status": "success", "data": {"expired": 0}}
+
+    try:
+        connection = get_db_connection()
+        if connection is None:
+            return {"status": "error", "message": "Could not connect to database"}
+
+        cursor = connection.cursor()
+
+        placeholders = ", ".join(["%s"] * len(reservation_ids))
+        sql = f'''
+        UPDATE parking_reservations
+        SET status = 'expired'
+        WHERE status = 'active' AND id IN ({placeholders})
+        '''
+
+        with tracing.span("mysql.query", statement="expire_reservations", rows=len(reservation_ids)):
+            cursor.execute(sql, tuple(reservation_ids))
+            connection.commit()
+
+        return {
+            "status": "success",
+            "data": {
+                "expired": cursor.rowcount
+            }
+        }
+
+    except Error as e:
+        logger.error(f"Error expiring reservations: {e}")
+        return {"status": "error", "message": str(e)}
+    finally:
+        if connection and connection.is_connected():
+            cursor.close()
+            connection.close()
+
 # 初始化数据库表
 if __name__ == "__main__":
     ensure_tables_exist() 
\ No newline at end of file
@@ -1,10 +1,19 @@
-from fastapi import FastAPI
+import time
+# 记录本模块（含全部依赖）的导入耗时，导出为smartpark_startup_import_seconds
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
 import logging
 import os
 from dotenv import load_dotenv
-from routes import reservation_routes
+from routes import reservation_routes, parking_routes
+from utils.resilience import get_dependency_states
+from utils.expiry import expiry_scheduler
+from utils.reconcile import reservation_reconciler
+from utils.archive import archive_exporter
+from utils.fastapi_json import FastJSONResponse
+from utils import metrics, profiling, tracing
 
 # 加载环境变量
 load_dotenv()
@@ -20,7 +29,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="SmartPark API",
     description="Backend API for SmartPark parking reservation system",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # 配置CORS - 确保每个源只有一个值
@@ -39,13 +49,99 @@ app.add_middleware(
     max_age=3600,  # 预检请求结果缓存1小时
 )
 
+# 记录每个路由的请求延迟（按路由模板而非实际路径，避免标签基数过大），
+# 并为请求创建根span（延续上游traceparent）
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status_code = 500
+    span = tracing.start_request(
+        f"{request.method} {request.url.path}",
+        request.headers.get(tracing.TRACEPARENT_HEADER),
+        {"http.method": request.method}
+    )
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        if span.trace_id:
+            response.headers["X-Trace-Id"] = span.trace_id
+        return response
+    except Exception as e:
+        span.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        route = request.scope.get("route")
+        route_path = route.path if route else "unmatched"
+        metrics.observe_request("fastapi", request.method, route_path,
+                                status_code, time.perf_counter() - started)
+        span.set_attribute("http.route", route_path)
+        span.set_attribute("http.status_code", status_code)
+        span.end()
+
+# 按需性能剖析：仅在配置了PROFILE_TOKEN或采样率时注册
+if profiling.ENABLED:
+    @app.middleware("http")
+    async def mark_profile_request(request: Request, call_next):
+        profiling.mark_request(request.headers.get(profiling.PROFILE_HEADER))
+        return await call_next(request)
+
 # 添加路由
 app.include_router(reservation_routes.router)
+app.include_router(parking_routes.router)
+
+# 启动时将有效预约应用到车位占用，之后增量同步并处理到期
+@app.on_event("startup")
+async def start_reservation_sync():
+    if os.environ.get('RESERVATION_SYNC_ENABLED', 'true').lower() != 'true':
+        return
+    reservation_reconciler.start()
+    expiry_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_reservation_sync():
+    expiry_scheduler.stop()
+    reservation_reconciler.stop()
+
+# 配置ARCHIVE_DIR时定期把预约和占用历史追加到分析归档
+@app.on_event("startup")
+async def start_archive_export():
+    archive_exporter.start()
+
+@app.on_event("shutdown")
+async def stop_archive_export():
+    archive_exporter.stop()
 
 # 健康检查路径
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "dependencies": get_dependency_states(),
+        "reservations": reservation_reconciler.snapshot()
+    }
+
+# Prometheus指标
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(content=metrics.expose(), media_type=metrics.CONTENT_TYPE)
+
+# 剖析结果管理接口（需要X-Profile-Token）
+@app.get("/api/admin/profiles")
+async def list_profiles(request: Request):
+    if not profiling.authorized(request.headers.get(profiling.PROFILE_HEADER)):
+        return FastJSONResponse({"status": "error", "message": "Not found"}, status_code=404)
+    return {"status": "success", "data": profiling.list_profiles()}
+
+@app.get("/api/admin/profiles/{profile_id}")
+async def get_profile(profile_id: int, request: Request, format: str = "json"):
+    if not profiling.authorized(request.headers.get(profiling.PROFILE_HEADER)):
+        return FastJSONResponse({"status": "error", "message": "Not found"}, status_code=404)
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        return FastJSONResponse({"status": "error", "message": "Profile not found"}, status_code=404)
+    if format == "text":
+        return Response(content=profile["stats"], media_type="text/plain")
+    return {"status": "success", "data": profile}
 
 # 首页路径
 @app.get("/")
@@ -58,8 +154,11 @@ async def root():
         }
     }
 
+metrics.record_startup('fastapi', time.perf_counter() - _import_started)
+
 # 启动服务器
 if __name__ == "__main__":
+    import uvicorn
     port = int(os.environ.get("PORT", 5001))
     logger.info(f"Starting server on port {port} with CORS configured for: {origins}")
     uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True) 
\ No newline at end of file
@@ -1,82 +1,559 @@
+import os
+import json
+import uuid
+import random
+import hashlib
+import threading
+from collections import deque
+from utils.navigation import build_layout, prewarm_routes
+from utils.geo_index import LotIndex, haversine_m, paginate
+from utils.blocks import FreeRunIndex
+from utils.timeseries import OccupancyHistory
+from utils.catalog import StaticCatalog, thaw
+from utils import json_codec, metrics
+
+# 附近停车场查询的最大半径（米），更大的值按此截断，避免一次查询扫描过大的范围
+NEARBY_MAX_RADIUS_M = float(os.environ.get('NEARBY_MAX_RADIUS_M', 50000))
+
 # 内存中的停车场数据存储
 parking_lots = {}
 
+# 所有占用状态修改都在此锁内完成，保证读-改-写以及版本号递增的原子性
+lots_lock = threading.RLock()
+
+# 进程启动标识：重启后停车场会重新生成，ETag中带上它避免客户端误用旧缓存
+BOOT_ID = uuid.uuid4().hex[:8]
+
+# 每个停车场保留的最近占用变化批次数，落后更多的客户端需要重新获取完整快照
+OCCUPANCY_HISTORY_SIZE = int(os.environ.get('OCCUPANCY_HISTORY_SIZE', 256))
+
+# 占用变化环形缓冲: lot_id -> deque[(version, ((spot_id, is_occupied), ...))]
+_lot_history = {}
+
+# 占用变化监听器: fn(lot_id, version, changes)，在锁内按版本顺序调用，须尽快返回
+occupancy_listeners = []
+
+# 有效预约占用的车位: lot_id -> {spot_id: reservation_id}，停车场生成时据此标记占用
+_reserved_spots = {}
+# reservation_id -> (lot_id, spot_id)
+_reservation_spots = {}
+
+# 连续空闲车位索引: lot_id -> (停车场对象, FreeRunIndex, {(row, col): spot_id})，首次查询时建立，之后随占用变化增量维护
+_free_runs = {}
+# 连续车位分配: block_id -> (lot_id, [spot_id, ...])，以及lot_id -> {spot_id: block_id}
+_blocks = {}
+_block_spots = {}
+
+# 每个停车场的占用时间序列（固定长度环形数组，占用变化时更新）
+occupancy_history = OccupancyHistory()
+
+# 每个停车场预序列化的静态布局: lot_id -> (layout_etag, body)
+_layout_bodies = {}
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+PARKING_LOTS_FILE = os.environ.get('PARKING_LOTS_FILE', os.path.join(DATA_DIR, "parking_lots.json"))
+
+# 车辆类型和热门目的地的静态目录，文件修改后自动重新加载
+vehicles_catalog = StaticCatalog(
+    os.environ.get('VEHICLES_FILE', os.path.join(DATA_DIR, "vehicles.json")), "vehicles"
+)
+destinations_catalog = StaticCatalog(
+    os.environ.get('DESTINATIONS_FILE', os.path.join(DATA_DIR, "destinations.json")), "destinations"
+)
+
+# 停车场目录的空间索引，首次使用时从数据文件加载
+_lot_index = None
+_lot_index_lock = threading.Lock()
+
+
+def get_lot_index():
+    """获取停车场目录的空间索引"""
+    global _lot_index
+    if _lot_index is None:
+        with _lot_index_lock:
+            if _lot_index is None:
+                index = LotIndex()
+                if os.path.exists(PARKING_LOTS_FILE):
+                    index.load_file(PARKING_LOTS_FILE)
+                _lot_index = index
+    return _lot_index
+
+
+# 布局规则版本，规则变化时生成新的layout_id，避免复用旧的距离场缓存
+AISLE_LAYOUT_VERSION = 1
+
+
+def is_aisle_cell(row, col, rows, cols):
+    """
+    判断格子是否为行车通道：入口所在列为纵向主通道，
+    每三行设一条横向通道，保证每排车位都紧邻通道
+    """
+    if col == cols // 2:
+        return True
+    if row % 3 == 1:
+        return True
+    # 最后一行若与上一条通道不相邻，则作为通道
+    return row == rows - 1 and row % 3 == 0
+
+
+def generate_parking_lot(lot_id, rows=None, cols=None):
+    """生成一个新停车场的布局和车位"""
+    rows = rows or random.randint(6, 10)
+    cols = cols or random.randint(8, 12)
+    entrance = {"row": 0, "col": cols // 2}
+    exit_ = {"row": rows - 1, "col": cols // 2}
+
+    spot_cells = [
+        (row, col)
+        for row in range(rows)
+        for col in range(cols)
+        if not is_aisle_cell(row, col, rows, cols)
+    ]
+
+    # 同样尺寸的停车场布局相同，共享距离场
+    layout_id = f"grid-v{AISLE_LAYOUT_VERSION}-{rows}x{cols}"
+    layout = build_layout(layout_id, rows, cols, entrance, exit_, spot_cells)
+
+    parking_lot = {
+        "id": lot_id,
+        "name": f"停车场 {lot_id}",
+        "rows": rows,
+        "cols": cols,
+        "layout_id": layout_id,
+        "entrance": entrance,
+        "exit": exit_,
+        # 每次占用状态变化时递增
+        "version": 0,
+        "spots": {}
+    }
+
+    # 生成车位
+    occupied_count = int(len(spot_cells) * 0.7)  # 70%的车位已占用
+    for row, col in spot_cells:
+        spot_id = f"spot_{row}_{col}"
+        is_occupied = occupied_count > 0
+        if is_occupied:
+            occupied_count -= 1
+
+        # 随机指定一些特殊车位类型
+        spot_type = "standard"
+        if random.random() < 0.1:
+            spot_type = random.choice(["disabled", "ev_charging", "compact", "large"])
+
+        parking_lot["spots"][spot_id] = {
+            "id": spot_id,
+            "row": row,
+            "col": col,
+            "type": spot_type,
+            "is_occupied": is_occupied,
+            # 沿通道的实际行驶距离，来自预计算的距离场
+            "distance_to_entrance": layout.distance_from_entrance(row, col),
+            "distance_to_exit": layout.distance_from_exit(row, col)
+        }
+
+    parking_lot["layout_etag"] = _layout_etag(parking_lot)
+    return parking_lot
+
+
+def lot_layout(parking_lot):
+    """停车场中不会变化的部分：尺寸、出入口和车位（不含占用状态）"""
+    return {
+        "id": parking_lot["id"],
+        "name": parking_lot["name"],
+        "rows": parking_lot["rows"],
+        "cols": parking_lot["cols"],
+        "layout_id": parking_lot["layout_id"],
+        "entrance": parking_lot["entrance"],
+        "exit": parking_lot["exit"],
+        "spots": {
+            spot_id: {k: v for k, v in spot.items() if k != "is_occupied"}
+            for spot_id, spot in parking_lot["spots"].items()
+        }
+    }
+
+
+def _layout_etag(parking_lot):
+    body = json.dumps(lot_layout(parking_lot), sort_keys=True).encode("utf-8")
+    return f"{BOOT_ID}-{hashlib.sha256(body).hexdigest()[:16]}"
+
+
+def lot_etag(parking_lot):
+    """完整停车场数据的ETag：布局不变时只随版本号变化"""
+    return f"{parking_lot['layout_etag']}-v{parking_lot['version']}"
+
+
+def get_layout_body(lot_id):
+    """返回(layout_etag, 预序列化的布局响应体)，布局不变所以只序列化一次"""
+    cached = _layout_bodies.get(lot_id)
+    parking_lot = parking_lots[lot_id]
+    if cached is None or cached[0] != parking_lot["layout_etag"]:
+        body = json_codec.dumps({"status": "success", "data": lot_layout(parking_lot)})
+        cached = (parking_lot["layout_etag"], body)
+        _layout_bodies[lot_id] = cached
+    return cached
+
+
+def lot_occupancy(parking_lot):
+    """停车场中易变的部分：版本号和已占用车位列表"""
+    with lots_lock:
+        return {
+            "id": parking_lot["id"],
+            "version": parking_lot["version"],
+            "layout_etag": parking_lot["layout_etag"],
+            "occupied": [
+                spot_id for spot_id, spot in parking_lot["spots"].items() if spot["is_occupied"]
+            ]
+        }
+
+
+def get_or_create_lot(lot_id):
+    """获取停车场，不存在时生成一个新的；返回(停车场, 是否新建)"""
+    parking_lot = parking_lots.get(lot_id)
+    if parking_lot is not None:
+        return parking_lot, False
+    with lots_lock:
+        parking_lot = parking_lots.get(lot_id)
+        if parking_lot is not None:
+            return parking_lot, False
+        parking_lot = generate_parking_lot(lot_id)
+        # 已有有效预约的车位直接标记为占用
+        for spot_id in _reserved_spots.get(lot_id, ()):
+            spot = parking_lot["spots"].get(spot_id)
+            if spot is not None:
+                spot["is_occupied"] = True
+        parking_lots[lot_id] = parking_lot
+        occupancy_history.observe(
+            lot_id,
+            sum(1 for spot in parking_lot["spots"].values() if spot["is_occupied"]),
+            len(parking_lot["spots"])
+        )
+        return parking_lot, True
+
+
+def load_lot(lot_id):
+    """获取停车场，不存在时生成新的并预先计算导航指示"""
+    parking_lot, created = get_or_create_lot(lot_id)
+    if created:
+        # 预先计算入口到各车位的导航指示，分配时直接命中缓存
+        prewarm_routes(parking_lot)
+    return parking_lot
+
+
+def get_available_spots(lot_id):
+    """停车场当前所有空闲车位"""
+    return [
+        spot for spot in parking_lots[lot_id]["spots"].values()
+        if not spot["is_occupied"]
+    ]
+
+
+def find_nearby_lots(lat, lng, radius, k=None, features=None, page=1, page_size=20,
+                     destination_name='未知位置'):
+    """空间索引查询附近停车场，支持半径、k近邻、设施筛选和分页；半径截断到NEARBY_MAX_RADIUS_M"""
+    radius = min(radius, NEARBY_MAX_RADIUS_M) if radius > 0 else 0.0
+    lot_index = get_lot_index()
+    if k:
+        matches = lot_index.nearest(lat, lng, k, features=features, max_radius_m=radius)
+    else:
+        matches = lot_index.within_radius(lat, lng, radius, features=features)
+
+    if not matches and not features:
+        # 目录中附近没有停车场时，返回一个按位置确定生成的停车场；只用于本次响应，不加入目录索引
+        lot = _create_nearby_lot(lat, lng, destination_name)
+        location = lot["location"]
+        matches = [(haversine_m(lat, lng, location["lat"], location["lng"]), lot)]
+
+    return {
+        "parkings": [
+            _nearby_lot_response(lot, distance)
+            for distance, lot in paginate(matches, page, page_size)
+        ],
+        "total": len(matches),
+        "page": page,
+        "page_size": page_size
+    }
+
+
+def _create_nearby_lot(lat, lng, destination_name):
+    """为没有已知停车场的位置生成一个停车场目录条目"""
+    # 生成一个稳定的停车场ID (基于位置)
+    lot_id = f"parking_{int((lat+36)*1000)}_{int((lng-174)*1000)}"
+    # 以ID为种子，同一位置重复查询得到相同的停车场
+    rng = random.Random(lot_id)
+
+    return {
+        "id": lot_id,
+        "name": f"{destination_name}停车场",
+        "location": {
+            "lat": lat + rng.uniform(-0.001, 0.001),
+            "lng": lng + rng.uniform(-0.001, 0.001)
+        },
+        "total_spots": rng.randint(50, 300),
+        "available_spots": rng.randint(10, 50),
+        "hourly_rate": round(rng.uniform(2, 8), 1),
+        "features": rng.sample(["covered", "security", "disabled_access",
+                                "ev_charging", "valet", "24h"],
+                               k=rng.randint(2, 4))
+    }
+
+
+def _nearby_lot_response(lot, distance):
+    """目录条目加上到目的地的距离；已加载到内存的停车场使用实时空位数"""
+    result = dict(lot)
+    result["distance_to_destination"] = int(distance)
+    live_lot = parking_lots.get(lot["id"])
+    if live_lot is not None:
+        result["available_spots"] = sum(
+            1 for spot in live_lot["spots"].values() if not spot["is_occupied"]
+        )
+    return result
+
+
+def set_spots_occupancy(lot_id, changes):
+    """
+    批量修改车位占用状态，changes为(spot_id, is_occupied)序列。
+    有实际变化时版本号加一，返回实际发生变化的条目
+    """
+    with lots_lock:
+        parking_lot = parking_lots[lot_id]
+        spots = parking_lot["spots"]
+        applied = []
+        for spot_id, is_occupied in changes:
+            spot = spots[spot_id]
+            if spot["is_occupied"] != is_occupied:
+                spot["is_occupied"] = is_occupied
+                applied.append((spot_id, is_occupied))
+        if applied:
+            indexed = _free_runs.get(lot_id)
+            if indexed is not None and indexed[0] is parking_lot:
+                for spot_id, is_occupied in applied:
+                    spot = spots[spot_id]
+                    indexed[1].set_free((spot["row"], spot["col"]), not is_occupied)
+            block_spots = _block_spots.get(lot_id)
+            if block_spots:
+                # 连续车位中单独被释放的车位不再属于该分配，之后释放分配时不会误释放
+                for spot_id, is_occupied in applied:
+                    if not is_occupied:
+                        block_spots.pop(spot_id, None)
+            parking_lot["version"] += 1
+            version = parking_lot["version"]
+            history = _lot_history.get(lot_id)
+            if history is None:
+                history = _lot_history[lot_id] = deque(maxlen=OCCUPANCY_HISTORY_SIZE)
+            history.append((version, tuple(applied)))
+            for listener in occupancy_listeners:
+                listener(lot_id, version, applied)
+        return applied
+
+
+def add_occupancy_listener(listener):
+    """注册占用变化监听器（Flask和FastAPI在同一进程中注册同一监听器时只保留一个）"""
+    with lots_lock:
+        if listener not in occupancy_listeners:
+            occupancy_listeners.append(listener)
+    return listener
+
+
+def changes_since(lot_id, since, layout_etag=None):
+    """
+    返回某版本之后的占用变化：{"mode": "delta", "version", "changes": [[spot_id, 0/1, version], ...]}，
+    同一车位只保留最新状态。客户端落后太多或布局已变化时返回完整快照（mode为snapshot）
+    """
+    with lots_lock:
+        parking_lot = parking_lots[lot_id]
+        version = parking_lot["version"]
+        history = _lot_history.get(lot_id, ())
+        oldest = history[0][0] if history else version + 1
+
+        stale_layout = layout_etag is not None and layout_etag != parking_lot["layout_etag"]
+        if stale_layout or since > version or since < oldest - 1:
+            return dict(lot_occupancy(parking_lot), mode="snapshot")
+
+        latest = {}
+        for batch_version, batch in reversed(history):
+            if batch_version <= since:
+                break
+            for spot_id, is_occupied in batch:
+                if spot_id not in latest:
+                    latest[spot_id] = (int(is_occupied), batch_version)
+
+    changes = sorted(
+        ([spot_id, is_occupied, batch_version] for spot_id, (is_occupied, batch_version) in latest.items()),
+        key=lambda change: change[2]
+    )
+    return {"mode": "delta", "version": version, "changes": changes}
+
+
+def claim_spot(lot_id, spot_id):
+    """原子地占用一个车位；车位已被其他请求占用时返回False"""
+    with lots_lock:
+        if parking_lots[lot_id]["spots"][spot_id]["is_occupied"]:
+            return False
+        set_spots_occupancy(lot_id, [(spot_id, True)])
+        return True
+
+
+def claim_spots(lot_id, spot_ids):
+    """原子地占用一组车位（一次加锁、一次版本变化）；任一车位已被占用时全部不占用并返回False"""
+    with lots_lock:
+        spots = parking_lots[lot_id]["spots"]
+        if any(spots[spot_id]["is_occupied"] for spot_id in spot_ids):
+            return False
+        set_spots_occupancy(lot_id, [(spot_id, True) for spot_id in spot_ids])
+        return True
+
+
+def _free_run_index(lot_id):
+    # 调用方需持有锁；停车场对象被替换时重新建立
+    parking_lot = parking_lots[lot_id]
+    indexed = _free_runs.get(lot_id)
+    if indexed is None or indexed[0] is not parking_lot:
+        spots = parking_lot["spots"].values()
+        indexed = (parking_lot, FreeRunIndex(
+            {(spot["row"], spot["col"]): not spot["is_occupied"] for spot in spots},
+            {(spot["row"], spot["col"]): spot["distance_to_entrance"] for spot in spots}
+        ), {(spot["row"], spot["col"]): spot["id"] for spot in spots})
+        _free_runs[lot_id] = indexed
+    return indexed
+
+
+def find_block(lot_id, size, orientation=None):
+    """查找同一行（orientation="row"）或同一列（"col"）中size个连续空闲车位，没有时返回None"""
+    with lots_lock:
+        _, index, cell_ids = _free_run_index(lot_id)
+        cells = index.find(size, orientation)
+        if cells is None:
+            return None
+        spots = parking_lots[lot_id]["spots"]
+        return [spots[cell_ids[cell]] for cell in cells]
+
+
+def claim_block(lot_id, size, orientation=None):
+    """
+    原子地查找并占用size个连续车位，返回(block_id, 车位列表)，没有足够的连续车位时返回None
+    """
+    with lots_lock:
+        block = find_block(lot_id, size, orientation)
+        if block is None:
+            return None
+        block_id = uuid.uuid4().hex
+        spot_ids = [spot["id"] for spot in block]
+        set_spots_occupancy(lot_id, [(spot_id, True) for spot_id in spot_ids])
+        _blocks[block_id] = (lot_id, spot_ids)
+        block_spots = _block_spots.setdefault(lot_id, {})
+        for spot_id in spot_ids:
+            block_spots[spot_id] = block_id
+        return block_id, block
+
+
+def release_block(block_id):
+    """释放连续车位分配中仍属于它的所有车位，返回释放的车位ID；未知的block_id返回None"""
+    with lots_lock:
+        entry = _blocks.pop(block_id, None)
+        if entry is None:
+            return None
+        lot_id, spot_ids = entry
+        block_spots = _block_spots.get(lot_id, {})
+        owned = [spot_id for spot_id in spot_ids if block_spots.get(spot_id) == block_id]
+        for spot_id in owned:
+            del block_spots[spot_id]
+        if lot_id in parking_lots:
+            set_spots_occupancy(lot_id, [(spot_id, False) for spot_id in owned])
+        return owned
+
+
+def reserve_spots(reservations):
+    """
+    批量记录有效预约并占用对应车位，reservations为(reservation_id, lot_id, spot_id)序列。
+    重复记录同一预约不会产生变化；尚未加载的停车场在生成时再应用
+    """
+    by_lot = {}
+    with lots_lock:
+        for reservation_id, lot_id, spot_id in reservations:
+            if _reservation_spots.get(reservation_id) == (lot_id, spot_id):
+                continue
+            _reservation_spots[reservation_id] = (lot_id, spot_id)
+            _reserved_spots.setdefault(lot_id, {})[spot_id] = reservation_id
+            parking_lot = parking_lots.get(lot_id)
+            if parking_lot is not None and spot_id in parking_lot["spots"]:
+                by_lot.setdefault(lot_id, []).append((spot_id, True))
+        for lot_id, changes in by_lot.items():
+            set_spots_occupancy(lot_id, changes)
+
+
+def release_reservations(reservation_ids):
+    """批量释放已取消或过期预约占用的车位，未记录的预约ID会被忽略"""
+    by_lot = {}
+    with lots_lock:
+        for reservation_id in reservation_ids:
+            entry = _reservation_spots.pop(reservation_id, None)
+            if entry is None:
+                continue
+            lot_id, spot_id = entry
+            reserved = _reserved_spots.get(lot_id, {})
+            # 车位已被新的预约占用时保持占用
+            if reserved.get(spot_id) != reservation_id:
+                continue
+            del reserved[spot_id]
+            parking_lot = parking_lots.get(lot_id)
+            if parking_lot is not None and spot_id in parking_lot["spots"]:
+                by_lot.setdefault(lot_id, []).append((spot_id, False))
+        for lot_id, changes in by_lot.items():
+            set_spots_occupancy(lot_id, changes)
+
+
+def reserved_count():
+    return len(_reservation_spots)
+
+
+def reset_lot(lot_id):
+    """释放停车场所有车位"""
+    with lots_lock:
+        spots = parking_lots[lot_id]["spots"]
+        return set_spots_occupancy(lot_id, [(spot_id, False) for spot_id in spots])
+
 def get_auckland_destinations():
     """
     获取奥克兰地区的目的地数据，包含更多Google Maps风格的字段
     """
-    destinations = [
-        {
-            "id": 1,
-            "name": "Auckland CBD",
-            "address": "123 Queen Street, Auckland",
-            "category": "Business",
-            "availableSpots": 45,
-            "location": {"lat": -36.848, "lng": 174.763},
-            "placeId": "place_auckland_cbd",
-            "rating": 4.5,
-            "priceLevel": 3,
-            "openNow": True,
-            "photos": ["https://example.com/auckland_cbd.jpg"],
-            "types": ["point_of_interest", "establishment"]
-        },
-        {
-            "id": 2,
-            "name": "Auckland Hospital",
-            "address": "2 Park Road, Grafton",
-            "category": "Healthcare",
-            "availableSpots": 20,
-            "location": {"lat": -36.860, "lng": 174.770},
-            "placeId": "place_auckland_hospital",
-            "rating": 4.2,
-            "priceLevel": 2,
-            "openNow": True,
-            "photos": ["https://example.com/auckland_hospital.jpg"],
-            "types": ["hospital", "health"]
-        },
-        {
-            "id": 3,
-            "name": "University of Auckland",
-            "address": "22 Princes Street, Auckland",
-            "category": "Education",
-            "availableSpots": 30,
-            "location": {"lat": -36.852, "lng": 174.768},
-            "placeId": "place_university_auckland",
-            "rating": 4.3,
-            "priceLevel": 2,
-            "openNow": True,
-            "photos": ["https://example.com/university_auckland.jpg"],
-            "types": ["university", "education"]
-        },
-        {
-            "id": 4,
-            "name": "Viaduct Harbour",
-            "address": "85 Customs Street West, Auckland",
-            "category": "Entertainment",
-            "availableSpots": 15,
-            "location": {"lat": -36.842, "lng": 174.758},
-            "placeId": "place_viaduct_harbour",
-            "rating": 4.7,
-            "priceLevel": 4,
-            "openNow": True,
-            "photos": ["https://example.com/viaduct_harbour.jpg"],
-            "types": ["tourist_attraction", "point_of_interest"]
-        },
-        {
-            "id": 5,
-            "name": "Britomart Transport Centre",
-            "address": "12 Queen Street, Auckland",
-            "category": "Transportation",
-            "availableSpots": 50,
-            "location": {"lat": -36.844, "lng": 174.767},
-            "placeId": "place_britomart",
-            "rating": 4.1,
-            "priceLevel": 2,
-            "openNow": True,
-            "photos": ["https://example.com/britomart.jpg"],
-            "types": ["transit_station", "point_of_interest"]
-        },
-        # 可以添加更多目的地...
-    ]
-    
-    return destinations 
\ No newline at end of file
+    return thaw(destinations_catalog.current().data)
+
+
+def _lot_free_spots():
+    with lots_lock:
+        return [
+            ((lot_id,), sum(1 for spot in lot["spots"].values() if not spot["is_occupied"]))
+            for lot_id, lot in parking_lots.items()
+        ]
+
+
+def _record_occupancy(lot_id, version, changes):
+    # 在锁内调用：已有序列时按变化量累加，否则统计一次当前占用数
+    if occupancy_history.tracks(lot_id):
+        occupancy_history.apply_delta(lot_id, sum(1 if occupied else -1 for _, occupied in changes))
+    else:
+        spots = parking_lots[lot_id]["spots"]
+        occupancy_history.observe(
+            lot_id, sum(1 for spot in spots.values() if spot["is_occupied"]), len(spots)
+        )
+
+
+add_occupancy_listener(_record_occupancy)
+
+
+metrics.callback("smartpark_lots_in_memory", "Parking lots currently held in memory", (),
+                 lambda: [((), len(parking_lots))])
+metrics.callback("smartpark_lot_free_spots", "Free spots per in-memory parking lot", ("lot",),
+                 _lot_free_spots)
+metrics.callback("smartpark_active_reservations", "Active reservations holding spots", (),
+                 lambda: [((), len(_reservation_spots))])
+metrics.callback("smartpark_occupancy_history_bytes", "Memory held by per-lot occupancy time series", (),
+                 lambda: [((), occupancy_history.memory_bytes())])
+metrics.callback("smartpark_occupancy_history_max_bytes",
+                 "Upper bound of occupancy time series memory (OCCUPANCY_SERIES_MAX_LOTS lots)", (),
+                 lambda: [((), occupancy_history.max_bytes())])
+metrics.callback("smartpark_occupancy_history_lots", "Parking lots with an occupancy time series", (),
+                 lambda: [((), len(occupancy_history.lot_ids()))])
+metrics.callback("smartpark_occupancy_history_evictions_total",
+                 "Occupancy time series dropped to stay within OCCUPANCY_SERIES_MAX_LOTS", (),
+                 lambda: [((), occupancy_history.evicted)], kind="counter")
@@ -0,0 +1,310 @@
+from fastapi import APIRouter, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+import logging
+from parking_data import (
+    parking_lots, lots_lock, load_lot, get_available_spots, find_nearby_lots,
+    lot_etag, lot_occupancy, changes_since, add_occupancy_listener, claim_spot, release_block, occupancy_history
+)
+from utils.pubsub import occupancy_broker, occupancy_events_async
+from utils import json_codec, profiling
+from utils.ai_service import get_ai_recommendation_async, reroute_recommendation_async
+from utils.ratelimit import llm_admission, client_key
+from utils.fleet import allocate_fleet, allocate_block, FleetAllocationError
+from utils.blocks import cells_for_vehicle
+from utils.fastapi_json import FastJSONResponse
+from utils.lot_codec import encode_compact, encode_msgpack, msgpack, COMPACT_MIMETYPE, MSGPACK_MIMETYPE
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 停车分配相关接口的异步版本：等待LLM时不占用工作线程，
+# 停车场状态与Flask应用共享parking_data中的同一份内存数据
+router = APIRouter(
+    prefix="/api",
+    tags=["parking"],
+)
+
+# 占用变化推送给所有订阅了该停车场的客户端（与Flask应用在同一进程时共用一个监听器）
+add_occupancy_listener(occupancy_broker.publish)
+
+
+def _error(message, status_code):
+    return FastJSONResponse({"status": "error", "message": message}, status_code=status_code)
+
+
+def _lot_format(request, fmt):
+    """根据?format=或Accept头选择停车场数据的表示：json、compact或msgpack"""
+    if fmt:
+        return fmt
+    accept = request.headers.get("accept", "")
+    if MSGPACK_MIMETYPE in accept:
+        return "msgpack"
+    if COMPACT_MIMETYPE in accept:
+        return "compact"
+    return "json"
+
+
+def _if_none_match(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip() for tag in header.split(",")}
+    return "*" in tags or f'"{etag}"' in tags
+
+
+def _admit_llm(request, endpoint):
+    """LLM接口的准入检查；超出客户端请求总量时返回(None, 429响应)"""
+    admission = llm_admission.admit(
+        client_key(request.client.host if request.client else None,
+                   request.headers.get("x-forwarded-for")),
+        endpoint
+    )
+    if admission.refused:
+        response = _error("Too many requests, please retry later", 429)
+        response.headers["Retry-After"] = admission.retry_after_header
+        return None, response
+    return admission, None
+
+
+@router.get("/parking-lots/nearby")
+async def get_nearby_parking_lots(
+    lat: float = -36.8485,
+    lng: float = 174.7630,
+    radius: float = 1000,
+    k: Optional[int] = None,
+    features: str = "",
+    page: int = 1,
+    page_size: int = 20,
+    name: str = "未知位置"
+):
+    """获取目的地附近的停车场（空间索引查询，支持半径、k近邻、设施筛选和分页）"""
+    data = find_nearby_lots(
+        lat, lng, radius, k=k, features=[f for f in features.split(",") if f],
+        page=page, page_size=page_size, destination_name=name
+    )
+    return {"status": "success", "data": data}
+
+
+# 以下读取停车场的接口为同步函数：加载新停车场（生成布局、预计算导航）和持锁序列化
+# 由FastAPI放到线程池执行，不阻塞事件循环
+@router.get("/parking-lot/{lot_id}")
+def get_parking_lot(lot_id: str, request: Request, format: Optional[str] = Query(None)):
+    """获取停车场详情和布局（版本未变化时返回304），支持紧凑和二进制表示"""
+    parking_lot = load_lot(lot_id)
+    fmt = _lot_format(request, format)
+    if fmt not in ("json", "compact", "msgpack"):
+        return _error(f"Unsupported format: {fmt}", 400)
+    if fmt == "msgpack" and msgpack is None:
+        return _error("msgpack format is not available", 406)
+
+    etag = lot_etag(parking_lot) if fmt == "json" else f"{lot_etag(parking_lot)}-{fmt}"
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache", "Vary": "Accept"}
+    if _if_none_match(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    with lots_lock:
+        if fmt == "compact":
+            body = json_codec.dumps({"status": "success", "data": encode_compact(parking_lot)})
+            media_type = COMPACT_MIMETYPE
+        elif fmt == "msgpack":
+            body = encode_msgpack(parking_lot)
+            media_type = MSGPACK_MIMETYPE
+        else:
+            body = json_codec.dumps({"status": "success", "data": parking_lot})
+            media_type = "application/json"
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+@router.get("/parking-lot/{lot_id}/occupancy")
+def get_parking_lot_occupancy(lot_id: str, request: Request):
+    """获取停车场当前版本和已占用车位列表"""
+    parking_lot = load_lot(lot_id)
+    etag = lot_etag(parking_lot)
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+    if _if_none_match(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse({"status": "success", "data": lot_occupancy(parking_lot)}, headers=headers)
+
+
+@router.get("/parking-lot/{lot_id}/changes")
+def get_parking_lot_changes(lot_id: str, since: int = 0, layout: Optional[str] = None):
+    """获取某版本之后的占用变化（?since=版本号&layout=layout_etag），落后太多时返回完整快照"""
+    if lot_id not in parking_lots:
+        return _error("Parking lot not found", 404)
+    return {"status": "success", "data": changes_since(lot_id, since, layout)}
+
+
+@router.get("/parking-lot/{lot_id}/stream")
+async def stream_parking_lot(lot_id: str, request: Request):
+    """
+    通过Server-Sent Events推送停车场占用变化：先发送快照（断线重连时根据Last-Event-ID补发增量），
+    之后推送合并后的变化批次。异步生成器在事件循环中等待变化，长连接不占用线程池
+    """
+    parking_lot = await run_in_threadpool(load_lot, lot_id)
+    subscription = occupancy_broker.subscribe(lot_id)
+    if subscription is None:
+        response = _error("Too many subscribers, please poll /changes", 503)
+        response.headers["Retry-After"] = "30"
+        return response
+
+    last_event_id = request.headers.get("last-event-id")
+    # 订阅之后再取初始状态，避免漏掉两者之间的变化
+    if last_event_id is not None and last_event_id.isdigit():
+        initial = changes_since(lot_id, int(last_event_id))
+    else:
+        initial = dict(lot_occupancy(parking_lot), mode="snapshot")
+    events = occupancy_events_async(
+        subscription, initial, lambda: dict(lot_occupancy(parking_lot), mode="snapshot")
+    )
+    return StreamingResponse(
+        events, media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/parking-lot/{lot_id}/occupancy-history")
+async def get_parking_lot_occupancy_history(lot_id: str, window: int = 86400, step: Optional[int] = None):
+    """获取停车场最近的占用时间序列（未指定步长时自动降采样）"""
+    if window <= 0 or (step is not None and step <= 0):
+        return _error("window and step must be positive", 400)
+
+    history = occupancy_history.query(lot_id, window, step)
+    if history is None:
+        return _error("Parking lot not found", 404)
+    return {"status": "success", "data": history}
+
+
+@router.post("/allocate-spot")
+@profiling.profiled("allocate_spot")
+async def allocate_spot(request: Request, data: dict = Body(...)):
+    """为车辆分配最佳停车位"""
+    lot_id = data.get('parking_id')
+    vehicle_info = data.get('vehicle_info', {})
+    user_preferences = data.get('user_preferences', {})
+
+    if lot_id not in parking_lots:
+        return _error("Parking lot not found", 404)
+
+    # 获取可用车位
+    available_spots = get_available_spots(lot_id)
+
+    if not available_spots:
+        return _error("No available spots", 400)
+
+    # 超长车辆需要多个连续车位，直接按连续车位分配，不走单车位推荐
+    size = cells_for_vehicle(vehicle_info)
+    if size > 1:
+        try:
+            block = await run_in_threadpool(allocate_block, lot_id, size)
+        except FleetAllocationError as e:
+            return _error(str(e), 409)
+        block["reasoning"] = f"为您的{vehicle_info.get('name', '车辆')}分配了{size}个相邻车位。"
+        return {"status": "success", "data": block}
+
+    admission, refused = _admit_llm(request, "allocate_spot")
+    if refused is not None:
+        return refused
+
+    # 使用AI服务获取推荐（等待期间事件循环可处理其他请求，超出LLM限流时使用回退算法）
+    recommendation = await get_ai_recommendation_async(
+        available_spots,
+        vehicle_info,
+        user_preferences,
+        parking_lots[lot_id],
+        allow_llm=admission.allow_llm
+    )
+
+    # 标记车位为已占用（等待AI期间可能已被其他请求占用）
+    if not claim_spot(lot_id, recommendation["spot"]["id"]):
+        return _error("Spot was just taken, please retry", 409)
+
+    return {"status": "success", "data": recommendation}
+
+
+@router.post("/reroute-spot")
+@profiling.profiled("reroute_spot")
+async def reroute_spot(request: Request, data: dict = Body(...)):
+    """重新路由到新的停车位"""
+    lot_id = data.get('parking_id')
+    vehicle_info = data.get('vehicle_info', {})
+    current_position = data.get('current_position', [0, 0, 0])
+    destination = data.get('destination', {})
+
+    if lot_id not in parking_lots:
+        return _error("Parking lot not found", 404)
+
+    # 获取可用车位
+    available_spots = get_available_spots(lot_id)
+
+    if not available_spots:
+        return _error("No available spots", 400)
+
+    admission, refused = _admit_llm(request, "reroute_spot")
+    if refused is not None:
+        return refused
+
+    # 使用AI服务获取新推荐
+    new_recommendation = await reroute_recommendation_async(
+        available_spots,
+        vehicle_info,
+        current_position,
+        destination,
+        parking_lots[lot_id],
+        allow_llm=admission.allow_llm
+    )
+
+    # 标记新车位为已占用
+    if not claim_spot(lot_id, new_recommendation["spot"]["id"]):
+        return _error("Spot was just taken, please retry", 409)
+
+    return {"status": "success", "data": new_recommendation}
+
+
+@router.post("/allocate-fleet")
+@profiling.profiled("allocate_fleet")
+async def allocate_fleet_spots(data: dict = Body(...)):
+    """为同时到达的一组车辆联合分配车位（总代价最小），全部成功或全部不占用"""
+    lot_id = data.get('parking_id')
+    vehicles = data.get('vehicles', [])
+
+    if lot_id not in parking_lots:
+        return _error("Parking lot not found", 404)
+
+    try:
+        result = await run_in_threadpool(allocate_fleet, lot_id, vehicles)
+    except ValueError as e:
+        return _error(str(e), 400)
+    except FleetAllocationError as e:
+        return _error(str(e), 409)
+
+    return {"status": "success", "data": result}
+
+
+@router.post("/allocate-block")
+async def allocate_block_spots(data: dict = Body(...)):
+    """占用同一行或同一列的连续车位（超长车辆或团体），size缺省时按车辆长度计算"""
+    lot_id = data.get('parking_id')
+    size = data.get('size') or cells_for_vehicle(data.get('vehicle_info', {}))
+
+    if lot_id not in parking_lots:
+        return _error("Parking lot not found", 404)
+
+    try:
+        block = await run_in_threadpool(allocate_block, lot_id, size, data.get('orientation'))
+    except ValueError as e:
+        return _error(str(e), 400)
+    except FleetAllocationError as e:
+        return _error(str(e), 409)
+
+    return {"status": "success", "data": block}
+
+
+@router.post("/release-block/{block_id}")
+async def release_block_spots(block_id: str):
+    """释放连续车位分配中的所有车位"""
+    released = release_block(block_id)
+    if released is None:
+        return _error("Block not found", 404)
+    return {"status": "success", "data": {"released": released}}
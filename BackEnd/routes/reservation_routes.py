@@ -3,8 +3,10 @@ from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional, List
 import logging
-from .. import database
-from ..auth import get_current_user
+import database
+from auth import get_current_user
+from utils.reconcile import reservation_reconciler
+from utils import profiling
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -46,6 +48,7 @@ class ReservationsListResponse(BaseModel):
 
 # 创建新预约
 @router.post("/", response_model=ReservationResponse)
+@profiling.profiled("create_reservation")
 async def create_reservation(reservation: ReservationCreate, current_user = Depends(get_current_user)):
     try:
         # 验证用户
@@ -63,6 +66,15 @@ async def create_reservation(reservation: ReservationCreate, current_user = Depe
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=result["message"]
             )
+
+        # 立即占用车位，到期后自动释放
+        if reservation.status == "active":
+            reservation_reconciler.reservation_created(
+                result["data"]["id"],
+                reservation.parking_lot_id,
+                reservation.spot_id,
+                reservation.expiration_time
+            )
             
         return result
         
@@ -75,6 +87,7 @@ async def create_reservation(reservation: ReservationCreate, current_user = Depe
 
 # 获取用户的所有预约
 @router.get("/", response_model=ReservationsListResponse)
+@profiling.profiled("get_reservations")
 async def get_reservations(current_user = Depends(get_current_user)):
     try:
         # 获取用户预约
@@ -97,6 +110,7 @@ async def get_reservations(current_user = Depends(get_current_user)):
 
 # 取消预约
 @router.post("/{reservation_id}/cancel", response_model=ReservationResponse)
+@profiling.profiled("cancel_reservation")
 async def cancel_reservation(reservation_id: str, current_user = Depends(get_current_user)):
     try:
         # TODO: 验证预约属于当前用户
@@ -109,6 +123,8 @@ async def cancel_reservation(reservation_id: str, current_user = Depends(get_cur
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=result["message"]
             )
+
+        reservation_reconciler.reservation_ended(reservation_id)
             
         return result
         
@@ -0,0 +1,85 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("pyarrow")
+
+from utils.archive import (
+    ArchiveExporter, peak_occupancy, average_stay_by_spot_type, revenue_by_hourly_rate
+)
+from utils.timeseries import OccupancyHistory
+
+DAY = datetime(2026, 3, 2, 8, 0)
+
+
+def _reservation(reservation_id, lot_id, spot_type, rate, hours, status="active", updated=0):
+    return {
+        "id": reservation_id, "parking_lot_id": lot_id, "parking_lot_name": lot_id,
+        "spot_id": f"{reservation_id}_spot", "spot_type": spot_type, "destination_name": None,
+        "hourly_rate": rate, "reservation_time": DAY, "expiration_time": DAY + timedelta(hours=hours),
+        "status": status, "created_at": DAY, "updated_at": DAY + timedelta(minutes=updated)
+    }
+
+
+def _parts(root):
+    return sorted(
+        os.path.relpath(os.path.join(path, name), root)
+        for path, _, names in os.walk(root) for name in names if name.endswith(".arrow")
+    )
+
+
+def test_incremental_export_appends_and_queries_latest_version(tmp_path):
+    exporter = ArchiveExporter(str(tmp_path), batch_rows=2)
+    first = [
+        _reservation("r1", "lot_a", "standard", 10.0, 2, updated=1),
+        _reservation("r2", "lot_a", "large", 15.0, 4, updated=2),
+        _reservation("r3", "lot/b", "standard", 10.0, 1, updated=2)
+    ]
+    assert exporter.export_reservations(first) == 3
+    parts = _parts(tmp_path)
+    assert any("day=2026-03-02" in part and "lot=lot%2Fb" in part for part in parts)
+
+    # 数据库按>=水位再次返回r2、r3，只有新的变化被追加
+    canceled = dict(first[0], status="canceled", updated_at=DAY + timedelta(minutes=30))
+    assert exporter.export_reservations([first[1], first[2], canceled]) == 1
+    assert len(_parts(tmp_path)) > len(parts)
+
+    stays = {row["spot_type"]: row for row in average_stay_by_spot_type(str(tmp_path))}
+    assert stays["standard"]["reservations"] == 2
+    assert stays["standard"]["avg_stay_hours"] == pytest.approx((0.5 + 1) / 2)
+    assert stays["large"]["avg_stay_hours"] == pytest.approx(4)
+
+    revenue = {row["hourly_rate"]: row for row in revenue_by_hourly_rate(str(tmp_path))}
+    assert revenue[10.0]["revenue"] == pytest.approx(15.0)
+    assert revenue[15.0]["revenue"] == pytest.approx(60.0)
+    assert [row["reservations"] for row in average_stay_by_spot_type(str(tmp_path), lot_ids=["lot/b"])] == [1]
+
+
+def test_occupancy_samples_export_once_and_report_peaks(tmp_path):
+    history = OccupancyHistory(resolution=60, retention=3600)
+    history.observe("lot_a", 5, 20, now=0)
+    history.observe("lot_a", 17, 20, now=70)
+    history.observe("lot_a", 8, 20, now=130)
+    history.observe("lot_b", 3, 10, now=0)
+
+    exporter = ArchiveExporter(str(tmp_path))
+    assert exporter.export_occupancy(history, now=200) == 3 + 3
+    # 已导出的时间桶不会重复导出，当前未结束的桶留到下一次
+    assert exporter.export_occupancy(history, now=230) == 0
+    assert exporter.export_occupancy(history, now=250) == 2
+
+    peaks = peak_occupancy(str(tmp_path))
+    assert peaks == [
+        {"lot_id": "lot_a", "peak_occupied": 17, "total_spots": 20, "peak_ratio": 0.85},
+        {"lot_id": "lot_b", "peak_occupied": 3, "total_spots": 10, "peak_ratio": 0.3}
+    ]
+    assert peak_occupancy(str(tmp_path), start_day="1970-01-02") == []
+
+
+def test_queries_on_empty_archive(tmp_path):
+    assert peak_occupancy(str(tmp_path)) == []
+    assert revenue_by_hourly_rate(str(tmp_path)) == []
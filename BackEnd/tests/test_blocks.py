@@ -0,0 +1,89 @@
+import os
+import sys
+import random
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parking_data
+from utils.blocks import FreeRunIndex, cells_for_vehicle
+
+
+def _grid(rows, cols, aisle_col):
+    cells = {(r, c): True for r in range(rows) for c in range(cols) if c != aisle_col}
+    distance = {(r, c): r + abs(c - aisle_col) for r, c in cells}
+    return cells, distance
+
+
+def _runs(index):
+    return {bucket: set(runs) for bucket, runs in index._by_length.items()}
+
+
+def _has_run(free, k):
+    for (r, c) in free:
+        if all(free.get((r, c + i)) for i in range(k)) or all(free.get((r + i, c)) for i in range(k)):
+            return True
+    return False
+
+
+def test_incremental_updates_match_rebuild():
+    """After random occupy/release the runs equal an index built from scratch"""
+    rng = random.Random(11)
+    cells, distance = _grid(9, 11, 5)
+    index = FreeRunIndex(cells, distance)
+    for _ in range(500):
+        cell = rng.choice(list(cells))
+        cells[cell] = not cells[cell]
+        index.set_free(cell, cells[cell])
+    assert _runs(index) == _runs(FreeRunIndex(cells, distance))
+
+
+def test_find_returns_contiguous_free_cells():
+    rng = random.Random(5)
+    cells, distance = _grid(8, 12, 6)
+    for cell in cells:
+        cells[cell] = rng.random() < 0.4
+    index = FreeRunIndex(cells, distance)
+    for k in range(1, 6):
+        block = index.find(k)
+        assert (block is not None) == _has_run(cells, k)
+        if block is not None:
+            assert all(cells[cell] for cell in block)
+            rows = {r for r, _ in block}
+            cols = {c for _, c in block}
+            assert len(rows) == 1 or len(cols) == 1
+            positions = sorted(cols) if len(rows) == 1 else sorted(rows)
+            assert positions == list(range(positions[0], positions[0] + k))
+
+
+def test_aisle_breaks_runs_and_orientation_filter():
+    cells, distance = _grid(1, 5, 2)
+    index = FreeRunIndex(cells, distance)
+    assert index.find(3) is None
+    assert index.find(2, "row") in ([(0, 0), (0, 1)], [(0, 3), (0, 4)])
+    assert index.find(2, "col") is None
+
+
+def test_oversized_vehicles_need_two_cells():
+    assert cells_for_vehicle({"id": "truck", "length": 7.0}) == 2
+    assert cells_for_vehicle({"id": "rv", "length": 6.8}) == 2
+    assert cells_for_vehicle({"id": "sedan", "length": 4.5}) == 1
+
+
+def test_block_claim_and_release(monkeypatch):
+    lot = parking_data.generate_parking_lot("block_test", rows=7, cols=9)
+    monkeypatch.setitem(parking_data.parking_lots, "block_test", lot)
+    parking_data.reset_lot("block_test")
+
+    block_id, spots = parking_data.claim_block("block_test", 3, "row")
+    assert len({spot["row"] for spot in spots}) == 1
+    assert all(spot["is_occupied"] for spot in spots)
+
+    # 单独释放其中一个车位并被其他请求占用后，释放分配不应影响它
+    other = spots[0]["id"]
+    parking_data.set_spots_occupancy("block_test", [(other, False)])
+    parking_data.claim_spot("block_test", other)
+    released = parking_data.release_block(block_id)
+    assert sorted(released) == sorted(spot["id"] for spot in spots[1:])
+    assert lot["spots"][other]["is_occupied"]
+    assert parking_data.release_block(block_id) is None
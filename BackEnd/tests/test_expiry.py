@@ -0,0 +1,84 @@
+import os
+import sys
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.expiry import TimerWheel
+
+
+def test_wheel_fires_in_deadline_order_across_rounds():
+    """Entries fire once their tick is reached, including deadlines more than one rotation away"""
+    wheel = TimerWheel(tick_seconds=1, slots=10, now=0)
+    wheel.schedule("a", 3, "lot-a")
+    wheel.schedule("b", 13, "lot-b")  # 与a落在同一个槽，但在下一轮
+
+    assert wheel.advance(2) == []
+    assert wheel.advance(5) == [("a", "lot-a")]
+    assert "b" in wheel
+    assert wheel.advance(12) == []
+    assert wheel.advance(13) == [("b", "lot-b")]
+    assert len(wheel) == 0
+
+
+def test_wheel_cancel_and_catch_up():
+    """Cancelled entries never fire; a long pause expires everything overdue in one advance"""
+    wheel = TimerWheel(tick_seconds=1, slots=8, now=0)
+    for i in range(20):
+        wheel.schedule(i, i + 1)
+    assert wheel.cancel(5)
+    assert not wheel.cancel(5)
+
+    expired = {key for key, _ in wheel.advance(100)}
+    assert expired == set(range(20)) - {5}
+
+
+def test_wheel_past_deadline_fires_on_next_tick():
+    wheel = TimerWheel(tick_seconds=1, slots=4, now=50)
+    wheel.schedule("late", 10)
+    assert wheel.advance(51) == [("late", None)]
+
+
+class _FlakyDatabase:
+    """expire_reservations fails for batches containing a given id until told otherwise"""
+
+    def __init__(self, poison):
+        self.poison = poison
+        self.calls = []
+
+    def expire_reservations(self, reservation_ids):
+        self.calls.append(list(reservation_ids))
+        if self.poison in reservation_ids:
+            raise ConnectionError("database unavailable")
+        return {"status": "success", "data": {"expired": len(reservation_ids)}}
+
+
+def test_failed_batches_keep_spots_and_are_retried(monkeypatch):
+    import parking_data
+    from utils.expiry import ReservationExpiryScheduler
+
+    lot, _ = parking_data.get_or_create_lot("expiry_retry")
+    free = [spot["id"] for spot in lot["spots"].values() if not spot["is_occupied"]][:4]
+    parking_data.reserve_spots([(f"exp_{i}", "expiry_retry", spot_id) for i, spot_id in enumerate(free)])
+    database = _FlakyDatabase("exp_3")
+    monkeypatch.setitem(sys.modules, "database", database)
+
+    scheduler = ReservationExpiryScheduler(tick_seconds=1, slots=60, batch_size=2, retry_seconds=5)
+    scheduler._wheel = TimerWheel(tick_seconds=1, slots=60, now=100)
+    for i in range(4):
+        scheduler.schedule(f"exp_{i}", 101)
+
+    try:
+        assert sorted(scheduler.tick(now=101)) == ["exp_0", "exp_1"]
+        spots = lot["spots"]
+        assert not spots[free[0]]["is_occupied"] and not spots[free[1]]["is_occupied"]
+        assert spots[free[2]]["is_occupied"] and spots[free[3]]["is_occupied"]
+        assert len(scheduler) == 2 and scheduler.retried_total == 2
+
+        assert scheduler.tick(now=105) == []
+        database.poison = None
+        assert sorted(scheduler.tick(now=106)) == ["exp_2", "exp_3"]
+        assert not spots[free[2]]["is_occupied"] and not spots[free[3]]["is_occupied"]
+        assert len(scheduler) == 0
+    finally:
+        parking_data.release_reservations([f"exp_{i}" for i in range(4)])
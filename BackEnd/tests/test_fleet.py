@@ -0,0 +1,103 @@
+import os
+import sys
+import random
+import itertools
+import pytest
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parking_data
+from utils import fleet
+from utils.fleet import (
+    min_cost_assignment, plan_assignment, candidate_spots, vehicle_profile,
+    allocate_fleet, FleetAllocationError
+)
+
+SEDAN = {"id": "sedan", "name": "Sedan", "width": 1.8, "length": 4.5, "height": 1.5}
+VAN = {"id": "van", "name": "Van", "width": 2.1, "length": 5.2, "height": 2.1}
+
+
+def _spot(spot_id, spot_type, entrance, exit_=None):
+    return {"id": spot_id, "type": spot_type, "is_occupied": False, "row": 0, "col": 0,
+            "distance_to_entrance": entrance,
+            "distance_to_exit": entrance if exit_ is None else exit_}
+
+
+@pytest.mark.parametrize("solver", [min_cost_assignment, fleet._hungarian])
+def test_assignment_matches_brute_force(solver):
+    """Both the scipy path and the pure-Python fallback find the brute-force minimum"""
+    rng = random.Random(7)
+    for _ in range(30):
+        n, m = rng.randint(1, 4), rng.randint(4, 6)
+        cost = [[rng.randint(0, 20) for _ in range(m)] for _ in range(n)]
+        assignment = solver(cost)
+        assert len(set(assignment)) == n
+        best = min(sum(cost[i][j] for i, j in enumerate(p)) for p in itertools.permutations(range(m), n))
+        assert sum(cost[i][j] for i, j in enumerate(assignment)) == best
+
+
+def test_scipy_result_is_mapped_back_to_rows(monkeypatch):
+    """linear_sum_assignment returns (rows, columns) arrays; each row gets its own column"""
+    def fake(cost):
+        columns = fleet._hungarian(cost)
+        return list(reversed(range(len(cost)))), list(reversed(columns))
+
+    monkeypatch.setattr(fleet, "linear_sum_assignment", fake)
+    cost = [[1, 9, 9], [9, 9, 1]]
+    assert min_cost_assignment(cost) == [0, 2]
+    with pytest.raises(ValueError):
+        min_cost_assignment([[1], [2]])
+
+
+def test_joint_plan_beats_greedy_order():
+    """A sedan asked first must not take the only large spot the van needs"""
+    spots = [_spot("large_1", "large", 5), _spot("std_1", "standard", 40)]
+    plan = plan_assignment(spots, [SEDAN, VAN])
+    assert [spot["id"] for spot, _ in plan] == ["std_1", "large_1"]
+
+
+def test_infeasible_fleet_is_rejected():
+    spots = [_spot("compact_1", "compact", 1), _spot("disabled_1", "disabled", 2)]
+    with pytest.raises(FleetAllocationError):
+        plan_assignment(spots, [VAN])
+
+
+def test_candidate_pruning_keeps_optimum():
+    """Keeping only the n nearest spots per type gives the same total as the full set"""
+    rng = random.Random(3)
+    types = ["standard", "large", "compact", "ev_charging"]
+    spots = [_spot(f"s{i}", rng.choice(types), rng.randint(1, 100), rng.randint(1, 100)) for i in range(40)]
+    vehicles = [SEDAN, VAN, SEDAN, {"id": "mini", "length": 3.6, "electric": True}]
+    pruned = candidate_spots(spots, [vehicle_profile(v) for v in vehicles], len(vehicles))
+    assert len(pruned) < len(spots)
+    total = sum(cost for _, cost in plan_assignment(spots, vehicles))
+    assert total == sum(cost for _, cost in plan_assignment(pruned, vehicles))
+
+
+def test_allocate_fleet_claims_all_or_nothing(monkeypatch):
+    lot = parking_data.generate_parking_lot("fleet_test", rows=6, cols=6)
+    monkeypatch.setitem(parking_data.parking_lots, "fleet_test", lot)
+    parking_data.reset_lot("fleet_test")
+
+    result = allocate_fleet("fleet_test", [SEDAN, SEDAN, VAN])
+    spot_ids = [a["spot"]["id"] for a in result["assignments"]]
+    assert len(set(spot_ids)) == 3
+    assert all(lot["spots"][spot_id]["is_occupied"] for spot_id in spot_ids)
+
+    free_before = len(parking_data.get_available_spots("fleet_test"))
+    too_many = [SEDAN] * (free_before + 1)
+    monkeypatch.setattr("utils.fleet.FLEET_MAX_VEHICLES", len(too_many))
+    with pytest.raises(FleetAllocationError):
+        allocate_fleet("fleet_test", too_many)
+    assert len(parking_data.get_available_spots("fleet_test")) == free_before
+
+
+def test_claim_spots_is_atomic(monkeypatch):
+    lot = parking_data.generate_parking_lot("claim_test", rows=4, cols=4)
+    monkeypatch.setitem(parking_data.parking_lots, "claim_test", lot)
+    parking_data.reset_lot("claim_test")
+    first, second = list(lot["spots"])[:2]
+    parking_data.claim_spot("claim_test", second)
+    assert not parking_data.claim_spots("claim_test", [first, second])
+    assert not lot["spots"][first]["is_occupied"]
@@ -0,0 +1,100 @@
+import os
+import sys
+import random
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.geo_index import LotIndex, haversine_m, paginate
+
+
+def _random_lots(count, seed=7):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"lot_{i}",
+            "location": {"lat": -36.85 + rng.uniform(-0.2, 0.2), "lng": 174.76 + rng.uniform(-0.2, 0.2)},
+            "features": rng.sample(["covered", "security", "ev_charging", "24h"], k=2)
+        }
+        for i in range(count)
+    ]
+
+
+def test_radius_and_nearest_match_brute_force():
+    """Grid index results agree with a full haversine scan"""
+    lots = _random_lots(3000)
+    index = LotIndex()
+    index.load(lots)
+    lat, lng = -36.8485, 174.7630
+
+    distances = sorted(
+        (haversine_m(lat, lng, l["location"]["lat"], l["location"]["lng"]), l["id"]) for l in lots
+    )
+    within = index.within_radius(lat, lng, 2000)
+    assert [lot["id"] for _, lot in within] == [i for d, i in distances if d <= 2000]
+
+    nearest = index.nearest(lat, lng, 15)
+    assert [lot["id"] for _, lot in nearest] == [i for _, i in distances[:15]]
+
+
+def test_feature_filter_and_paging():
+    """Feature filters require every requested feature and pages slice the sorted result"""
+    index = LotIndex()
+    index.load(_random_lots(500))
+    matches = index.within_radius(-36.85, 174.76, 30000, features=["ev_charging", "24h"])
+    assert matches
+    assert all({"ev_charging", "24h"} <= set(lot["features"]) for _, lot in matches)
+    assert paginate(matches, 2, 10) == matches[10:20]
+
+
+def test_incremental_add_moves_lot():
+    """Re-adding a lot with a new location re-indexes it"""
+    index = LotIndex()
+    index.add({"id": "a", "location": {"lat": -36.85, "lng": 174.76}})
+    index.add({"id": "a", "location": {"lat": -36.95, "lng": 174.86}})
+    assert len(index) == 1
+    assert index.within_radius(-36.85, 174.76, 1000) == []
+    assert index.nearest(-36.95, 174.86, 1)[0][1]["id"] == "a"
+
+
+def test_placeholder_lot_is_not_added_to_catalog(monkeypatch):
+    """Queries far from any catalog lot get a stable placeholder that never enters the index"""
+    import parking_data
+
+    index = LotIndex()
+    monkeypatch.setattr(parking_data, "_lot_index", index)
+    first = parking_data.find_nearby_lots(10.0, 20.0, 1000)
+    second = parking_data.find_nearby_lots(10.0, 20.0, 1000)
+    assert first["total"] == 1
+    assert first["parkings"] == second["parkings"]
+    assert len(index) == 0
+
+
+def test_huge_radius_scans_only_occupied_cells():
+    """A continent-sized radius stays fast and still matches brute force"""
+    import time
+
+    lots = _random_lots(500)
+    index = LotIndex()
+    index.load(lots)
+    lat, lng = -36.8485, 174.7630
+    started = time.perf_counter()
+    within = index.within_radius(lat, lng, 5_000_000)
+    assert time.perf_counter() - started < 0.5
+    assert len(within) == len(lots)
+    assert index.within_radius(0.0, 0.0, 1000) == []
+
+
+def test_nearby_radius_is_clamped(monkeypatch):
+    import parking_data
+
+    index = LotIndex()
+    index.load(_random_lots(50))
+    monkeypatch.setattr(parking_data, "_lot_index", index)
+    seen = []
+    within = index.within_radius
+    monkeypatch.setattr(index, "within_radius", lambda *args, **kwargs: seen.append(args[2]) or within(*args, **kwargs))
+
+    parking_data.find_nearby_lots(-36.8485, 174.7630, 2_000_000)
+    parking_data.find_nearby_lots(-36.8485, 174.7630, float("nan"))
+    assert seen == [parking_data.NEARBY_MAX_RADIUS_M, 0.0]
@@ -0,0 +1,28 @@
+import os
+import sys
+import json
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parking_data import generate_parking_lot
+from utils.lot_codec import encode_compact, decode_compact
+
+
+def test_compact_roundtrip_preserves_spots():
+    """Decoding the compact form gives back every spot's position, type and occupancy"""
+    lot = generate_parking_lot("lot_codec", rows=10, cols=12)
+    lot["version"] = 0
+    decoded = decode_compact(encode_compact(lot))
+    assert decoded == {
+        spot_id: {k: spot[k] for k in ("row", "col", "type", "is_occupied")}
+        for spot_id, spot in lot["spots"].items()
+    }
+
+
+def test_compact_payload_is_much_smaller():
+    """The compact form is a small fraction of the verbose JSON"""
+    lot = generate_parking_lot("lot_codec_size", rows=10, cols=12)
+    verbose = len(json.dumps(lot))
+    compact = len(json.dumps(encode_compact(lot), separators=(",", ":")))
+    assert verbose / compact > 15
@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metrics import _SHARDS, Counter, Histogram, CallbackMetric, timed_dependency, dependency_errors
+
+
+def test_counter_sums_across_threads():
+    """Threads share a fixed set of locked shards, so thread-per-request servers do not grow memory"""
+    requests = Counter("test_requests_total", "test", ("route",))
+
+    def work():
+        for _ in range(1000):
+            requests.labels("/a").inc()
+
+    for _ in range(4):
+        threads = [threading.Thread(target=work) for _ in range(50)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    assert requests.labels("/a").value() == 200000
+    assert len(requests.labels("/a")._values._shards) == _SHARDS
+    assert 'test_requests_total{route="/a"} 200000' in requests.expose()
+
+
+def test_histogram_exposition_is_cumulative():
+    latency = Histogram("test_latency_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.labels("/x").observe(value)
+    lines = latency.expose()
+    assert 'test_latency_seconds_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{route="/x",le="1"} 3' in lines
+    assert 'test_latency_seconds_bucket{route="/x",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{route="/x"} 4' in lines
+    assert 'test_latency_seconds_sum{route="/x"} 4.05' in lines
+
+
+def test_callback_and_label_escaping():
+    gauge = CallbackMetric("test_free_spots", "test", ("lot",), lambda: [(('a"b',), 3)])
+    assert 'test_free_spots{lot="a\\"b"} 3' in gauge.expose()
+
+
+def test_timed_dependency_counts_error_results():
+    @timed_dependency("testdb")
+    def failing_query():
+        return {"status": "error", "message": "boom"}
+
+    before = dependency_errors.labels("testdb", "failing_query").value()
+    assert failing_query()["status"] == "error"
+    assert dependency_errors.labels("testdb", "failing_query").value() == before + 1
+
+
+def test_startup_import_time_is_exported():
+    """record_startup feeds the smartpark_startup_import_seconds gauge"""
+    from utils import metrics
+    metrics.record_startup("test-app", 0.25)
+    assert 'smartpark_startup_import_seconds{app="test-app"} 0.25' in metrics.expose()
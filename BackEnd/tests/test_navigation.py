@@ -0,0 +1,58 @@
+import os
+import sys
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parking_data import generate_parking_lot, is_aisle_cell
+from utils.navigation import generate_navigation_instructions, get_layout, prewarm_routes, instruction_cache
+
+
+def test_every_spot_is_reachable_from_entrance():
+    """Every generated spot borders a drive aisle, so the distance field covers all of them"""
+    for rows in range(6, 11):
+        for cols in range(8, 13):
+            lot = generate_parking_lot(f"lot_{rows}_{cols}", rows=rows, cols=cols)
+            layout = get_layout(lot)
+            for spot in lot["spots"].values():
+                assert not is_aisle_cell(spot["row"], spot["col"], rows, cols)
+                assert layout.spot_distance(layout.entrance_field, spot["row"], spot["col"]) is not None
+
+
+def test_distance_field_matches_astar_path_length():
+    """Cached entrance distances equal the length of the A* path to the spot"""
+    lot = generate_parking_lot("lot_astar", rows=9, cols=10)
+    layout = get_layout(lot)
+    entrance = (lot["entrance"]["row"], lot["entrance"]["col"])
+    for spot in lot["spots"].values():
+        path = layout.find_path(entrance, (spot["row"], spot["col"]))
+        assert len(path) - 1 == spot["distance_to_entrance"]
+
+
+def test_instructions_follow_aisles():
+    """Turn-by-turn instructions come from the path rather than a straight rows-then-columns move"""
+    lot = generate_parking_lot("lot_route", rows=10, cols=9)
+    spot = lot["spots"]["spot_2_1"]
+    instructions = generate_navigation_instructions({"row": 5, "col": 8}, spot, lot)
+    assert instructions[:5] == (
+        "从当前位置开始",
+        "向左行驶4列",
+        "向后行驶3排",
+        "向左行驶3列",
+        "向前驶入车位"
+    )
+    assert instructions[-1].startswith("您的目标是spot_2_1号")
+
+
+def test_prewarmed_routes_are_served_from_cache():
+    """Entrance routes are computed once at lot creation and then shared as the same tuple"""
+    lot = generate_parking_lot("lot_cache", rows=8, cols=11)
+    instruction_cache.clear()
+    prewarm_routes(lot)
+    spot = next(iter(lot["spots"].values()))
+
+    first = generate_navigation_instructions(lot["entrance"], spot, lot)
+    second = generate_navigation_instructions(lot["entrance"], spot, lot)
+    assert first is second
+    assert isinstance(first, tuple)
+    assert instruction_cache.info()["hits"] == 2
@@ -0,0 +1,60 @@
+import os
+import sys
+import asyncio
+import importlib
+import pytest
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import profiling
+
+
+@pytest.fixture(autouse=True)
+def restore_module():
+    yield
+    # 恢复为按真实环境变量加载的模块状态
+    importlib.reload(profiling)
+
+
+def _reload(monkeypatch, token="", rate="0"):
+    monkeypatch.setenv("PROFILE_TOKEN", token)
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", rate)
+    return importlib.reload(profiling)
+
+
+def _work(n):
+    return sorted(range(n, 0, -1))[0]
+
+
+def test_disabled_returns_original_function(monkeypatch):
+    module = _reload(monkeypatch)
+    assert not module.ENABLED
+    assert module.profiled("work")(_work) is _work
+
+
+def test_header_triggers_profile(monkeypatch):
+    module = _reload(monkeypatch, token="secret")
+    work = module.profiled("work")(_work)
+
+    module.mark_request("wrong")
+    assert work(1000) == 1
+    assert module.list_profiles() == []
+
+    module.mark_request("secret")
+    work(1000)
+    [summary] = module.list_profiles()
+    assert summary["route"] == "work" and summary["reason"] == "header"
+    assert "_work" in module.get_profile(summary["id"])["stats"]
+
+
+def test_sampled_async_profile(monkeypatch):
+    module = _reload(monkeypatch, rate="1")
+
+    @module.profiled("async_work")
+    async def async_work():
+        await asyncio.sleep(0)
+        return _work(100)
+
+    assert asyncio.run(async_work()) == 1
+    assert module.list_profiles()[0]["reason"] == "sampled"
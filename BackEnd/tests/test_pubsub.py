@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import pytest
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+fastapi = pytest.importorskip("fastapi")
+import anyio
+import anyio.to_thread
+
+import parking_data
+from routes import parking_routes
+from utils.pubsub import occupancy_broker
+
+
+async def _asgi(app, method, path, body=b"", on_chunk=None):
+    """Call the ASGI app directly; on_chunk sees each streamed body chunk"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "path": path, "raw_path": path.encode(), "query_string": b"",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 5000), "server": ("testserver", 80), "scheme": "http"
+    }
+    disconnect = anyio.Event()
+    sent_body = False
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+            if on_chunk is not None:
+                on_chunk(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return response
+
+
+def test_open_streams_do_not_starve_the_thread_pool(monkeypatch):
+    """More SSE clients than thread tokens; allocate-spot still answers"""
+    app = fastapi.FastAPI()
+    app.include_router(parking_routes.router)
+    lot_id = "stream_starve"
+    parking_data.load_lot(lot_id)
+
+    async def first_spot(available_spots, vehicle_info, user_preferences, parking_lot, allow_llm=True):
+        return {"spot": available_spots[0]}
+
+    monkeypatch.setattr(parking_routes, "get_ai_recommendation_async", first_spot)
+
+    async def main():
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        limiter.total_tokens = 2
+        opened = []
+        async with anyio.create_task_group() as tg:
+            for _ in range(limiter.total_tokens * 3):
+                started = anyio.Event()
+                opened.append(started)
+                tg.start_soon(lambda started=started: _asgi(
+                    app, "GET", f"/api/parking-lot/{lot_id}/stream",
+                    on_chunk=lambda chunk, started=started: chunk and started.set()
+                ))
+            for started in opened:
+                with anyio.fail_after(5):
+                    await started.wait()
+
+            body = json.dumps({"parking_id": lot_id, "vehicle_info": {}}).encode()
+            with anyio.fail_after(5):
+                response = await _asgi(app, "POST", "/api/allocate-spot", body)
+            assert response["status"] == 200
+            tg.cancel_scope.cancel()
+
+    try:
+        anyio.run(main)
+    finally:
+        parking_data.reset_lot(lot_id)
+    assert occupancy_broker.subscriber_count == 0
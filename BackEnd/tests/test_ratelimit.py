@@ -0,0 +1,72 @@
+import os
+import sys
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ratelimit import MemoryBucketStore, AdmissionController, client_key
+
+
+class _FailingStore:
+    def take(self, buckets, now, cost=1.0):
+        raise ConnectionError("store down")
+
+
+def test_bucket_refills_at_rate():
+    """A drained bucket reports the wait until the next token and refills over time"""
+    store = MemoryBucketStore()
+    bucket = [("k", 2.0, 3)]
+    assert [store.take(bucket, 100.0) for _ in range(3)] == [0, 0, 0]
+    assert store.take(bucket, 100.0) == 0.5
+    assert store.take(bucket, 100.5) == 0
+
+
+def test_multi_bucket_take_is_all_or_nothing():
+    """When one bucket is empty no bucket is charged"""
+    store = MemoryBucketStore()
+    store.take([("user", 1.0, 1)], 0.0)
+    assert store.take([("user", 1.0, 1), ("global", 1.0, 1)], 0.0) > 0
+    # 全局桶未被扣除，其他用户仍可使用
+    assert store.take([("other", 1.0, 1), ("global", 1.0, 1)], 0.0) == 0
+
+
+def test_store_evicts_least_recently_used():
+    store = MemoryBucketStore(max_keys=2)
+    for key in ("a", "b", "c"):
+        store.take([(key, 1.0, 1)], 0.0)
+    assert list(store._buckets) == ["b", "c"]
+
+
+def test_admission_falls_back_then_refuses():
+    """Over the LLM budget requests use the fallback; over the hard limit they are refused with a wait"""
+    controller = AdmissionController("test", 0.001, 2, 100, 100, 0.5, 4)
+    decisions = [controller.admit("ip:1", "allocate") for _ in range(5)]
+    assert [d.allow_llm for d in decisions[:4]] == [True, True, False, False]
+    assert not any(d.refused for d in decisions[:4])
+    assert decisions[4].refused
+    assert decisions[4].retry_after_header == "2"
+
+
+def test_global_bucket_is_shared_between_clients():
+    controller = AdmissionController("test", 100, 100, 0.001, 1, 100, 100)
+    assert controller.admit("ip:1", "allocate").allow_llm
+    assert not controller.admit("ip:2", "allocate").allow_llm
+
+
+def test_store_failure_uses_local_buckets():
+    controller = AdmissionController("test", 100, 100, 100, 100, 100, 100, store=_FailingStore())
+    assert controller.admit("ip:1", "allocate").allow_llm
+
+
+def test_client_key_uses_the_address():
+    assert client_key("10.0.0.1") == "ip:10.0.0.1"
+    assert client_key("10.0.0.1", "1.2.3.4") == "ip:10.0.0.1"
+    assert client_key(None) == "ip:unknown"
+
+
+def test_new_tokens_do_not_escape_the_hard_limit():
+    """Unverified bearer tokens must not get fresh buckets"""
+    controller = AdmissionController("test", 100, 100, 100, 100, 0.001, 3)
+    decisions = [controller.admit(client_key("10.0.0.9"), "allocate") for _ in range(4)]
+    assert not any(d.refused for d in decisions[:3])
+    assert decisions[3].refused
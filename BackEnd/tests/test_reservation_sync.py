@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parking_data
+from parking_data import (
+    parking_lots, get_or_create_lot, reserve_spots, release_reservations
+)
+
+
+def _free_spot(lot_id):
+    return next(s["id"] for s in parking_lots[lot_id]["spots"].values() if not s["is_occupied"])
+
+
+def test_reserve_and_release_loaded_lot():
+    lot, _ = get_or_create_lot("sync_loaded")
+    spot_id = _free_spot("sync_loaded")
+    version = lot["version"]
+
+    reserve_spots([("r1", "sync_loaded", spot_id)])
+    reserve_spots([("r1", "sync_loaded", spot_id)])  # 重复应用不产生新版本
+    assert lot["spots"][spot_id]["is_occupied"]
+    assert lot["version"] == version + 1
+
+    release_reservations(["r1", "unknown"])
+    assert not lot["spots"][spot_id]["is_occupied"]
+    assert lot["version"] == version + 2
+
+
+def test_reservation_applied_when_lot_is_generated(monkeypatch):
+    """Reservations for lots not yet in memory are applied when the lot is created"""
+    generate = parking_data.generate_parking_lot
+
+    def empty_lot(lot_id):
+        lot = generate(lot_id, rows=6, cols=8)
+        for spot in lot["spots"].values():
+            spot["is_occupied"] = False
+        return lot
+
+    monkeypatch.setattr(parking_data, "generate_parking_lot", empty_lot)
+
+    reserve_spots([("r2", "sync_later", "spot_0_0")])
+    assert "sync_later" not in parking_lots
+    lot, created = get_or_create_lot("sync_later")
+    assert created
+    assert lot["spots"]["spot_0_0"]["is_occupied"]
+    assert not lot["spots"]["spot_0_1"]["is_occupied"]
+
+    release_reservations(["r2"])
+    assert not lot["spots"]["spot_0_0"]["is_occupied"]
+    assert parking_data.reserved_count() == 0
+
+
+class _ChangesOnly:
+    """Fake database exposing the keyset-paged change feed"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.pages = 0
+
+    def get_db_time(self):
+        return 0
+
+    def get_reservation_changes(self, since, limit=1000, since_id=""):
+        self.pages += 1
+        rows = sorted(
+            (row for row in self.rows if (row["updated_at"], row["id"]) > (since, since_id)),
+            key=lambda row: (row["updated_at"], row["id"])
+        )
+        return {"status": "success", "data": rows[:limit]}
+
+
+def test_poll_pages_through_rows_sharing_one_timestamp(monkeypatch):
+    from utils.reconcile import ReservationReconciler
+
+    lot, _ = get_or_create_lot("sync_burst")
+    spot_ids = [s["id"] for s in lot["spots"].values() if not s["is_occupied"]][:7]
+    rows = [
+        {"id": f"burst_{i}", "parking_lot_id": "sync_burst", "spot_id": spot_id,
+         "expiration_time": time.time() + 3600, "status": "active", "updated_at": 10}
+        for i, spot_id in enumerate(spot_ids)
+    ]
+    fake = _ChangesOnly(rows)
+    monkeypatch.setitem(sys.modules, "database", fake)
+
+    reconciler = ReservationReconciler(batch_size=3)
+    reconciler._watermark = (0, "")
+    try:
+        assert reconciler.poll() == len(rows)
+        assert all(lot["spots"][spot_id]["is_occupied"] for spot_id in spot_ids)
+        assert reconciler.poll() == 0
+    finally:
+        reconciler._apply_batch([], [row["id"] for row in rows])
+
+
+def test_immediate_apply_is_noop_when_sync_is_off():
+    from utils.reconcile import ReservationReconciler
+
+    lot, _ = get_or_create_lot("sync_off")
+    spot_id = _free_spot("sync_off")
+    ReservationReconciler().reservation_created("r_off", "sync_off", spot_id, None)
+    assert not lot["spots"][spot_id]["is_occupied"]
+    assert parking_data.reserved_count() == 0
@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import pytest
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.resilience import (
+    CircuitBreaker, AdaptiveLimiter, DependencyGuard,
+    CircuitOpenError, ConcurrencyLimitExceeded
+)
+
+
+def _failing_call():
+    raise TimeoutError("deepseek timed out")
+
+
+def test_breaker_opens_and_fails_fast():
+    """Consecutive failures open the circuit and later calls are rejected without calling out"""
+    guard = DependencyGuard("test", CircuitBreaker("test", failure_threshold=2, recovery_timeout=60),
+                            AdaptiveLimiter(initial_limit=5), timeout=1)
+    for _ in range(2):
+        with pytest.raises(TimeoutError):
+            guard.call(_failing_call)
+
+    calls = []
+    with pytest.raises(CircuitOpenError):
+        guard.call(lambda: calls.append(1))
+    assert calls == []
+    assert guard.snapshot()["circuit"]["state"] == "open"
+
+
+def test_half_open_probe_closes_circuit():
+    """After the recovery timeout a single probe is let through and success closes the circuit"""
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=0.01)
+    guard = DependencyGuard("test", breaker, AdaptiveLimiter(initial_limit=5), timeout=1)
+    with pytest.raises(TimeoutError):
+        guard.call(_failing_call)
+    time.sleep(0.02)
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.release_probe()
+
+    assert guard.call(lambda: "ok") == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_adaptive_limit_backs_off_and_rejects():
+    """Failures shrink the in-flight limit multiplicatively and excess calls are rejected"""
+    limiter = AdaptiveLimiter(initial_limit=4, min_limit=1)
+    limiter.try_acquire()
+    limiter.release(latency=0.1, success=False)
+    assert limiter.limit == 2
+
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+    guard = DependencyGuard("test", CircuitBreaker("test"), limiter, timeout=1)
+    with pytest.raises(ConcurrencyLimitExceeded):
+        guard.call(lambda: "never")
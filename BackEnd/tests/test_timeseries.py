@@ -0,0 +1,66 @@
+import os
+import sys
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parking_data
+from utils.timeseries import OccupancyHistory, OccupancySeries
+
+
+def test_gaps_carry_the_last_value_and_track_peaks():
+    series = OccupancySeries(60, 10, 100, 10, now=0)
+    series.record(30, 40)
+    series.record(45, 20)
+    series.record(200, 25)
+    points = series.query(0, 200, 60)
+    assert points == [(0, 20, 40), (60, 20, 20), (120, 20, 20), (180, 25, 25)]
+
+
+def test_ring_keeps_only_the_retention_window():
+    series = OccupancySeries(60, 5, 100, 0, now=0)
+    for minute in range(1, 20):
+        series.record(minute * 60, minute)
+    timestamps = [t for t, _, _ in series.query(0, 19 * 60, 60)]
+    assert timestamps == [15 * 60, 16 * 60, 17 * 60, 18 * 60, 19 * 60]
+    assert series.nbytes == 2 * 5 * 2
+
+
+def test_downsampling_averages_buckets():
+    history = OccupancyHistory(resolution=60, retention=3600)
+    history.observe("lot", 10, 50, now=0)
+    for minute in range(1, 10):
+        history.observe("lot", 10 + minute, 50, now=minute * 60)
+    result = history.query("lot", window=600, step=300, now=599)
+    assert result["step"] == 300
+    assert result["timestamps"] == [0, 300]
+    assert result["avg_occupied"] == [12.0, 17.0]
+    assert result["max_occupied"] == [14, 19]
+    assert history.bytes_per_lot() == 2 * 60 * 2
+
+
+def test_occupancy_changes_feed_the_history(monkeypatch):
+    lot = parking_data.generate_parking_lot("history_test", rows=4, cols=4)
+    monkeypatch.setitem(parking_data.parking_lots, "history_test", lot)
+    parking_data.reset_lot("history_test")
+    spot_ids = list(lot["spots"])[:3]
+    parking_data.set_spots_occupancy("history_test", [(spot_id, True) for spot_id in spot_ids])
+
+    result = parking_data.occupancy_history.query("history_test", window=3600)
+    assert result["total_spots"] == len(lot["spots"])
+    assert result["max_occupied"][-1] >= 3
+    assert parking_data.occupancy_history.query("missing", window=3600) is None
+
+
+def test_series_count_is_capped_by_least_recent_write():
+    history = OccupancyHistory(resolution=60, retention=600, max_lots=2)
+    history.observe("a", 1, 10, now=0)
+    history.observe("b", 1, 10, now=0)
+    history.apply_delta("a", 1, now=60)
+    history.observe("c", 1, 10, now=120)
+    assert sorted(history.lot_ids()) == ["a", "c"]
+    assert history.evicted == 1
+    assert history.memory_bytes() <= history.max_bytes() == 2 * history.bytes_per_lot()
+
+    history.discard("a")
+    assert history.lot_ids() == ["c"]
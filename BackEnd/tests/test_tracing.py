@@ -0,0 +1,64 @@
+import os
+import sys
+import pytest
+
+# 添加父目录到模块搜索路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import tracing
+from utils.metrics import dependency_timer
+
+PARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+class ListExporter:
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span.to_dict())
+
+    def shutdown(self):
+        pass
+
+
+@pytest.fixture
+def exporter():
+    exporter = ListExporter()
+    tracing.set_exporter(exporter)
+    yield exporter
+    tracing.set_exporter(None)
+
+
+def test_parse_traceparent():
+    assert tracing.parse_traceparent(PARENT) == (
+        "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True
+    )
+    assert tracing.parse_traceparent("00-abc-def-01") is None
+    assert tracing.parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert tracing.parse_traceparent(None) is None
+
+
+def test_request_continues_upstream_trace(exporter):
+    root = tracing.start_request("POST /api/allocate-spot", PARENT)
+    with tracing.span("deepseek.prompt"):
+        pass
+    with dependency_timer("cognito", "userinfo") as call:
+        call.error = True
+    root.end()
+
+    prompt, cognito, request = exporter.spans
+    assert request["trace_id"] == "4bf92f3577b34da6a3ce929d0e0e4736"
+    assert request["parent_id"] == "00f067aa0ba902b7"
+    assert prompt["parent_id"] == request["span_id"]
+    assert cognito["name"] == "cognito.userinfo" and cognito["status"] == "error"
+    # 根span结束后不再有进行中的trace
+    assert tracing.span("orphan") is tracing.NOOP_SPAN
+
+
+def test_unsampled_upstream_and_disabled_are_noops(exporter):
+    assert tracing.start_request("GET /", PARENT[:-2] + "00") is tracing.NOOP_SPAN
+    tracing.set_exporter(None)
+    assert tracing.start_request("GET /") is tracing.NOOP_SPAN
+    assert exporter.spans == []
@@ -1,24 +1,74 @@
-from openai import OpenAI
 import os
 import json
 import random
+import threading
 from dotenv import load_dotenv
-from utils.navigation import generate_navigation_instructions
+from utils.navigation import generate_navigation_instructions, get_layout
+from utils.resilience import deepseek_guard
+from utils import tracing
 
 # 加载环境变量
 load_dotenv()
 
-# 初始化DeepSeek客户端
-client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
-
-def get_ai_recommendation(available_spots, vehicle_info, user_preferences, parking_lot_info):
-    """使用DeepSeek API获取智能停车位推荐"""
-    
-    # 准备提示
-    prompt = f"""
+# DeepSeek客户端（同步客户端供Flask使用，异步客户端供FastAPI使用）在首次调用时创建，
+# 导入本模块时不加载openai SDK
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def _client_options():
+    return dict(
+        api_key=os.getenv("DEEPSEEK_API_KEY"),
+        base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
+        # 由deepseek_guard统一控制超时与熔断，SDK不再自行重试
+        max_retries=0
+    )
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(**_client_options())
+    return _client
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                from openai import AsyncOpenAI
+                _async_client = AsyncOpenAI(**_client_options())
+    return _async_client
+
+ALLOCATION_SYSTEM_PROMPT = "你是一个智能停车分配系统，使用数据分析为用户找到最佳停车位置。"
+REROUTE_SYSTEM_PROMPT = "你是一个智能停车导航系统，能够根据用户当前位置动态调整推荐。"
+
+
+def _chat_request(system_prompt, prompt):
+    """DeepSeek chat completion请求参数"""
+    # 向下游传递trace上下文
+    traceparent = tracing.current_traceparent()
+    return dict(
+        extra_headers={tracing.TRACEPARENT_HEADER: traceparent} if traceparent else None,
+        model="deepseek-chat",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.2,
+        response_format={"type": "json_object"},
+        timeout=deepseek_guard.timeout
+    )
+
+
+@tracing.traced("deepseek.prompt")
+def _allocation_prompt(available_spots, vehicle_info, user_preferences, parking_lot_info):
+    return f"""
     你是一个智能停车场系统的AI助手。请为用户推荐最佳停车位。
 
     停车场信息:
@@ -50,89 +100,139 @@ def get_ai_recommendation(available_spots, vehicle_info, user_preferences, parki
     请返回一个JSON格式的回答，包含以下字段:
     1. selected_spot_id: 你选择的车位ID
     2. reasoning: 选择这个车位的详细理由，向用户解释你的决策
-    
+
     仅返回JSON格式，不要有其他内容。
     """
-    
-    try:
-        # 调用DeepSeek API
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "你是一个智能停车分配系统，使用数据分析为用户找到最佳停车位置。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            response_format={"type": "json_object"}
-        )
-        
-        # 解析响应
-        result_text = response.choices[0].message.content
-        result = json.loads(result_text)
-        
-        selected_spot_id = result["selected_spot_id"]
-        
-        # 找到对应的车位
-        selected_spot = next((spot for spot in available_spots if spot["id"] == selected_spot_id), None)
-        
-        # 如果找不到推荐的车位（可能是AI错误），选择一个备选车位
-        if not selected_spot:
-            # 按照到入口的距离排序，选择最近的
-            selected_spot = sorted(available_spots, key=lambda x: x["distance_to_entrance"])[0]
-            reasoning = f"系统推荐您停在{selected_spot['id']}车位，这是距离入口最近的可用车位。"
+
+
+def _resolve_allocation(response, available_spots, parking_lot_info):
+    """解析AI返回的车位推荐"""
+    result_text = response.choices[0].message.content
+    result = json.loads(result_text)
+
+    selected_spot_id = result["selected_spot_id"]
+
+    # 找到对应的车位
+    selected_spot = next((spot for spot in available_spots if spot["id"] == selected_spot_id), None)
+
+    # 如果找不到推荐的车位（可能是AI错误），选择一个备选车位
+    if not selected_spot:
+        # 选择距离入口最近的
+        selected_spot = min(available_spots, key=lambda x: x["distance_to_entrance"])
+        reasoning = f"系统推荐您停在{selected_spot['id']}车位，这是距离入口最近的可用车位。"
+    else:
+        reasoning = result["reasoning"]
+
+    return _allocation_result(selected_spot, reasoning, parking_lot_info)
+
+
+@tracing.traced("allocation.fallback")
+def _fallback_allocation(available_spots, vehicle_info, parking_lot_info):
+    """不调用AI的确定性分配算法"""
+    if vehicle_info["id"] in ["truck", "rv"]:
+        # 大型车辆优先选择大型车位或距离出口近的位置
+        available_large_spots = [s for s in available_spots if s["type"] == "large"]
+        if available_large_spots:
+            selected_spot = available_large_spots[0]
         else:
-            reasoning = result["reasoning"]
-        
-        # 生成导航指示
-        navigation_instructions = generate_navigation_instructions(
-            parking_lot_info["entrance"],
-            selected_spot
+            # 选择距离出口最近的
+            selected_spot = min(available_spots, key=lambda x: x["distance_to_exit"])
+    else:
+        # 小型车辆优先选择距离入口近的位置
+        selected_spot = min(available_spots, key=lambda x: x["distance_to_entrance"])
+
+    reasoning = f"为您的{vehicle_info['name']}推荐{selected_spot['id']}车位，这里{selected_spot['type'] if selected_spot['type'] != 'standard' else ''}位置适合您的车辆尺寸，且{('距离入口较近' if vehicle_info['id'] not in ['truck', 'rv'] else '便于大型车辆驶出')}。"
+
+    return _allocation_result(selected_spot, reasoning, parking_lot_info)
+
+
+def _allocation_result(selected_spot, reasoning, parking_lot_info):
+    # 生成导航指示
+    navigation_instructions = generate_navigation_instructions(
+        parking_lot_info["entrance"],
+        selected_spot,
+        parking_lot_info
+    )
+
+    return {
+        "spot": selected_spot,
+        "reasoning": reasoning,
+        "navigation_instructions": navigation_instructions
+    }
+
+
+def get_ai_recommendation(available_spots, vehicle_info, user_preferences, parking_lot_info, allow_llm=True):
+    """使用DeepSeek API获取智能停车位推荐；allow_llm为False（超出限流）时直接使用回退算法"""
+    if not allow_llm:
+        return _fallback_allocation(available_spots, vehicle_info, parking_lot_info)
+    prompt = _allocation_prompt(available_spots, vehicle_info, user_preferences, parking_lot_info)
+
+    try:
+        # 调用DeepSeek API（熔断或并发超限时直接抛出异常，走回退逻辑）
+        response = deepseek_guard.call(
+            get_client().chat.completions.create,
+            **_chat_request(ALLOCATION_SYSTEM_PROMPT, prompt)
         )
-        
-        return {
-            "spot": selected_spot,
-            "reasoning": reasoning,
-            "navigation_instructions": navigation_instructions
-        }
-        
+        return _resolve_allocation(response, available_spots, parking_lot_info)
+
     except Exception as e:
         print(f"AI推荐出错: {str(e)}")
-        
         # 回退到简单算法
-        if vehicle_info["id"] in ["truck", "rv"]:
-            # 大型车辆优先选择大型车位或距离出口近的位置
-            available_large_spots = [s for s in available_spots if s["type"] == "large"]
-            if available_large_spots:
-                selected_spot = available_large_spots[0]
-            else:
-                # 按照到出口的距离排序
-                selected_spot = sorted(available_spots, key=lambda x: x["distance_to_exit"])[0]
-        else:
-            # 小型车辆优先选择距离入口近的位置
-            selected_spot = sorted(available_spots, key=lambda x: x["distance_to_entrance"])[0]
-        
-        reasoning = f"为您的{vehicle_info['name']}推荐{selected_spot['id']}车位，这里{selected_spot['type'] if selected_spot['type'] != 'standard' else ''}位置适合您的车辆尺寸，且{('距离入口较近' if vehicle_info['id'] not in ['truck', 'rv'] else '便于大型车辆驶出')}。"
-        
+        return _fallback_allocation(available_spots, vehicle_info, parking_lot_info)
+
+
+async def get_ai_recommendation_async(available_spots, vehicle_info, user_preferences, parking_lot_info,
+                                      allow_llm=True):
+    """get_ai_recommendation的异步版本，等待LLM期间不占用线程"""
+    if not allow_llm:
+        return _fallback_allocation(available_spots, vehicle_info, parking_lot_info)
+    prompt = _allocation_prompt(available_spots, vehicle_info, user_preferences, parking_lot_info)
+
+    try:
+        response = await deepseek_guard.call_async(
+            get_async_client().chat.completions.create,
+            **_chat_request(ALLOCATION_SYSTEM_PROMPT, prompt)
+        )
+        return _resolve_allocation(response, available_spots, parking_lot_info)
+
+    except Exception as e:
+        print(f"AI推荐出错: {str(e)}")
+        return _fallback_allocation(available_spots, vehicle_info, parking_lot_info)
+
+
+class _RerouteContext:
+    """重新路由时的当前位置，以及按实际行驶距离排序的依据"""
+
+    def __init__(self, current_position, parking_lot_info):
+        # 将3D位置转换为停车场行列
+        self.row = int(current_position[2] / 3)
+        self.col = int(current_position[0] / 3)
+        self.parking_lot_info = parking_lot_info
+        self._layout = get_layout(parking_lot_info)
+
+    def distance(self, spot):
+        # 从当前位置沿通道的实际行驶距离
+        return self._layout.distance_between((self.row, self.col), spot["row"], spot["col"])
+
+    def result(self, selected_spot, reasoning):
+        # 从当前位置生成导航指示
+        current_position_dict = {"row": self.row, "col": self.col}
         navigation_instructions = generate_navigation_instructions(
-            parking_lot_info["entrance"],
-            selected_spot
+            current_position_dict,
+            selected_spot,
+            self.parking_lot_info
         )
-        
+
         return {
             "spot": selected_spot,
             "reasoning": reasoning,
             "navigation_instructions": navigation_instructions
         }
 
-def reroute_recommendation(available_spots, vehicle_info, current_position, destination, parking_lot_info):
-    """用户偏离路线后，重新推荐停车位"""
-    
-    # 将3D位置转换为停车场行列
-    current_row = int(current_position[2] / 3)
-    current_col = int(current_position[0] / 3)
-    
-    # 准备提示
-    prompt = f"""
+
+@tracing.traced("deepseek.prompt")
+def _reroute_prompt(context, available_spots, vehicle_info, destination, parking_lot_info):
+    return f"""
     用户正在停车场内寻找车位，但已经偏离了原定路线。请基于当前位置重新推荐一个合适的停车位。
 
     停车场信息:
@@ -141,7 +241,7 @@ def reroute_recommendation(available_spots, vehicle_info, current_position, dest
     可用车位数: {len(available_spots)}
 
     用户当前位置:
-    第{current_row+1}行, 第{current_col+1}列 (大约)
+    第{context.row+1}行, 第{context.col+1}列 (大约)
 
     车辆信息:
     类型: {vehicle_info["id"]}
@@ -152,7 +252,7 @@ def reroute_recommendation(available_spots, vehicle_info, current_position, dest
     名称: {destination.get("name", "未知")}
 
     可用车位信息（只显示部分）:
-    {json.dumps(sorted(available_spots, key=lambda x: abs(x["row"]-current_row) + abs(x["col"]-current_col))[:5], indent=2)}
+    {json.dumps(sorted(available_spots, key=context.distance)[:5], indent=2)}
     ...(共{len(available_spots)}个可用车位)
 
     请重新分析并推荐一个从用户当前位置更容易到达的合适车位。优先考虑:
@@ -164,73 +264,75 @@ def reroute_recommendation(available_spots, vehicle_info, current_position, dest
     请返回一个JSON格式的回答，包含以下字段:
     1. selected_spot_id: 你选择的新车位ID
     2. reasoning: 为什么推荐这个新车位，解释重新规划的原因
-    
+
     仅返回JSON格式，不要有其他内容。
     """
-    
+
+
+def _resolve_reroute(response, context, available_spots):
+    """解析AI返回的重新路由推荐"""
+    result_text = response.choices[0].message.content
+    result = json.loads(result_text)
+
+    selected_spot_id = result["selected_spot_id"]
+
+    # 找到对应的车位
+    selected_spot = next((spot for spot in available_spots if spot["id"] == selected_spot_id), None)
+
+    # 如果找不到推荐的车位，选择距离当前位置最近的
+    if not selected_spot:
+        selected_spot = min(available_spots, key=context.distance)
+        reasoning = f"基于您当前位置，系统为您推荐最近的{selected_spot['id']}车位。"
+    else:
+        reasoning = result["reasoning"]
+
+    return context.result(selected_spot, reasoning)
+
+
+@tracing.traced("reroute.fallback")
+def _fallback_reroute(context, available_spots, vehicle_info):
+    """回退到简单算法 - 选择距离当前位置最近的车位"""
+    selected_spot = min(available_spots, key=context.distance)
+    reasoning = f"基于您当前位置，为您的{vehicle_info['name']}推荐附近的{selected_spot['id']}车位。"
+    return context.result(selected_spot, reasoning)
+
+
+def reroute_recommendation(available_spots, vehicle_info, current_position, destination, parking_lot_info,
+                           allow_llm=True):
+    """用户偏离路线后，重新推荐停车位；allow_llm为False时直接使用回退算法"""
+    context = _RerouteContext(current_position, parking_lot_info)
+    if not allow_llm:
+        return _fallback_reroute(context, available_spots, vehicle_info)
+    prompt = _reroute_prompt(context, available_spots, vehicle_info, destination, parking_lot_info)
+
     try:
-        # 调用DeepSeek API
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": "你是一个智能停车导航系统，能够根据用户当前位置动态调整推荐。"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            response_format={"type": "json_object"}
-        )
-        
-        # 解析响应
-        result_text = response.choices[0].message.content
-        result = json.loads(result_text)
-        
-        selected_spot_id = result["selected_spot_id"]
-        
-        # 找到对应的车位
-        selected_spot = next((spot for spot in available_spots if spot["id"] == selected_spot_id), None)
-        
-        # 如果找不到推荐的车位，选择距离当前位置最近的
-        if not selected_spot:
-            selected_spot = sorted(
-                available_spots, 
-                key=lambda x: abs(x["row"]-current_row) + abs(x["col"]-current_col)
-            )[0]
-            reasoning = f"基于您当前位置，系统为您推荐最近的{selected_spot['id']}车位。"
-        else:
-            reasoning = result["reasoning"]
-        
-        # 从当前位置生成导航指示
-        current_position_dict = {"row": current_row, "col": current_col}
-        navigation_instructions = generate_navigation_instructions(
-            current_position_dict,
-            selected_spot
+        # 调用DeepSeek API（熔断或并发超限时直接抛出异常，走回退逻辑）
+        response = deepseek_guard.call(
+            get_client().chat.completions.create,
+            **_chat_request(REROUTE_SYSTEM_PROMPT, prompt)
         )
-        
-        return {
-            "spot": selected_spot,
-            "reasoning": reasoning,
-            "navigation_instructions": navigation_instructions
-        }
-        
+        return _resolve_reroute(response, context, available_spots)
+
     except Exception as e:
         print(f"重新路由推荐出错: {str(e)}")
-        
-        # 回退到简单算法 - 选择距离当前位置最近的车位
-        selected_spot = sorted(
-            available_spots, 
-            key=lambda x: abs(x["row"]-current_row) + abs(x["col"]-current_col)
-        )[0]
-        
-        reasoning = f"基于您当前位置，为您的{vehicle_info['name']}推荐附近的{selected_spot['id']}车位。"
-        
-        current_position_dict = {"row": current_row, "col": current_col}
-        navigation_instructions = generate_navigation_instructions(
-            current_position_dict,
-            selected_spot
+        return _fallback_reroute(context, available_spots, vehicle_info)
+
+
+async def reroute_recommendation_async(available_spots, vehicle_info, current_position, destination, parking_lot_info,
+                                       allow_llm=True):
+    """reroute_recommendation的异步版本"""
+    context = _RerouteContext(current_position, parking_lot_info)
+    if not allow_llm:
+        return _fallback_reroute(context, available_spots, vehicle_info)
+    prompt = _reroute_prompt(context, available_spots, vehicle_info, destination, parking_lot_info)
+
+    try:
+        response = await deepseek_guard.call_async(
+            get_async_client().chat.completions.create,
+            **_chat_request(REROUTE_SYSTEM_PROMPT, prompt)
         )
-        
-        return {
-            "spot": selected_spot,
-            "reasoning": reasoning,
-            "navigation_instructions": navigation_instructions
-        } 
\ No newline at end of file
+        return _resolve_reroute(response, context, available_spots)
+
+    except Exception as e:
+        print(f"重新路由推荐出错: {str(e)}")
+        return _fallback_reroute(context, available_spots, vehicle_info)
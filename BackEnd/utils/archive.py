@@ -0,0 +1,386 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timezone
+from urllib.parse import quote
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# 归档根目录，为空时不启动后台导出
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', '')
+# 后台导出间隔（秒）
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 3600))
+# Arrow IPC缓冲区压缩：zstd、lz4，为空时不压缩（查询时内存映射可零拷贝读取）
+ARCHIVE_COMPRESSION = os.environ.get('ARCHIVE_COMPRESSION', 'zstd')
+# 累计多少行写出一批分段文件，限制导出时的内存占用
+ARCHIVE_BATCH_ROWS = int(os.environ.get('ARCHIVE_BATCH_ROWS', 50000))
+
+RESERVATIONS = "reservations"
+OCCUPANCY = "occupancy"
+STATE_FILE = "_state.json"
+
+archived_rows = metrics.counter(
+    "smartpark_archive_rows_total", "Rows appended to the analytics archive", ("kind",)
+)
+
+
+def _pyarrow():
+    # pyarrow较重且为可选依赖，只在导出和查询时导入
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.dataset
+        import pyarrow.fs
+        import pyarrow.ipc
+    except ImportError:
+        raise RuntimeError("pyarrow is not installed")
+    return pyarrow
+
+
+def _reservation_schema(pa):
+    # 不导出user_id，分析不需要用户身份
+    return pa.schema([
+        ("id", pa.string()),
+        ("parking_lot_id", pa.string()),
+        ("parking_lot_name", pa.string()),
+        ("spot_id", pa.string()),
+        ("spot_type", pa.string()),
+        ("destination_name", pa.string()),
+        ("hourly_rate", pa.float64()),
+        ("reservation_time", pa.timestamp("us")),
+        ("expiration_time", pa.timestamp("us")),
+        ("status", pa.string()),
+        ("created_at", pa.timestamp("us")),
+        ("updated_at", pa.timestamp("us"))
+    ])
+
+
+def _occupancy_schema(pa):
+    return pa.schema([
+        ("parking_lot_id", pa.string()),
+        ("timestamp", pa.timestamp("s", tz="UTC")),
+        ("occupied", pa.uint32()),
+        ("peak", pa.uint32()),
+        ("total_spots", pa.uint32())
+    ])
+
+
+class _PartitionWriter:
+    """按(日期, 停车场)分区缓冲行，累计到batch_rows时每个分区写出一个Arrow IPC分段文件"""
+
+    def __init__(self, root, kind, schema, batch_rows):
+        self.root = os.path.join(root, kind)
+        self.kind = kind
+        self.schema = schema
+        self.batch_rows = batch_rows
+        self.run_id = time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+        self.rows_written = 0
+        self.files_written = 0
+        self._buffers = {}
+        self._pending = 0
+        self._seq = 0
+
+    def add(self, day, lot_id, row):
+        columns = self._buffers.get((day, lot_id))
+        if columns is None:
+            columns = self._buffers[(day, lot_id)] = {name: [] for name in self.schema.names}
+        for name, values in columns.items():
+            values.append(row[name])
+        self._pending += 1
+        if self._pending >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        pa = _pyarrow()
+        options = pa.ipc.IpcWriteOptions(compression=ARCHIVE_COMPRESSION or None)
+        for (day, lot_id), columns in self._buffers.items():
+            directory = os.path.join(self.root, f"day={day}", f"lot={quote(str(lot_id), safe='')}")
+            os.makedirs(directory, exist_ok=True)
+            name = f"part-{self.run_id}-{self._seq:05d}.arrow"
+            # 以.开头的临时文件不会被查询读取，写完后改名
+            tmp = os.path.join(directory, f".{name}.tmp")
+            table = pa.table(columns, schema=self.schema)
+            with pa.OSFile(tmp, "wb") as sink:
+                with pa.ipc.new_file(sink, self.schema, options=options) as writer:
+                    writer.write_table(table)
+            os.replace(tmp, os.path.join(directory, name))
+            self.files_written += 1
+        archived_rows.labels(self.kind).inc(self._pending)
+        self.rows_written += self._pending
+        self._buffers = {}
+        self._pending = 0
+        self._seq += 1
+
+
+class ArchiveExporter:
+    """
+    将预约记录和占用样本增量导出为按日期和停车场分区的Arrow IPC文件：
+    <root>/<reservations|occupancy>/day=YYYY-MM-DD/lot=<id>/part-*.arrow。
+    每次导出只追加新的分段文件，进度（预约的updated_at水位、各停车场已导出到的时间）记录在_state.json
+    """
+
+    def __init__(self, root, interval=ARCHIVE_INTERVAL, batch_rows=ARCHIVE_BATCH_ROWS):
+        self.root = root
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self.last_run = None
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_state(self):
+        try:
+            with open(os.path.join(self.root, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {RESERVATIONS: {"watermark": None, "ids": []}, OCCUPANCY: {}}
+
+    def _save_state(self, state):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, STATE_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def export_reservations(self, rows=None):
+        """
+        追加上次水位之后变化的预约，返回写出的行数。每次变化追加一行，查询时按id取最新的一行；
+        rows默认从数据库流式读取（须按updated_at递增）
+        """
+        pa = _pyarrow()
+        with self._run_lock:
+            state = self._load_state()
+            progress = state.get(RESERVATIONS) or {"watermark": None, "ids": []}
+            since = datetime.fromisoformat(progress["watermark"]) if progress["watermark"] else None
+            seen = set(progress["ids"])
+            if rows is None:
+                import database
+                rows = database.iter_reservation_changes(since, self.batch_rows)
+
+            schema = _reservation_schema(pa)
+            writer = _PartitionWriter(self.root, RESERVATIONS, schema, self.batch_rows)
+            latest, latest_ids = since, set(seen)
+            for row in rows:
+                updated_at = row["updated_at"]
+                # 查询条件为>=，水位时间戳上已导出的行会再次返回
+                if updated_at == since and row["id"] in seen:
+                    continue
+                if latest is None or updated_at > latest:
+                    latest, latest_ids = updated_at, set()
+                latest_ids.add(row["id"])
+
+                record = {name: row.get(name) for name in schema.names}
+                record["hourly_rate"] = float(row["hourly_rate"])
+                writer.add(row["reservation_time"].date().isoformat(), row["parking_lot_id"], record)
+            writer.flush()
+
+            # 分段文件写完后再推进水位；中途失败时重复导出的行在查询时去重
+            if latest is not None:
+                state[RESERVATIONS] = {"watermark": latest.isoformat(), "ids": sorted(latest_ids)}
+                self._save_state(state)
+            return writer.rows_written
+
+    def export_occupancy(self, history=None, now=None):
+        """追加各停车场上次导出之后已结束的占用样本（每个采样粒度一行），返回写出的行数"""
+        pa = _pyarrow()
+        if history is None:
+            from parking_data import occupancy_history as history
+
+        with self._run_lock:
+            state = self._load_state()
+            progress = state.setdefault(OCCUPANCY, {})
+            writer = _PartitionWriter(self.root, OCCUPANCY, _occupancy_schema(pa), self.batch_rows)
+            for lot_id in history.lot_ids():
+                result = history.samples(lot_id, progress.get(lot_id, 0), now)
+                if not result or not result[1]:
+                    continue
+                total, points = result
+                for t, occupied, peak in points:
+                    day = datetime.fromtimestamp(t, timezone.utc).date().isoformat()
+                    writer.add(day, lot_id, {
+                        "parking_lot_id": lot_id, "timestamp": t,
+                        "occupied": occupied, "peak": peak, "total_spots": total
+                    })
+                progress[lot_id] = points[-1][0] + history.resolution
+            writer.flush()
+            self._save_state(state)
+            return writer.rows_written
+
+    def run_once(self):
+        started = time.perf_counter()
+        reservations = self.export_reservations()
+        occupancy = self.export_occupancy()
+        self.last_run = {
+            "reservations": reservations,
+            "occupancy_samples": occupancy,
+            "seconds": round(time.perf_counter() - started, 3),
+            "finished_at": time.time()
+        }
+        logger.info(f"Archive export appended {reservations} reservation rows and {occupancy} occupancy samples")
+        return self.last_run
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Archive export failed: {e}", exc_info=True)
+
+    def start(self):
+        """启动后台定期导出线程，未配置归档目录时不启动"""
+        if self._thread is not None or not self.root:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="archive-export", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def _load(root, kind, columns, start_day=None, end_day=None, lot_ids=None):
+    """内存映射读取归档的指定列，按分区目录裁剪日期和停车场；没有归档文件时返回None"""
+    pa = _pyarrow()
+    ds = pa.dataset
+    path = os.path.join(root, kind)
+    if not os.path.isdir(path):
+        return None
+    partitioning = ds.partitioning(pa.schema([("day", pa.string()), ("lot", pa.string())]), flavor="hive")
+    dataset = ds.dataset(path, format="ipc", partitioning=partitioning,
+                         filesystem=pa.fs.LocalFileSystem(use_mmap=True))
+    if not dataset.files:
+        return None
+
+    condition = None
+    for expression in (
+        ds.field("day") >= str(start_day) if start_day is not None else None,
+        ds.field("day") <= str(end_day) if end_day is not None else None,
+        ds.field("lot").isin([str(lot_id) for lot_id in lot_ids]) if lot_ids else None
+    ):
+        if expression is not None:
+            condition = expression if condition is None else condition & expression
+    return dataset.to_table(columns=columns, filter=condition)
+
+
+def _latest_reservations(pa, table):
+    """每个预约只保留updated_at最新的一行（重复导出的相同行也只保留一行）"""
+    latest = table.group_by("id").aggregate([("updated_at", "max")])
+    latest = latest.select(["id", "updated_at_max"]).rename_columns(["id", "updated_at"])
+    table = table.join(latest, keys=["id", "updated_at"], join_type="inner")
+    return table.group_by(table.column_names).aggregate([])
+
+
+def _with_stay_hours(pa, table):
+    """停留时长（小时）：取消的预约到取消时间为止，其余到过期时间为止"""
+    pc = pa.compute
+    canceled = pc.equal(table["status"], "canceled")
+    ended = pc.if_else(canceled, pc.min_element_wise(table["updated_at"], table["expiration_time"]),
+                       table["expiration_time"])
+    micros = pc.cast(pc.subtract(ended, table["reservation_time"]), pa.int64())
+    hours = pc.divide(pc.cast(pc.max_element_wise(micros, 0), pa.float64()), 3600 * 1e6)
+    return table.append_column("stay_hours", hours)
+
+
+_RESERVATION_COLUMNS = ["id", "spot_type", "hourly_rate", "reservation_time",
+                        "expiration_time", "status", "updated_at"]
+
+
+def peak_occupancy(root, start_day=None, end_day=None, lot_ids=None):
+    """各停车场在日期范围内的峰值占用"""
+    table = _load(root, OCCUPANCY, ["parking_lot_id", "peak", "total_spots"], start_day, end_day, lot_ids)
+    if table is None or table.num_rows == 0:
+        return []
+    grouped = table.group_by("parking_lot_id").aggregate([("peak", "max"), ("total_spots", "max")])
+    return [
+        {
+            "lot_id": row["parking_lot_id"],
+            "peak_occupied": row["peak_max"],
+            "total_spots": row["total_spots_max"],
+            "peak_ratio": round(row["peak_max"] / row["total_spots_max"], 4) if row["total_spots_max"] else 0.0
+        }
+        for row in grouped.sort_by("parking_lot_id").to_pylist()
+    ]
+
+
+def average_stay_by_spot_type(root, start_day=None, end_day=None, lot_ids=None):
+    """各车位类型的预约数和平均停留时长（小时），日期按预约开始时间"""
+    pa = _pyarrow()
+    table = _load(root, RESERVATIONS, _RESERVATION_COLUMNS, start_day, end_day, lot_ids)
+    if table is None or table.num_rows == 0:
+        return []
+    table = _with_stay_hours(pa, _latest_reservations(pa, table))
+    grouped = table.group_by("spot_type").aggregate([("stay_hours", "mean"), ("stay_hours", "count")])
+    return [
+        {
+            "spot_type": row["spot_type"],
+            "reservations": row["stay_hours_count"],
+            "avg_stay_hours": round(row["stay_hours_mean"], 3)
+        }
+        for row in grouped.sort_by("spot_type").to_pylist()
+    ]
+
+
+def revenue_by_hourly_rate(root, start_day=None, end_day=None, lot_ids=None):
+    """按小时费率汇总预约数、计费时长和收入（停留时长 × 费率）"""
+    pa = _pyarrow()
+    pc = pa.compute
+    table = _load(root, RESERVATIONS, _RESERVATION_COLUMNS, start_day, end_day, lot_ids)
+    if table is None or table.num_rows == 0:
+        return []
+    table = _with_stay_hours(pa, _latest_reservations(pa, table))
+    table = table.append_column("revenue", pc.multiply(table["stay_hours"], table["hourly_rate"]))
+    grouped = table.group_by("hourly_rate").aggregate(
+        [("id", "count"), ("stay_hours", "sum"), ("revenue", "sum")]
+    )
+    return [
+        {
+            "hourly_rate": row["hourly_rate"],
+            "reservations": row["id_count"],
+            "hours": round(row["stay_hours_sum"], 3),
+            "revenue": round(row["revenue_sum"], 2)
+        }
+        for row in grouped.sort_by("hourly_rate").to_pylist()
+    ]
+
+
+QUERIES = {
+    "peak-occupancy": peak_occupancy,
+    "average-stay": average_stay_by_spot_type,
+    "revenue": revenue_by_hourly_rate
+}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export or query the SmartPark analytics archive")
+    parser.add_argument("command", choices=["export"] + list(QUERIES))
+    parser.add_argument("--root", default=ARCHIVE_DIR or "archive", help="archive directory")
+    parser.add_argument("--start-day", help="first day (YYYY-MM-DD) to include")
+    parser.add_argument("--end-day", help="last day (YYYY-MM-DD) to include")
+    parser.add_argument("--lot", action="append", dest="lot_ids", help="restrict to a parking lot (repeatable)")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        # 占用样本只存在于服务进程内存中，命令行只导出预约
+        rows = ArchiveExporter(args.root).export_reservations()
+        print(json.dumps({"reservations": rows}))
+    else:
+        result = QUERIES[args.command](args.root, args.start_day, args.end_day, args.lot_ids)
+        print(json.dumps(result, indent=2))
+
+
+archive_exporter = ArchiveExporter(ARCHIVE_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import math
+import heapq
+import bisect
+
+# 一个车位的长度（米），超长车辆按此换算需要的连续车位数
+SPOT_LENGTH_M = float(os.environ.get('SPOT_LENGTH_M', 5.5))
+# 选择连续车位时，比需要的更长的空闲段每多一个车位增加的代价（减少碎片）
+BLOCK_WASTE_PENALTY = float(os.environ.get('BLOCK_WASTE_PENALTY', 2.0))
+
+ROW = "row"
+COL = "col"
+
+
+def cells_for_vehicle(vehicle_info):
+    """车辆需要的连续车位数"""
+    length = float(vehicle_info.get("length", 0) or 0)
+    return max(1, math.ceil(length / SPOT_LENGTH_M))
+
+
+class FreeRunIndex:
+    """
+    停车场的空闲连续段索引：对每一行和每一列记录极大的连续空闲车位段，
+    并按段长分桶。占用变化时只拆分或合并相邻的段，查询只检查足够长的段，不扫描整个网格
+    """
+
+    def __init__(self, cells, distance):
+        """
+        cells为{(row, col): 是否空闲}，只包含车位格子（通道格子会截断连续段）；
+        distance为{(row, col): 到入口的距离}，用于在候选段中选择
+        """
+        self._free = dict(cells)
+        self._distance = distance
+        # (方向, 行/列号) -> 段起点有序列表，以及起点 -> 终点（含）
+        self._starts = {}
+        self._ends = {}
+        # (方向, 段长) -> {(行/列号, 起点)}
+        self._by_length = {}
+        # (方向, 段长) -> [(靠近入口一端的距离, 行/列号, 起点)]小顶堆，删除的段在取堆顶时丢弃
+        self._heaps = {}
+
+        for orientation in (ROW, COL):
+            lines = {}
+            for (row, col), free in self._free.items():
+                if free:
+                    line, pos = (row, col) if orientation == ROW else (col, row)
+                    lines.setdefault(line, []).append(pos)
+            for line, positions in lines.items():
+                positions.sort()
+                start = prev = positions[0]
+                for pos in positions[1:]:
+                    if pos != prev + 1:
+                        self._add_run(orientation, line, start, prev)
+                        start = pos
+                    prev = pos
+                self._add_run(orientation, line, start, prev)
+
+    def _cell(self, orientation, line, pos):
+        return (line, pos) if orientation == ROW else (pos, line)
+
+    def _is_free(self, orientation, line, pos):
+        return self._free.get(self._cell(orientation, line, pos), False)
+
+    def _add_run(self, orientation, line, start, end):
+        key = (orientation, line)
+        bisect.insort(self._starts.setdefault(key, []), start)
+        self._ends.setdefault(key, {})[start] = end
+        bucket = (orientation, end - start + 1)
+        self._by_length.setdefault(bucket, set()).add((line, start))
+        score = min(self._distance[self._cell(orientation, line, start)],
+                    self._distance[self._cell(orientation, line, end)])
+        heapq.heappush(self._heaps.setdefault(bucket, []), (score, line, start))
+
+    def _remove_run(self, orientation, line, start):
+        key = (orientation, line)
+        starts = self._starts[key]
+        del starts[bisect.bisect_left(starts, start)]
+        end = self._ends[key].pop(start)
+        bucket = (orientation, end - start + 1)
+        runs = self._by_length[bucket]
+        runs.discard((line, start))
+        if not runs:
+            del self._by_length[bucket]
+            del self._heaps[bucket]
+        return end
+
+    def _best_in(self, bucket):
+        """段长分桶中靠近入口的段，顺带丢弃已删除的堆元素"""
+        runs = self._by_length[bucket]
+        heap = self._heaps[bucket]
+        if len(heap) > 2 * len(runs) + 32:
+            heap = self._heaps[bucket] = [entry for entry in heap if (entry[1], entry[2]) in runs]
+            heapq.heapify(heap)
+        while (heap[0][1], heap[0][2]) not in runs:
+            heapq.heappop(heap)
+        return heap[0]
+
+    def _run_containing(self, orientation, line, pos):
+        starts = self._starts.get((orientation, line), [])
+        i = bisect.bisect_right(starts, pos) - 1
+        return starts[i] if i >= 0 else None
+
+    def set_free(self, cell, free):
+        """更新一个车位的空闲状态，拆分或合并所在行和列的连续段"""
+        if cell not in self._free or self._free[cell] == free:
+            return
+        self._free[cell] = free
+        row, col = cell
+        for orientation, line, pos in ((ROW, row, col), (COL, col, row)):
+            if free:
+                start = end = pos
+                if self._is_free(orientation, line, pos - 1):
+                    start = self._run_containing(orientation, line, pos - 1)
+                    self._remove_run(orientation, line, start)
+                if self._is_free(orientation, line, pos + 1):
+                    end = self._remove_run(orientation, line, pos + 1)
+                self._add_run(orientation, line, start, end)
+            else:
+                start = self._run_containing(orientation, line, pos)
+                end = self._remove_run(orientation, line, start)
+                if start < pos:
+                    self._add_run(orientation, line, start, pos - 1)
+                if pos < end:
+                    self._add_run(orientation, line, pos + 1, end)
+
+    def find(self, k, orientation=None):
+        """
+        找k个连续空闲车位，返回[(row, col), ...]（按行/列顺序），没有时返回None。
+        每种段长只看端点离入口最近的段，从该端取k个车位；段比需要的越长附加的代价越高
+        """
+        best = None
+        for bucket in sorted(self._by_length, key=lambda b: b[1]):
+            run_orientation, length = bucket
+            if length < k or (orientation is not None and run_orientation != orientation):
+                continue
+            waste = (length - k) * BLOCK_WASTE_PENALTY
+            # 距离非负，更长的段不可能再优于已找到的结果
+            if best is not None and waste >= best[0]:
+                break
+            score, line, start = self._best_in(bucket)
+            candidate = (score + waste, run_orientation, line, start, length)
+            if best is None or candidate < best:
+                best = candidate
+        if best is None:
+            return None
+        _, run_orientation, line, start, length = best
+        end = start + length - 1
+        if self._distance[self._cell(run_orientation, line, start)] <= self._distance[self._cell(run_orientation, line, end)]:
+            first = start
+        else:
+            first = end - k + 1
+        return [self._cell(run_orientation, line, pos) for pos in range(first, first + k)]
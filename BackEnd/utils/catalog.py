@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import namedtuple
+from types import MappingProxyType
+from utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+# 一次加载结果：不可变数据、预序列化的响应体和对应的强ETag
+CatalogSnapshot = namedtuple("CatalogSnapshot", ["data", "body", "etag"])
+
+
+def freeze(value):
+    """递归转换为不可变结构（dict -> MappingProxyType, list -> tuple）"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """freeze的逆操作，返回可修改、可序列化的副本"""
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+class StaticCatalog:
+    """
+    从JSON数据文件加载的静态目录：数据只加载一次并预先序列化成
+    {"status": "success", "data": ...} 响应体；文件修改后自动重新加载
+    """
+
+    def __init__(self, path, key, check_interval=2.0):
+        self.path = path
+        self.key = key
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._snapshot = None
+        self._reload()
+
+    def _reload(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)[self.key]
+        body = json_codec.dumps({"status": "success", "data": data})
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        # 整体替换引用，读取方无需加锁
+        self._snapshot = CatalogSnapshot(freeze(data), body, etag)
+        self._mtime = mtime
+        logger.info(f"Loaded catalog '{self.key}' from {self.path} (etag {etag})")
+
+    def current(self):
+        """返回当前快照；距上次检查超过check_interval时检查文件是否变化"""
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    try:
+                        if os.stat(self.path).st_mtime_ns != self._mtime:
+                            self._reload()
+                    except (OSError, ValueError, KeyError) as e:
+                        # 文件被删除或内容不合法时继续使用上一次成功加载的数据
+                        logger.error(f"Failed to reload catalog {self.path}: {e}")
+        return self._snapshot
@@ -0,0 +1,167 @@
+import os
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TimerWheel:
+    """
+    哈希时间轮：时间按tick_seconds划分，超时时间映射到slots个槽之一。
+    添加/取消为O(1)；每个tick只检查一个槽，槽内超过本轮的条目保留到下一轮，
+    因此不需要周期性地扫描全部条目
+    """
+
+    def __init__(self, tick_seconds=1.0, slots=3600, now=None):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self._wheel = [dict() for _ in range(slots)]
+        # key -> (槽编号, 到期tick, 负载)
+        self._entries = {}
+        self._current_tick = self._tick_of(time.time() if now is None else now)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _tick_of(self, timestamp):
+        return int(timestamp // self.tick_seconds)
+
+    def schedule(self, key, deadline, payload=None):
+        """在deadline（Unix时间戳）到期；已过期的条目在下一次advance时触发"""
+        self.cancel(key)
+        tick = max(self._tick_of(deadline), self._current_tick + 1)
+        slot = tick % self.slots
+        self._wheel[slot][key] = tick
+        self._entries[key] = (slot, tick, payload)
+
+    def cancel(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        del self._wheel[entry[0]][key]
+        return True
+
+    def advance(self, now):
+        """推进到now，返回所有到期条目[(key, payload), ...]"""
+        target_tick = self._tick_of(now)
+        if target_tick <= self._current_tick:
+            return []
+        # 落后超过一整圈时每个槽只需检查一次
+        ticks = min(target_tick - self._current_tick, self.slots)
+        expired = []
+        for offset in range(1, ticks + 1):
+            slot = self._wheel[(self._current_tick + offset) % self.slots]
+            if not slot:
+                continue
+            due = [key for key, tick in slot.items() if tick <= target_tick]
+            for key in due:
+                del slot[key]
+                expired.append((key, self._entries.pop(key)[2]))
+        self._current_tick = target_tick
+        return expired
+
+
+class ReservationExpiryScheduler:
+    """
+    预约过期调度器：有效预约按到期时间放入时间轮（由utils.reconcile在启动时加载），
+    每个tick批量处理到期预约——一条UPDATE ... WHERE id IN (...)更新状态，并释放内存中对应的车位
+    """
+
+    def __init__(self, tick_seconds=1.0, slots=3600, batch_size=1000, retry_seconds=5.0, max_retry_seconds=300.0):
+        self.tick_seconds = tick_seconds
+        self.batch_size = batch_size
+        # 数据库更新失败的批次按指数退避重新放回时间轮
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._wheel = TimerWheel(tick_seconds, slots)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.expired_total = 0
+        self.retried_total = 0
+
+    def __len__(self):
+        return len(self._wheel)
+
+    def schedule(self, reservation_id, expiration_time):
+        """expiration_time为datetime（数据库时间，按本地时区解释）或Unix时间戳"""
+        deadline = expiration_time if isinstance(expiration_time, (int, float)) else expiration_time.timestamp()
+        with self._lock:
+            self._wheel.schedule(reservation_id, deadline)
+
+    def cancel(self, reservation_id):
+        with self._lock:
+            return self._wheel.cancel(reservation_id)
+
+    def tick(self, now=None):
+        """处理到期的预约，返回本次过期的预约ID列表（数据库更新失败、稍后重试的不在其中）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = self._wheel.advance(now)
+        if not expired:
+            return []
+
+        # 延迟导入，避免循环依赖
+        import database
+        from parking_data import release_reservations
+
+        expired_ids = []
+        for start in range(0, len(expired), self.batch_size):
+            batch = expired[start:start + self.batch_size]
+            ids = [reservation_id for reservation_id, _ in batch]
+            try:
+                result = database.expire_reservations(ids)
+                error = result["message"] if result["status"] == "error" else None
+            except Exception as e:
+                error = str(e)
+            if error is None:
+                expired_ids.extend(ids)
+                continue
+            # 数据库中仍为有效预约，车位保持占用，稍后重试
+            logger.error(f"Failed to expire {len(ids)} reservations, retrying later: {error}")
+            with self._lock:
+                for reservation_id, attempts in batch:
+                    attempts = attempts or 0
+                    delay = min(self.retry_seconds * 2 ** attempts, self.max_retry_seconds)
+                    if reservation_id not in self._wheel:
+                        self._wheel.schedule(reservation_id, now + delay, attempts + 1)
+            self.retried_total += len(ids)
+        if not expired_ids:
+            return []
+
+        # 只释放数据库已更新的预约，按停车场分组，每个停车场一次批量释放
+        release_reservations(expired_ids)
+
+        self.expired_total += len(expired_ids)
+        logger.info(f"Expired {len(expired_ids)} reservations")
+        return expired_ids
+
+    def _run(self):
+        while not self._stop.wait(self.tick_seconds):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Reservation expiry tick failed: {e}", exc_info=True)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reservation-expiry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+expiry_scheduler = ReservationExpiryScheduler(
+    tick_seconds=float(os.environ.get('RESERVATION_EXPIRY_TICK', 1)),
+    slots=int(os.environ.get('RESERVATION_EXPIRY_SLOTS', 3600))
+)
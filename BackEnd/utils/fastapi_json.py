@@ -0,0 +1,9 @@
+from fastapi.responses import JSONResponse
+from utils.json_codec import dumps
+
+
+class FastJSONResponse(JSONResponse):
+    """使用utils.json_codec（orjson优先）序列化的FastAPI默认响应类"""
+
+    def render(self, content):
+        return dumps(content)
@@ -0,0 +1,260 @@
+import os
+import heapq
+import logging
+from parking_data import parking_lots, get_available_spots, claim_spots, claim_block
+from utils.navigation import generate_navigation_instructions
+from utils import tracing
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # 可选依赖，未安装时使用下面的纯Python求解
+    linear_sum_assignment = None
+
+logger = logging.getLogger(__name__)
+
+# 单次批量分配的车辆上限。求解为O(n²m)，m为候选车位数（不超过n×车位类型数×2）；
+# 纯Python求解在50辆车、400个候选车位时约6ms，安装scipy后可适当调高
+FLEET_MAX_VEHICLES = int(os.environ.get('FLEET_MAX_VEHICLES', 50))
+# 求解期间车位被其他请求占用时重新求解的次数
+FLEET_CLAIM_ATTEMPTS = int(os.environ.get('FLEET_CLAIM_ATTEMPTS', 3))
+
+LARGE_VEHICLES = {"truck", "rv", "pickup", "van", "bus"}
+
+# 车位类型不匹配时附加的代价（与行驶距离同单位），None表示不可停放
+TYPE_PENALTIES = {
+    # 车辆尺寸: {车位类型: 代价}
+    "large": {"standard": 20, "large": 0, "compact": None},
+    "standard": {"standard": 0, "large": 10, "compact": 15},
+    "compact": {"standard": 3, "large": 10, "compact": 0},
+}
+# 非电动车占用充电车位、无障碍需求车辆停在普通车位的代价
+EV_SPOT_PENALTY = 25
+ACCESSIBLE_ELSEWHERE_PENALTY = 30
+
+
+class FleetAllocationError(Exception):
+    """无法为整个车队分配车位（兼容车位不足或反复冲突），不占用任何车位"""
+
+
+def vehicle_profile(vehicle_info):
+    """
+    决定代价的车辆特征：(尺寸, 是否电动, 是否需要无障碍车位, 使用的距离字段)。
+    特征相同的车辆共用同一行代价
+    """
+    width = float(vehicle_info.get("width", 0) or 0)
+    length = float(vehicle_info.get("length", 0) or 0)
+    if vehicle_info.get("id") in LARGE_VEHICLES or width >= 2.1 or length >= 5.2:
+        size = "large"
+    elif 0 < length <= 4.0:
+        size = "compact"
+    else:
+        size = "standard"
+    # 与单车回退算法一致：大型车辆看离出口的距离，其他车辆看离入口的距离
+    distance_key = "distance_to_exit" if size == "large" else "distance_to_entrance"
+    return size, bool(vehicle_info.get("electric")), bool(vehicle_info.get("accessible")), distance_key
+
+
+def spot_cost(profile, spot):
+    """车辆停在该车位的代价，不可停放时返回None"""
+    size, electric, accessible, distance_key = profile
+    spot_type = spot["type"]
+    if spot_type == "disabled":
+        if not accessible:
+            return None
+        penalty = 0
+    elif spot_type == "ev_charging":
+        penalty = 0 if electric else EV_SPOT_PENALTY
+    else:
+        penalty = TYPE_PENALTIES[size][spot_type]
+        if penalty is None:
+            return None
+        if accessible:
+            penalty += ACCESSIBLE_ELSEWHERE_PENALTY
+    return spot[distance_key] + penalty
+
+
+def candidate_spots(available_spots, profiles, n):
+    """
+    代价只取决于车位类型和一个距离字段，因此对每种(类型, 距离字段)只保留最近的n个车位，
+    不影响最优解（被排除的车位总能换成同类型中更近且未被使用的车位）
+    """
+    by_type = {}
+    for spot in available_spots:
+        by_type.setdefault(spot["type"], []).append(spot)
+    keys = {profile[3] for profile in profiles}
+    chosen = {}
+    for spots in by_type.values():
+        for key in keys:
+            for spot in heapq.nsmallest(n, spots, key=lambda s: (s[key], s["id"])):
+                chosen[spot["id"]] = spot
+    return [chosen[spot_id] for spot_id in sorted(chosen)]
+
+
+def min_cost_assignment(cost):
+    """
+    最小代价分配，cost为n行m列（n <= m），返回每行分配到的列下标。
+    安装了scipy时使用linear_sum_assignment，否则使用纯Python的匈牙利算法
+    """
+    if linear_sum_assignment is None or not cost:
+        return _hungarian(cost)
+    if len(cost) > len(cost[0]):
+        raise ValueError("more rows than columns")
+    rows, columns = linear_sum_assignment(cost)
+    assignment = [0] * len(cost)
+    for i, j in zip(rows, columns):
+        assignment[i] = int(j)
+    return assignment
+
+
+def _hungarian(cost):
+    """匈牙利算法（带势的最短增广路，O(n²m)），作为未安装scipy时的实现"""
+    n = len(cost)
+    m = len(cost[0]) if n else 0
+    if n > m:
+        raise ValueError("more rows than columns")
+    inf = float("inf")
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    # p[j]为分配到第j列的行（1起始，0表示未分配），way用于回溯增广路
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            ui0 = u[i0]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - ui0 - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    assignment = [0] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+@tracing.traced("fleet.plan")
+def plan_assignment(available_spots, vehicles):
+    """为车队求总代价最小的分配，返回与vehicles顺序一致的[(spot, cost), ...]"""
+    n = len(vehicles)
+    profiles = [vehicle_profile(vehicle) for vehicle in vehicles]
+    spots = candidate_spots(available_spots, profiles, n)
+    if len(spots) < n:
+        raise FleetAllocationError(f"Only {len(spots)} spots available for {n} vehicles")
+
+    # 每种车辆特征只计算一行代价，不可停放的位置先记为None
+    rows = {}
+    for profile in profiles:
+        if profile not in rows:
+            rows[profile] = [spot_cost(profile, spot) for spot in spots]
+
+    # 不可停放的代价取大于任何可行分配总代价的值，存在可行解时一定不会被选中
+    feasible = [c for row in rows.values() for c in row if c is not None]
+    blocked = (max(feasible, default=0) + 1) * (n + 1)
+    matrix = {
+        profile: [blocked if c is None else c for c in row]
+        for profile, row in rows.items()
+    }
+    assignment = min_cost_assignment([matrix[profile] for profile in profiles])
+
+    plan = []
+    for profile, column in zip(profiles, assignment):
+        cost = rows[profile][column]
+        if cost is None:
+            raise FleetAllocationError("Not enough compatible spots for every vehicle")
+        plan.append((spots[column], cost))
+    return plan
+
+
+def allocate_fleet(lot_id, vehicles):
+    """
+    为一组车辆联合分配车位并一次性占用：全部成功或全部不占用。
+    求解在锁外进行，占用时若有车位已被其他请求占用则重新求解
+    """
+    if not isinstance(vehicles, list) or not all(isinstance(v, dict) for v in vehicles):
+        raise ValueError("vehicles must be a list of vehicle objects")
+    if not vehicles:
+        raise ValueError("vehicles must not be empty")
+    if len(vehicles) > FLEET_MAX_VEHICLES:
+        raise ValueError(f"At most {FLEET_MAX_VEHICLES} vehicles per request")
+
+    for attempt in range(FLEET_CLAIM_ATTEMPTS):
+        plan = plan_assignment(get_available_spots(lot_id), vehicles)
+        if claim_spots(lot_id, [spot["id"] for spot, _ in plan]):
+            break
+        logger.info(f"Fleet allocation for {lot_id} conflicted, retrying ({attempt + 1})")
+    else:
+        raise FleetAllocationError("Spots changed during allocation, please retry")
+
+    parking_lot = parking_lots[lot_id]
+    assignments = [
+        {
+            "vehicle": vehicle,
+            "spot": spot,
+            "cost": round(cost, 2),
+            "navigation_instructions": generate_navigation_instructions(
+                parking_lot["entrance"], spot, parking_lot
+            )
+        }
+        for vehicle, (spot, cost) in zip(vehicles, plan)
+    ]
+    return {
+        "assignments": assignments,
+        "total_cost": round(sum(cost for _, cost in plan), 2)
+    }
+
+
+def allocate_block(lot_id, size, orientation=None):
+    """
+    为超长车辆或需要相邻车位的团体占用size个同一行或同一列的连续车位，
+    返回的block_id用于一次释放全部车位
+    """
+    if not isinstance(size, int) or size < 1:
+        raise ValueError("size must be a positive integer")
+    if orientation not in (None, "row", "col"):
+        raise ValueError("orientation must be 'row' or 'col'")
+
+    claimed = claim_block(lot_id, size, orientation)
+    if claimed is None:
+        raise FleetAllocationError(f"No {size} contiguous free spots available")
+    block_id, spots = claimed
+
+    parking_lot = parking_lots[lot_id]
+    # 导航到连续车位中离入口最近的一个
+    anchor = min(spots, key=lambda spot: spot["distance_to_entrance"])
+    return {
+        "block_id": block_id,
+        "spot": anchor,
+        "spots": spots,
+        "orientation": "row" if len({spot["row"] for spot in spots}) == 1 else "col",
+        "navigation_instructions": generate_navigation_instructions(
+            parking_lot["entrance"], anchor, parking_lot
+        )
+    }
@@ -0,0 +1,182 @@
+import json
+import math
+import threading
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8
+# 每度纬度对应的米数（近似）
+METERS_PER_DEGREE = 111320.0
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """两点间的球面距离（米）"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class LotIndex:
+    """
+    停车场空间索引：按固定经纬度网格分桶（类似geohash网格），
+    半径查询只扫描覆盖范围内的格子，k近邻查询按环逐层向外扩展
+    """
+
+    def __init__(self, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        self._cells = {}
+        self._lots = {}
+        # 已占用格子的包围盒，用于限定k近邻的最大扩展环数
+        self._bounds = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lots)
+
+    def __contains__(self, lot_id):
+        return lot_id in self._lots
+
+    def _cell_of(self, lat, lng):
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg)))
+
+    def get(self, lot_id):
+        return self._lots.get(lot_id)
+
+    def add(self, lot):
+        """新增或更新一个停车场，增量维护索引"""
+        lat = lot["location"]["lat"]
+        lng = lot["location"]["lng"]
+        cell = self._cell_of(lat, lng)
+        with self._lock:
+            previous = self._lots.get(lot["id"])
+            if previous is not None:
+                old_cell = self._cell_of(previous["location"]["lat"], previous["location"]["lng"])
+                self._cells[old_cell] = [l for l in self._cells[old_cell] if l["id"] != lot["id"]]
+            self._lots[lot["id"]] = lot
+            self._cells.setdefault(cell, []).append(lot)
+            if self._bounds is None:
+                self._bounds = (cell[0], cell[1], cell[0], cell[1])
+            else:
+                min_lat, min_lng, max_lat, max_lng = self._bounds
+                self._bounds = (min(min_lat, cell[0]), min(min_lng, cell[1]),
+                                max(max_lat, cell[0]), max(max_lng, cell[1]))
+
+    def load(self, lots):
+        for lot in lots:
+            self.add(lot)
+        return len(lots)
+
+    def load_file(self, path):
+        """从本地JSON数据文件加载停车场目录"""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        count = self.load(data["parking_lots"] if isinstance(data, dict) else data)
+        logger.info(f"Loaded {count} parking lots into spatial index from {path}")
+        return count
+
+    @staticmethod
+    def _matches(lot, features):
+        return not features or features.issubset(lot.get("features", ()))
+
+    def _cells_in_ring(self, center, ring):
+        c_lat, c_lng = center
+        if ring == 0:
+            yield center
+            return
+        for d_lng in range(-ring, ring + 1):
+            yield (c_lat - ring, c_lng + d_lng)
+            yield (c_lat + ring, c_lng + d_lng)
+        for d_lat in range(-ring + 1, ring):
+            yield (c_lat + d_lat, c_lng - ring)
+            yield (c_lat + d_lat, c_lng + ring)
+
+    def within_radius(self, lat, lng, radius_m, features=None):
+        """返回半径内的所有停车场，按距离升序，元素为(距离米, 停车场)"""
+        features = set(features or ())
+        d_lat = radius_m / METERS_PER_DEGREE
+        d_lng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        min_cell = self._cell_of(lat - d_lat, lng - d_lng)
+        max_cell = self._cell_of(lat + d_lat, lng + d_lng)
+
+        results = []
+        with self._lock:
+            if self._bounds is None:
+                return []
+            # 扫描范围限定在已占用格子的包围盒内；仍比已占用格子数多时直接遍历已占用格子
+            min_lat = max(min_cell[0], self._bounds[0])
+            min_lng = max(min_cell[1], self._bounds[1])
+            max_lat = min(max_cell[0], self._bounds[2])
+            max_lng = min(max_cell[1], self._bounds[3])
+            if min_lat > max_lat or min_lng > max_lng:
+                return []
+            if (max_lat - min_lat + 1) * (max_lng - min_lng + 1) > len(self._cells):
+                cells = [
+                    lots for (cell_lat, cell_lng), lots in self._cells.items()
+                    if min_lat <= cell_lat <= max_lat and min_lng <= cell_lng <= max_lng
+                ]
+            else:
+                cells = [
+                    self._cells.get((cell_lat, cell_lng), ())
+                    for cell_lat in range(min_lat, max_lat + 1)
+                    for cell_lng in range(min_lng, max_lng + 1)
+                ]
+            for lots in cells:
+                for lot in lots:
+                    if not self._matches(lot, features):
+                        continue
+                    location = lot["location"]
+                    distance = haversine_m(lat, lng, location["lat"], location["lng"])
+                    if distance <= radius_m:
+                        results.append((distance, lot))
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def nearest(self, lat, lng, k, features=None, max_radius_m=None):
+        """k近邻查询，按环向外扩展直到剩余格子不可能更近"""
+        features = set(features or ())
+        center = self._cell_of(lat, lng)
+        # 一个格子在东西方向上的最短宽度（米），用于判断何时可以停止扩展
+        cell_m = self.cell_deg * METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)
+        cell_m = min(cell_m, self.cell_deg * METERS_PER_DEGREE)
+
+        best = []
+        with self._lock:
+            if self._bounds is None:
+                return []
+            min_lat, min_lng, max_lat, max_lng = self._bounds
+            max_ring = max(abs(min_lat - center[0]), abs(max_lat - center[0]),
+                           abs(min_lng - center[1]), abs(max_lng - center[1]))
+            for ring in range(max_ring + 1):
+                # 第ring环中的点与查询点至少相隔(ring - 1)个格子宽度
+                if len(best) >= k and -best[0][0] <= (ring - 1) * cell_m:
+                    break
+                if max_radius_m is not None and (ring - 1) * cell_m > max_radius_m:
+                    break
+                for cell in self._cells_in_ring(center, ring):
+                    for lot in self._cells.get(cell, ()):
+                        if not self._matches(lot, features):
+                            continue
+                        location = lot["location"]
+                        distance = haversine_m(lat, lng, location["lat"], location["lng"])
+                        if max_radius_m is not None and distance > max_radius_m:
+                            continue
+                        # 最大堆保存当前最近的k个
+                        item = (-distance, lot["id"], lot)
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, item)
+        return sorted(((-d, lot) for d, _, lot in best), key=lambda item: item[0])
+
+
+def paginate(items, page, page_size):
+    """按页切分结果，page从1开始"""
+    page = max(1, page)
+    page_size = max(1, page_size)
+    start = (page - 1) * page_size
+    return items[start:start + page_size]
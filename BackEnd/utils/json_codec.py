@@ -0,0 +1,52 @@
+import json
+import uuid
+import datetime
+from decimal import Decimal
+from types import MappingProxyType
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时退回标准库，输出格式保持一致
+    orjson = None
+
+
+def _default(obj):
+    """序列化标准JSON不支持的类型（数据库行中的datetime/Decimal等）"""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, MappingProxyType):
+        return dict(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode("utf-8")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        """序列化为UTF-8编码的JSON字节串"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def loads(data):
+        return orjson.loads(data)
+else:
+    BACKEND = "json"
+
+    def dumps(obj):
+        """序列化为UTF-8编码的JSON字节串"""
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(data):
+        return json.loads(data)
+
+
+def dumps_str(obj):
+    return dumps(obj).decode("utf-8")
@@ -0,0 +1,112 @@
+import base64
+import threading
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖，未安装时只提供JSON紧凑格式
+    msgpack = None
+
+COMPACT_FORMAT = "compact-v1"
+COMPACT_MIMETYPE = "application/vnd.smartpark.compact+json"
+MSGPACK_MIMETYPE = "application/msgpack"
+
+# 格子类型编码，0表示通道（非车位）
+TYPE_CODES = ("aisle", "standard", "disabled", "ev_charging", "compact", "large")
+_TYPE_INDEX = {name: index for index, name in enumerate(TYPE_CODES)}
+
+# 车位类型的游程编码只与布局有关，按lot_id缓存: lot_id -> (layout_etag, rle)
+_types_cache = {}
+_types_lock = threading.Lock()
+
+
+def _cell_types_rle(parking_lot):
+    """按行优先顺序对格子类型做游程编码，返回[code, run, code, run, ...]"""
+    rows, cols = parking_lot["rows"], parking_lot["cols"]
+    cells = [0] * (rows * cols)
+    for spot in parking_lot["spots"].values():
+        cells[spot["row"] * cols + spot["col"]] = _TYPE_INDEX.get(spot["type"], 1)
+
+    rle = []
+    for code in cells:
+        if rle and rle[-2] == code:
+            rle[-1] += 1
+        else:
+            rle.extend((code, 1))
+    return rle
+
+
+def cell_types_rle(parking_lot):
+    lot_id = parking_lot["id"]
+    with _types_lock:
+        cached = _types_cache.get(lot_id)
+    if cached is None or cached[0] != parking_lot["layout_etag"]:
+        cached = (parking_lot["layout_etag"], _cell_types_rle(parking_lot))
+        with _types_lock:
+            _types_cache[lot_id] = cached
+    return cached[1]
+
+
+def occupancy_bitset(parking_lot):
+    """按行优先顺序的占用位图，第i个格子对应第i//8字节的第i%8位"""
+    cols = parking_lot["cols"]
+    bits = bytearray((parking_lot["rows"] * cols + 7) // 8)
+    for spot in parking_lot["spots"].values():
+        if spot["is_occupied"]:
+            index = spot["row"] * cols + spot["col"]
+            bits[index >> 3] |= 1 << (index & 7)
+    return bytes(bits)
+
+
+def encode_compact(parking_lot, binary=False):
+    """
+    紧凑表示：尺寸、出入口、格子类型游程编码和占用位图。
+    车位ID为spot_{row}_{col}，到出入口的距离由客户端按布局自行计算。
+    binary=True时位图保留为原始字节（用于MessagePack）
+    """
+    bitset = occupancy_bitset(parking_lot)
+    return {
+        "format": COMPACT_FORMAT,
+        "id": parking_lot["id"],
+        "name": parking_lot["name"],
+        "version": parking_lot["version"],
+        "layout_etag": parking_lot["layout_etag"],
+        "rows": parking_lot["rows"],
+        "cols": parking_lot["cols"],
+        "entrance": [parking_lot["entrance"]["row"], parking_lot["entrance"]["col"]],
+        "exit": [parking_lot["exit"]["row"], parking_lot["exit"]["col"]],
+        "type_codes": TYPE_CODES,
+        "types": cell_types_rle(parking_lot),
+        "occupancy": bitset if binary else base64.b64encode(bitset).decode("ascii")
+    }
+
+
+def encode_msgpack(parking_lot):
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.packb(encode_compact(parking_lot, binary=True), use_bin_type=True)
+
+
+def decode_compact(data):
+    """将紧凑表示还原为spot_id -> {row, col, type, is_occupied}"""
+    cols = data["cols"]
+    occupancy = data["occupancy"]
+    if isinstance(occupancy, str):
+        occupancy = base64.b64decode(occupancy)
+    type_codes = data["type_codes"]
+    rle = data["types"]
+
+    spots = {}
+    index = 0
+    for position in range(0, len(rle), 2):
+        code, run = rle[position], rle[position + 1]
+        if code:
+            for cell in range(index, index + run):
+                row, col = divmod(cell, cols)
+                spots[f"spot_{row}_{col}"] = {
+                    "row": row,
+                    "col": col,
+                    "type": type_codes[code],
+                    "is_occupied": bool(occupancy[cell >> 3] & (1 << (cell & 7)))
+                }
+        index += run
+    return spots
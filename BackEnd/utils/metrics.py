@@ -0,0 +1,306 @@
+import time
+import bisect
+import threading
+from functools import wraps
+from utils import tracing
+
+# Prometheus文本格式
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 延迟直方图默认分桶（秒），覆盖从本地缓存命中到LLM调用的范围
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# 每个指标子项的分片数；取质数，线程ID通常按页对齐，取模后仍能分散到各分片
+_SHARDS = 31
+
+
+class _ShardedValues:
+    """
+    固定数量的分片，每片一把锁和一组计数，线程按threading.get_ident()取模选择分片；
+    不同线程大多落在不同分片上，写入几乎不争用，内存也不随线程数增长
+    """
+
+    def __init__(self, size, shards=_SHARDS):
+        self._shards = [(threading.Lock(), [0] * size) for _ in range(shards)]
+
+    def _shard(self):
+        return self._shards[threading.get_ident() % len(self._shards)]
+
+    def add(self, index, amount):
+        lock, values = self._shard()
+        with lock:
+            values[index] += amount
+
+    def add_pair(self, index, amount, last):
+        """同一把锁内更新两个位置（直方图的分桶计数与总和）"""
+        lock, values = self._shard()
+        with lock:
+            values[index] += amount
+            values[-1] += last
+
+    def collect(self):
+        totals = [0] * len(self._shards[0][1])
+        for lock, values in self._shards:
+            with lock:
+                for i, value in enumerate(values):
+                    totals[i] += value
+        return totals
+
+
+class _CounterChild:
+
+    def __init__(self):
+        self._values = _ShardedValues(1)
+
+    def inc(self, amount=1):
+        self._values.add(0, amount)
+
+    def value(self):
+        return self._values.collect()[0]
+
+
+class _HistogramChild:
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # 各分桶计数（非累积，最后一个为+Inf）加上总和
+        self._values = _ShardedValues(len(buckets) + 2)
+
+    def observe(self, value):
+        self._values.add_pair(bisect.bisect_left(self._buckets, value), 1, value)
+
+    def snapshot(self):
+        values = self._values.collect()
+        cumulative = []
+        running = 0
+        for count in values[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, values[-1]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def expose(self):
+        lines = self.header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.value())}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def expose(self):
+        lines = self.header()
+        bounds = self.buckets + (float("inf"),)
+        for values, child in list(self._children.items()):
+            cumulative, total = child.snapshot()
+            for bound, count in zip(bounds, cumulative):
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {count}")
+            labels = _label_text(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(float(total))}")
+            lines.append(f"{self.name}_count{labels} {cumulative[-1]}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """采集时调用fn获取[(标签值元组, 数值), ...]，用于停车场状态、缓存统计等已有数据"""
+
+    def __init__(self, name, documentation, labelnames, fn, kind="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self._fn = fn
+
+    def expose(self):
+        lines = self.header()
+        for values, value in self._fn():
+            lines.append(f"{self.name}{_label_text(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def expose(self):
+        """生成Prometheus文本格式的全部指标"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def callback(name, documentation, labelnames, fn, kind="gauge"):
+    return REGISTRY.register(CallbackMetric(name, documentation, labelnames, fn, kind))
+
+
+def expose():
+    return REGISTRY.expose()
+
+
+http_request_latency = histogram(
+    "smartpark_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("app", "method", "route", "status")
+)
+dependency_latency = histogram(
+    "smartpark_dependency_request_duration_seconds",
+    "Outbound call latency by dependency and operation",
+    ("dependency", "operation")
+)
+dependency_errors = counter(
+    "smartpark_dependency_errors_total",
+    "Failed outbound calls by dependency and operation",
+    ("dependency", "operation")
+)
+
+
+_startup_seconds = {}
+callback(
+    "smartpark_startup_import_seconds",
+    "Time spent importing the application module at process start",
+    ("app",),
+    lambda: [((app,), seconds) for app, seconds in list(_startup_seconds.items())]
+)
+
+
+def record_startup(app, seconds):
+    _startup_seconds[app] = seconds
+
+
+def observe_request(app, method, route, status, seconds):
+    http_request_latency.labels(app, method, route, str(status)).observe(seconds)
+
+
+def observe_dependency(dependency, operation, seconds, error=False):
+    dependency_latency.labels(dependency, operation).observe(seconds)
+    if error:
+        dependency_errors.labels(dependency, operation).inc()
+
+
+class dependency_timer:
+    """
+    记录一次外部调用的耗时，并在当前trace下创建对应的span：
+    with dependency_timer("cognito", "userinfo") as call: ...
+    抛出异常或设置call.error = True时计为失败
+    """
+
+    def __init__(self, dependency, operation):
+        self.dependency = dependency
+        self.operation = operation
+        self.error = False
+
+    def __enter__(self):
+        self._span = tracing.span(f"{self.dependency}.{self.operation}").__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe_dependency(self.dependency, self.operation, time.perf_counter() - self._started,
+                           self.error or exc_type is not None)
+        if self.error:
+            self._span.set_error("dependency reported an error")
+        self._span.__exit__(exc_type, exc, tb)
+        return False
+
+
+def timed_dependency(dependency):
+    """装饰数据库等函数：异常、返回None/False或{"status": "error"}时计为失败"""
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with dependency_timer(dependency, fn.__name__) as call:
+                result = fn(*args, **kwargs)
+                call.error = result is None or result is False or (
+                    isinstance(result, dict) and result.get("status") == "error"
+                )
+                return result
+        return wrapper
+    return decorator
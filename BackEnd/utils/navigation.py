@@ -1,59 +1,406 @@
-def generate_navigation_instructions(start_position, target_spot):
-    """生成从起点到目标车位的导航指示"""
-    start_row = start_position["row"]
-    start_col = start_position["col"]
-    target_row = target_spot["row"]
-    target_col = target_spot["col"]
-    
+import os
+import heapq
+import threading
+from collections import OrderedDict, deque
+from utils import metrics
+
+# 网格移动方向: (行增量, 列增量)
+_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+# 方向对应的中文指示
+_MOVE_TEXT = {
+    (1, 0): ("向前行驶", "排"),
+    (-1, 0): ("向后行驶", "排"),
+    (0, 1): ("向右行驶", "列"),
+    (0, -1): ("向左行驶", "列"),
+}
+_ENTER_TEXT = {
+    (1, 0): "向前驶入车位",
+    (-1, 0): "向后驶入车位",
+    (0, 1): "向右驶入车位",
+    (0, -1): "向左驶入车位",
+}
+
+_SPOT_TYPE_NAMES = {
+    "disabled": "残障人士",
+    "ev_charging": "电动车充电",
+    "compact": "小型车",
+    "large": "大型车"
+}
+
+_UNREACHABLE = -1
+
+
+class LotLayout:
+    """
+    停车场静态布局：非车位的格子为行车通道，车位只能从相邻通道驶入。
+    创建时预计算从入口和出口出发的BFS距离场，布局不变则距离场不变
+    """
+
+    def __init__(self, key, rows, cols, entrance, exit_, spot_cells):
+        self.key = key
+        self.rows = rows
+        self.cols = cols
+        self.entrance = (entrance["row"], entrance["col"])
+        self.exit = (exit_["row"], exit_["col"])
+
+        self._drivable = bytearray(b"\x01") * (rows * cols)
+        for row, col in spot_cells:
+            if 0 <= row < rows and 0 <= col < cols:
+                self._drivable[row * cols + col] = 0
+
+        self.entrance_field = self._bfs(self.entrance)
+        self.exit_field = self._bfs(self.exit)
+        # 从任意位置出发的距离场（重新路由时使用），按起点缓存
+        self._position_fields = OrderedDict()
+        self._fields_lock = threading.Lock()
+
+    def in_bounds(self, row, col):
+        return 0 <= row < self.rows and 0 <= col < self.cols
+
+    def is_drivable(self, row, col):
+        return self.in_bounds(row, col) and self._drivable[row * self.cols + col] == 1
+
+    def _bfs(self, source):
+        """从source出发在行车通道上做BFS，返回按格子索引排列的距离列表"""
+        field = [_UNREACHABLE] * (self.rows * self.cols)
+        if not self.is_drivable(*source):
+            return field
+        cols = self.cols
+        field[source[0] * cols + source[1]] = 0
+        queue = deque([source])
+        while queue:
+            row, col = queue.popleft()
+            next_distance = field[row * cols + col] + 1
+            for d_row, d_col in _DIRECTIONS:
+                n_row, n_col = row + d_row, col + d_col
+                if self.is_drivable(n_row, n_col) and field[n_row * cols + n_col] == _UNREACHABLE:
+                    field[n_row * cols + n_col] = next_distance
+                    queue.append((n_row, n_col))
+        return field
+
+    def spot_distance(self, field, row, col):
+        """车位在距离场中的行驶距离：相邻通道格子的最小距离加上驶入车位的一步"""
+        best = None
+        for d_row, d_col in _DIRECTIONS:
+            n_row, n_col = row + d_row, col + d_col
+            if self.is_drivable(n_row, n_col):
+                distance = field[n_row * self.cols + n_col]
+                if distance != _UNREACHABLE and (best is None or distance < best):
+                    best = distance
+        return None if best is None else best + 1
+
+    def distance_from_entrance(self, row, col):
+        distance = self.spot_distance(self.entrance_field, row, col)
+        if distance is None:
+            # 无法通过通道到达时退回曼哈顿距离
+            return abs(row - self.entrance[0]) + abs(col - self.entrance[1])
+        return distance
+
+    def distance_from_exit(self, row, col):
+        distance = self.spot_distance(self.exit_field, row, col)
+        if distance is None:
+            return abs(row - self.exit[0]) + abs(col - self.exit[1])
+        return distance
+
+    def nearest_drivable(self, row, col):
+        """将任意位置（可能在车位上或停车场外）吸附到最近的通道格子"""
+        row = min(max(row, 0), self.rows - 1)
+        col = min(max(col, 0), self.cols - 1)
+        if self.is_drivable(row, col):
+            return (row, col)
+        seen = {(row, col)}
+        queue = deque([(row, col)])
+        while queue:
+            c_row, c_col = queue.popleft()
+            for d_row, d_col in _DIRECTIONS:
+                n_row, n_col = c_row + d_row, c_col + d_col
+                if not self.in_bounds(n_row, n_col) or (n_row, n_col) in seen:
+                    continue
+                if self.is_drivable(n_row, n_col):
+                    return (n_row, n_col)
+                seen.add((n_row, n_col))
+                queue.append((n_row, n_col))
+        return None
+
+    def field_from(self, position, max_cached=64):
+        """从任意通道位置出发的距离场，按起点缓存"""
+        with self._fields_lock:
+            field = self._position_fields.get(position)
+            if field is not None:
+                self._position_fields.move_to_end(position)
+                return field
+        field = self._bfs(position)
+        with self._fields_lock:
+            self._position_fields[position] = field
+            if len(self._position_fields) > max_cached:
+                self._position_fields.popitem(last=False)
+        return field
+
+    def distance_between(self, position, row, col):
+        """从任意位置到车位的行驶距离（重新路由排序使用）"""
+        start = self.nearest_drivable(*position)
+        distance = None
+        if start is not None:
+            distance = self.spot_distance(self.field_from(start), row, col)
+        if distance is None:
+            return abs(row - position[0]) + abs(col - position[1])
+        return distance
+
+    def find_path(self, start, target):
+        """
+        A*搜索：从start沿通道行驶到target车位，返回经过的格子列表（以车位结束）。
+        无法到达时返回None
+        """
+        start = self.nearest_drivable(*start)
+        if start is None:
+            return None
+        t_row, t_col = target
+        goals = {
+            (t_row + d_row, t_col + d_col)
+            for d_row, d_col in _DIRECTIONS
+            if self.is_drivable(t_row + d_row, t_col + d_col)
+        }
+        if not goals:
+            return None
+
+        def heuristic(cell):
+            return abs(cell[0] - t_row) + abs(cell[1] - t_col) - 1
+
+        came_from = {start: None}
+        cost = {start: 0}
+        # 平局时序号小者优先，保证同一输入得到同一条路径
+        counter = 0
+        heap = [(heuristic(start), counter, start)]
+        while heap:
+            _, _, cell = heapq.heappop(heap)
+            if cell in goals:
+                path = [target]
+                while cell is not None:
+                    path.append(cell)
+                    cell = came_from[cell]
+                path.reverse()
+                return path
+            next_cost = cost[cell] + 1
+            for d_row, d_col in _DIRECTIONS:
+                neighbour = (cell[0] + d_row, cell[1] + d_col)
+                if not self.is_drivable(*neighbour):
+                    continue
+                if next_cost < cost.get(neighbour, next_cost + 1):
+                    cost[neighbour] = next_cost
+                    came_from[neighbour] = cell
+                    counter += 1
+                    heapq.heappush(heap, (next_cost + heuristic(neighbour), counter, neighbour))
+        return None
+
+
+# 按布局ID缓存的布局（含距离场），同样尺寸的停车场共享同一份
+_layout_cache = OrderedDict()
+_layout_lock = threading.Lock()
+_LAYOUT_CACHE_SIZE = 256
+_layout_stats = {"hits": 0, "misses": 0}
+
+
+def _cached_layout(layout_id):
+    with _layout_lock:
+        layout = _layout_cache.get(layout_id)
+        if layout is not None:
+            _layout_cache.move_to_end(layout_id)
+            _layout_stats["hits"] += 1
+        else:
+            _layout_stats["misses"] += 1
+        return layout
+
+
+def build_layout(layout_id, rows, cols, entrance, exit_, spot_cells):
+    """获取或创建布局；同一layout_id只计算一次距离场"""
+    layout = _cached_layout(layout_id)
+    if layout is None:
+        layout = LotLayout(layout_id, rows, cols, entrance, exit_, spot_cells)
+        with _layout_lock:
+            _layout_cache[layout_id] = layout
+            if len(_layout_cache) > _LAYOUT_CACHE_SIZE:
+                _layout_cache.popitem(last=False)
+    return layout
+
+
+def get_layout(parking_lot):
+    """根据停车场数据获取布局；缺少layout_id的旧数据按车位集合计算一个"""
+    layout_id = parking_lot.get("layout_id")
+    if layout_id is None:
+        spot_cells = sorted((s["row"], s["col"]) for s in parking_lot["spots"].values())
+        layout_id = f"{parking_lot['id']}:{hash(tuple(spot_cells))}"
+        parking_lot["layout_id"] = layout_id
+    return build_layout(
+        layout_id,
+        parking_lot["rows"],
+        parking_lot["cols"],
+        parking_lot["entrance"],
+        parking_lot["exit"],
+        ((s["row"], s["col"]) for s in parking_lot["spots"].values())
+    )
+
+
+def _move_instruction(direction, steps):
+    verb, unit = _MOVE_TEXT[direction]
+    return f"{verb}一{unit}" if steps == 1 else f"{verb}{steps}{unit}"
+
+
+def _path_instructions(path):
+    """将路径压缩为同方向的路段，生成逐段指示"""
+    instructions = []
+    segment_direction = None
+    segment_steps = 0
+    # 最后一步是从通道驶入车位，单独描述
+    for (a_row, a_col), (b_row, b_col) in zip(path[:-2], path[1:-1]):
+        direction = (b_row - a_row, b_col - a_col)
+        if direction == segment_direction:
+            segment_steps += 1
+            continue
+        if segment_direction is not None:
+            instructions.append(_move_instruction(segment_direction, segment_steps))
+        segment_direction = direction
+        segment_steps = 1
+    if segment_direction is not None:
+        instructions.append(_move_instruction(segment_direction, segment_steps))
+
+    (a_row, a_col), (b_row, b_col) = path[-2], path[-1]
+    instructions.append(_ENTER_TEXT[(b_row - a_row, b_col - a_col)])
+    return instructions
+
+
+def _straight_line_instructions(start_row, start_col, target_row, target_col):
+    """没有布局信息时的简单指示：先按行再按列移动"""
     instructions = []
-    
+    if target_row != start_row:
+        direction = (1, 0) if target_row > start_row else (-1, 0)
+        instructions.append(_move_instruction(direction, abs(target_row - start_row)))
+    if target_col != start_col:
+        direction = (0, 1) if target_col > start_col else (0, -1)
+        instructions.append(_move_instruction(direction, abs(target_col - start_col)))
+    return instructions
+
+
+def _build_instructions(layout, start_row, start_col, target_row, target_col, spot_id, spot_type):
+    """生成完整的导航指示（不带缓存）"""
+    instructions = []
+
     # 添加初始指示
     instructions.append("从当前位置开始")
-    
-    # 先处理行方向移动
-    if target_row > start_row:
-        row_diff = target_row - start_row
-        if row_diff == 1:
-            instructions.append("向前行驶一排")
-        else:
-            instructions.append(f"向前行驶{row_diff}排")
-    elif target_row < start_row:
-        row_diff = start_row - target_row
-        if row_diff == 1:
-            instructions.append("向后行驶一排")
-        else:
-            instructions.append(f"向后行驶{row_diff}排")
-    
-    # 再处理列方向移动
-    if target_col > start_col:
-        col_diff = target_col - start_col
-        if col_diff == 1:
-            instructions.append("向右行驶一列")
-        else:
-            instructions.append(f"向右行驶{col_diff}列")
-    elif target_col < start_col:
-        col_diff = start_col - target_col
-        if col_diff == 1:
-            instructions.append("向左行驶一列")
-        else:
-            instructions.append(f"向左行驶{col_diff}列")
-    
+
+    path = None
+    if layout is not None:
+        path = layout.find_path((start_row, start_col), (target_row, target_col))
+    if path is not None:
+        instructions.extend(_path_instructions(path))
+    else:
+        instructions.extend(_straight_line_instructions(start_row, start_col, target_row, target_col))
+
     # 添加最终指示
-    spot_type = target_spot["type"]
     if spot_type != "standard":
-        type_names = {
-            "disabled": "残障人士",
-            "ev_charging": "电动车充电",
-            "compact": "小型车",
-            "large": "大型车"
-        }
-        type_name = type_names.get(spot_type, spot_type)
-        instructions.append(f"您的目标是{target_spot['id']}号{type_name}车位")
+        type_name = _SPOT_TYPE_NAMES.get(spot_type, spot_type)
+        instructions.append(f"您的目标是{spot_id}号{type_name}车位")
     else:
-        instructions.append(f"您的目标是{target_spot['id']}号车位")
-    
+        instructions.append(f"您的目标是{spot_id}号车位")
+
     # 如果指示太少，添加一些细节
     if len(instructions) < 4:
         instructions.append("小心驾驶，注意周围车辆")
-    
-    return instructions 
\ No newline at end of file
+
+    return tuple(instructions)
+
+
+class InstructionCache:
+    """
+    有界LRU缓存：键为(布局ID, 起点格子, 目标格子, 车位ID, 车位类型)，
+    值为不可变的指示元组，可直接共享给多个请求
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+instruction_cache = InstructionCache(int(os.environ.get('NAVIGATION_CACHE_SIZE', 8192)))
+
+
+def generate_navigation_instructions(start_position, target_spot, parking_lot=None):
+    """
+    生成从起点到目标车位的导航指示；提供停车场时沿实际通道路径生成，
+    并按布局缓存结果。返回不可变元组
+    """
+    start_row = start_position["row"]
+    start_col = start_position["col"]
+    target_row = target_spot["row"]
+    target_col = target_spot["col"]
+
+    if parking_lot is None:
+        return _build_instructions(None, start_row, start_col, target_row, target_col,
+                                   target_spot["id"], target_spot["type"])
+
+    layout = get_layout(parking_lot)
+    key = (layout.key, (start_row, start_col), (target_row, target_col),
+           target_spot["id"], target_spot["type"])
+    instructions = instruction_cache.get(key)
+    if instructions is None:
+        instructions = _build_instructions(layout, start_row, start_col, target_row, target_col,
+                                           target_spot["id"], target_spot["type"])
+        instruction_cache.put(key, instructions)
+    return instructions
+
+
+def prewarm_routes(parking_lot):
+    """停车场创建时预先计算入口到每个车位的导航指示"""
+    entrance = parking_lot["entrance"]
+    for spot in parking_lot["spots"].values():
+        generate_navigation_instructions(entrance, spot, parking_lot)
+    return len(parking_lot["spots"])
+
+
+def _cache_lookups():
+    info = instruction_cache.info()
+    return [
+        (("navigation_instructions", "hit"), info["hits"]),
+        (("navigation_instructions", "miss"), info["misses"]),
+        (("layout", "hit"), _layout_stats["hits"]),
+        (("layout", "miss"), _layout_stats["misses"]),
+    ]
+
+
+metrics.callback("smartpark_cache_lookups_total", "Cache lookups by cache and result",
+                 ("cache", "result"), _cache_lookups, kind="counter")
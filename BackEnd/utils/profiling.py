@@ -0,0 +1,128 @@
+import io
+import os
+import time
+import hmac
+import random
+import pstats
+import cProfile
+import inspect
+import itertools
+import threading
+import contextvars
+import logging
+from collections import deque
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# 请求头中携带PROFILE_TOKEN时对该请求做性能剖析，管理接口使用同一个令牌
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+# 按比例随机采样剖析，0表示不采样
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_RING_SIZE = int(os.environ.get('PROFILE_RING_SIZE', 50))
+PROFILE_TOP_FUNCTIONS = int(os.environ.get('PROFILE_TOP_FUNCTIONS', 40))
+
+# 两者都未配置时profiled直接返回原函数，应用也不注册请求钩子，没有任何额外开销
+ENABLED = bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+_requested = contextvars.ContextVar("profile_requested", default=False)
+
+# 同一时刻解释器中只能有一个活动的cProfile，正在剖析时其他请求直接跳过
+_profiler_lock = threading.Lock()
+
+_profiles = deque(maxlen=PROFILE_RING_SIZE)
+_profile_ids = itertools.count(1)
+
+
+def authorized(token):
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def mark_request(header_value):
+    """由应用的请求钩子调用，记录本请求是否通过请求头要求剖析"""
+    _requested.set(authorized(header_value))
+
+
+def _reason():
+    if _requested.get():
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+
+def _store(name, reason, profiler, wall_seconds):
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    entry = {
+        "id": next(_profile_ids),
+        "route": name,
+        "reason": reason,
+        "captured_at": time.time(),
+        "wall_ms": round(wall_seconds * 1000, 2),
+        # 所有被剖析函数的CPU时间合计；与wall_ms的差值主要是等待LLM/数据库的时间
+        "profiled_ms": round(stats.total_tt * 1000, 2),
+        "stats": stream.getvalue()
+    }
+    _profiles.append(entry)
+    logger.info(f"Captured profile {entry['id']} for {name} ({reason}, {entry['wall_ms']}ms)")
+
+
+def profiled(name):
+    """
+    对路由函数做按需剖析（同步和异步函数均可）。
+    异步函数在await期间事件循环上运行的其他请求也会出现在结果中
+    """
+
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                reason = _reason()
+                if reason is None or not _profiler_lock.acquire(blocking=False):
+                    return await fn(*args, **kwargs)
+                profiler = cProfile.Profile()
+                started = time.perf_counter()
+                profiler.enable()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    _profiler_lock.release()
+                    _store(name, reason, profiler, time.perf_counter() - started)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            reason = _reason()
+            if reason is None or not _profiler_lock.acquire(blocking=False):
+                return fn(*args, **kwargs)
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+                _profiler_lock.release()
+                _store(name, reason, profiler, time.perf_counter() - started)
+        return wrapper
+
+    return decorator
+
+
+def list_profiles():
+    """最近的剖析结果摘要（不含详细统计），最新的在前"""
+    return [
+        {k: v for k, v in entry.items() if k != "stats"}
+        for entry in reversed(_profiles)
+    ]
+
+
+def get_profile(profile_id):
+    return next((entry for entry in _profiles if entry["id"] == profile_id), None)
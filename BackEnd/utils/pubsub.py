@@ -0,0 +1,253 @@
+import os
+import time
+import asyncio
+import threading
+import logging
+from utils import json_codec
+
+logger = logging.getLogger(__name__)
+
+# SSE推送连接的心跳间隔（秒）
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', 15))
+
+
+class Subscription:
+    """
+    单个客户端的订阅：待发送的变化按车位合并（同一车位只保留最新状态），
+    因此积压量不超过停车场车位数；积压过多时折叠为"需要快照"，
+    长时间不消费的订阅会被直接断开
+    """
+
+    def __init__(self, broker, channel, max_pending, stall_timeout, batch_window):
+        self.broker = broker
+        self.channel = channel
+        self.max_pending = max_pending
+        self.stall_timeout = stall_timeout
+        self.batch_window = batch_window
+
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._needs_snapshot = False
+        self._closed = False
+        self._last_drain = time.monotonic()
+        # 异步消费者: (事件循环, asyncio.Event)，有新数据时从发布线程唤醒
+        self._waker = None
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def offer(self, version, changes):
+        """由发布方调用，只做O(变化数)的合并，不阻塞"""
+        with self._cond:
+            if self._closed:
+                return False
+            if (self._pending or self._needs_snapshot) and \
+                    time.monotonic() - self._last_drain > self.stall_timeout:
+                # 消费过慢，断开连接
+                self._closed = True
+                self._notify()
+                return False
+            if not self._needs_snapshot:
+                for spot_id, is_occupied in changes:
+                    self._pending[spot_id] = (int(is_occupied), version)
+                if len(self._pending) > self.max_pending:
+                    self._pending.clear()
+                    self._needs_snapshot = True
+            self._notify()
+            return True
+
+    def _notify(self):
+        # 调用方持有_cond
+        self._cond.notify_all()
+        if self._waker is not None:
+            loop, event = self._waker
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _has_data(self):
+        return self._pending or self._needs_snapshot or self._closed
+
+    def next_batch(self, timeout):
+        """
+        等待下一批变化。返回 ("changes", [[spot_id, 0/1, version], ...])、("snapshot", None)、
+        ("closed", None)，超时无数据时返回None
+        """
+        with self._cond:
+            self._cond.wait_for(self._has_data, timeout)
+            if not self._has_data():
+                self._last_drain = time.monotonic()
+                return None
+        # 短暂等待，把同一时间窗口内的变化合并成一批发送
+        if self.batch_window:
+            time.sleep(self.batch_window)
+        return self._drain()
+
+    async def next_batch_async(self, timeout):
+        """next_batch的异步版本：在事件循环中等待，不占用线程池"""
+        with self._cond:
+            if self._waker is None:
+                self._waker = (asyncio.get_running_loop(), asyncio.Event())
+            event = self._waker[1]
+            event.clear()
+            ready = self._has_data()
+        if not ready:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                with self._cond:
+                    if not self._has_data():
+                        self._last_drain = time.monotonic()
+                        return None
+        if self.batch_window:
+            await asyncio.sleep(self.batch_window)
+        return self._drain()
+
+    def _drain(self):
+        with self._cond:
+            self._last_drain = time.monotonic()
+            if self._closed:
+                return ("closed", None)
+            if self._needs_snapshot:
+                self._needs_snapshot = False
+                self._pending.clear()
+                return ("snapshot", None)
+            changes = sorted(
+                ([spot_id, state, version] for spot_id, (state, version) in self._pending.items()),
+                key=lambda change: change[2]
+            )
+            self._pending.clear()
+            return ("changes", changes)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._notify()
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """按停车场划分频道的发布订阅"""
+
+    def __init__(self, max_subscribers=1000, max_pending=64, stall_timeout=30.0, batch_window=0.05):
+        self.max_subscribers = max_subscribers
+        self.max_pending = max_pending
+        self.stall_timeout = stall_timeout
+        self.batch_window = batch_window
+
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._count = 0
+        self.dropped = 0
+
+    @property
+    def subscriber_count(self):
+        return self._count
+
+    def subscribe(self, channel):
+        """订阅频道；订阅数已满时返回None"""
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                return None
+            subscription = Subscription(
+                self, channel, self.max_pending, self.stall_timeout, self.batch_window
+            )
+            # 频道内用元组保存，发布时无需复制
+            self._channels[channel] = self._channels.get(channel, ()) + (subscription,)
+            self._count += 1
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel, ())
+            if subscription not in subscribers:
+                return
+            remaining = tuple(s for s in subscribers if s is not subscription)
+            if remaining:
+                self._channels[subscription.channel] = remaining
+            else:
+                del self._channels[subscription.channel]
+            self._count -= 1
+
+    def publish(self, channel, version, changes):
+        """向频道内所有订阅者扇出一批变化，断开消费过慢的订阅者"""
+        for subscription in self._channels.get(channel, ()):
+            if not subscription.offer(version, changes):
+                self.dropped += 1
+                logger.info(f"Dropped slow subscriber on channel {channel}")
+                subscription.close()
+
+
+occupancy_broker = Broker(
+    max_subscribers=int(os.environ.get('STREAM_MAX_SUBSCRIBERS', 1000)),
+    max_pending=int(os.environ.get('STREAM_MAX_PENDING', 64)),
+    stall_timeout=float(os.environ.get('STREAM_STALL_TIMEOUT', 30))
+)
+
+
+def sse_event(event, data, event_id=None):
+    """格式化一条Server-Sent Events消息"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json_codec.dumps_str(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _initial_event(initial):
+    event = "changes" if initial["mode"] == "delta" else "snapshot"
+    return sse_event(event, initial, initial["version"]), initial["version"]
+
+
+def _batch_event(batch, snapshot, sent_version):
+    """把next_batch的结果格式化为SSE消息，返回(消息或None, 已发送版本)"""
+    if batch is None:
+        return ": keep-alive\n\n", sent_version
+    kind, changes = batch
+    if kind == "snapshot":
+        current = snapshot()
+        return sse_event("snapshot", current, current["version"]), current["version"]
+    # 跳过已经包含在已发送快照中的变化
+    changes = [change for change in changes if change[2] > sent_version]
+    if not changes:
+        return None, sent_version
+    sent_version = changes[-1][2]
+    return sse_event("changes", {"mode": "delta", "version": sent_version, "changes": changes}, sent_version), sent_version
+
+
+def occupancy_events(subscription, initial, snapshot, heartbeat=STREAM_HEARTBEAT_SECONDS):
+    """
+    停车场占用推送的SSE消息生成器（Flask使用，每个连接占用一个线程）：先发送initial（快照或增量），
+    之后推送合并后的变化批次；snapshot()返回当前完整快照，订阅积压过多时发送
+    """
+    try:
+        message, sent_version = _initial_event(initial)
+        yield message
+        while True:
+            batch = subscription.next_batch(timeout=heartbeat)
+            if batch is not None and batch[0] == "closed":
+                break
+            message, sent_version = _batch_event(batch, snapshot, sent_version)
+            if message is not None:
+                yield message
+    finally:
+        subscription.close()
+
+
+async def occupancy_events_async(subscription, initial, snapshot, heartbeat=STREAM_HEARTBEAT_SECONDS):
+    """occupancy_events的异步版本（FastAPI使用）：等待变化时既不阻塞事件循环，也不占用线程池"""
+    try:
+        message, sent_version = _initial_event(initial)
+        yield message
+        while True:
+            batch = await subscription.next_batch_async(timeout=heartbeat)
+            if batch is not None and batch[0] == "closed":
+                break
+            message, sent_version = _batch_event(batch, snapshot, sent_version)
+            if message is not None:
+                yield message
+    finally:
+        subscription.close()
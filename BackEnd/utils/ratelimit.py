@@ -0,0 +1,209 @@
+import os
+import math
+import time
+import threading
+import logging
+from collections import OrderedDict
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# 每个客户端调用LLM的速率（次/秒）与突发量，超出后走确定性的回退逻辑
+RATE_LIMIT_USER_RATE = float(os.environ.get('RATE_LIMIT_USER_RATE', 0.2))
+RATE_LIMIT_USER_BURST = float(os.environ.get('RATE_LIMIT_USER_BURST', 5))
+# 所有客户端共享的LLM调用速率与突发量
+RATE_LIMIT_GLOBAL_RATE = float(os.environ.get('RATE_LIMIT_GLOBAL_RATE', 5))
+RATE_LIMIT_GLOBAL_BURST = float(os.environ.get('RATE_LIMIT_GLOBAL_BURST', 20))
+# 每个客户端的请求总速率（含回退），超出后返回429和Retry-After
+RATE_LIMIT_HARD_RATE = float(os.environ.get('RATE_LIMIT_HARD_RATE', 2))
+RATE_LIMIT_HARD_BURST = float(os.environ.get('RATE_LIMIT_HARD_BURST', 20))
+# 配置后多个进程通过Redis兼容的服务（本机redis/valkey等）共享令牌桶
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL', '')
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000))
+# 部署在反向代理之后时使用X-Forwarded-For的第一跳作为客户端地址
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() == 'true'
+
+
+class MemoryBucketStore:
+    """
+    进程内令牌桶，按最近使用淘汰超过max_keys的桶（被淘汰的桶下次按满桶计算）
+    """
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets, now, cost=1.0):
+        """
+        buckets为[(key, rate, burst), ...]，所有桶都有足够令牌时一起扣除并返回0，
+        否则不扣除，返回令牌足够前需要等待的秒数
+        """
+        with self._lock:
+            levels = []
+            wait = 0.0
+            for key, rate, burst in buckets:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+                levels.append(tokens)
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) / rate if rate > 0 else math.inf)
+            for (key, rate, burst), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - cost if wait == 0 else tokens, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+# 与MemoryBucketStore.take相同的语义，在服务端原子执行
+_TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local wait = 0
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[1 + 2 * i])
+    local burst = tonumber(ARGV[2 + 2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    levels[i] = tokens
+    if tokens < cost then
+        wait = math.max(wait, (cost - tokens) / rate)
+    end
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[1 + 2 * i])
+    local burst = tonumber(ARGV[2 + 2 * i])
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - cost
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+return tostring(wait)
+"""
+
+
+class RedisBucketStore:
+    """通过Redis兼容服务共享的令牌桶，键在桶回满后自动过期"""
+
+    def __init__(self, client, prefix="smartpark:ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_TAKE_SCRIPT)
+
+    def take(self, buckets, now, cost=1.0):
+        keys = [self.prefix + key for key, _, _ in buckets]
+        args = [now, cost]
+        for _, rate, burst in buckets:
+            args.extend((rate, burst))
+        return float(self._script(keys=keys, args=args))
+
+
+def _create_store():
+    if not RATE_LIMIT_REDIS_URL:
+        return MemoryBucketStore()
+    try:
+        import redis
+        return RedisBucketStore(redis.Redis.from_url(RATE_LIMIT_REDIS_URL, socket_timeout=0.05))
+    except ImportError:
+        logger.warning("RATE_LIMIT_REDIS_URL is set but redis is not installed, using in-memory buckets")
+        return MemoryBucketStore()
+
+
+class Admission:
+    """准入结果：allow_llm为False时走回退逻辑；retry_after不为None时应拒绝请求"""
+
+    __slots__ = ("allow_llm", "retry_after")
+
+    def __init__(self, allow_llm, retry_after=None):
+        self.allow_llm = allow_llm
+        self.retry_after = retry_after
+
+    @property
+    def refused(self):
+        return self.retry_after is not None
+
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+LLM = Admission(True)
+FALLBACK = Admission(False)
+
+
+admission_decisions = metrics.counter(
+    "smartpark_admission_decisions_total",
+    "Admission decisions for LLM-backed endpoints",
+    ("endpoint", "decision")
+)
+
+
+class AdmissionController:
+    """
+    LLM接口的准入控制：先检查客户端的请求总量（超出时拒绝），
+    再检查客户端与全局的LLM令牌桶（任一不足时使用回退逻辑）。
+    共享存储不可用时退回进程内令牌桶，不因限流影响请求
+    """
+
+    def __init__(self, name, user_rate, user_burst, global_rate, global_burst,
+                 hard_rate, hard_burst, store=None, enabled=True):
+        self.name = name
+        self.user = (user_rate, user_burst)
+        self.shared = (global_rate, global_burst)
+        self.hard = (hard_rate, hard_burst)
+        self.store = store if store is not None else MemoryBucketStore()
+        self.enabled = enabled
+        self._local = self.store if isinstance(self.store, MemoryBucketStore) else MemoryBucketStore()
+
+    def _take(self, buckets, now):
+        try:
+            return self.store.take(buckets, now)
+        except Exception as e:
+            logger.warning(f"Rate limit store unavailable, using in-memory buckets: {e}")
+            return self._local.take(buckets, now)
+
+    def admit(self, client, endpoint):
+        if not self.enabled:
+            return LLM
+        now = time.time()
+        wait = self._take([(f"{self.name}:hard:{client}",) + self.hard], now)
+        if wait > 0:
+            admission_decisions.labels(endpoint, "refused").inc()
+            return Admission(False, wait)
+        wait = self._take([
+            (f"{self.name}:user:{client}",) + self.user,
+            (f"{self.name}:global",) + self.shared
+        ], now)
+        if wait > 0:
+            admission_decisions.labels(endpoint, "fallback").inc()
+            return FALLBACK
+        admission_decisions.labels(endpoint, "llm").inc()
+        return LLM
+
+
+def client_key(remote_addr, forwarded_for=None):
+    """
+    限流键：按客户端地址。LLM接口不校验令牌，按未验证的Bearer令牌区分会让客户端
+    每次换一个令牌就得到新的令牌桶，绕过请求上限和LLM预算
+    """
+    if RATE_LIMIT_TRUST_FORWARDED and forwarded_for:
+        return "ip:" + forwarded_for.split(",")[0].strip()
+    return "ip:" + (remote_addr or "unknown")
+
+
+# DeepSeek调用共享的准入控制（分配、重新路由、停车场推荐共用同一份LLM预算）
+llm_admission = AdmissionController(
+    "deepseek",
+    RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST,
+    RATE_LIMIT_GLOBAL_RATE, RATE_LIMIT_GLOBAL_BURST,
+    RATE_LIMIT_HARD_RATE, RATE_LIMIT_HARD_BURST,
+    store=_create_store(),
+    enabled=RATE_LIMIT_ENABLED
+)
@@ -0,0 +1,157 @@
+import os
+import time
+import threading
+import logging
+from utils.expiry import expiry_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class ReservationReconciler:
+    """
+    保持内存中的车位占用与parking_reservations表一致：
+    启动时用非缓冲游标流式读取所有有效预约并按批应用（预热），
+    之后按updated_at增量拉取变化，不需要重新读取整张表
+    """
+
+    def __init__(self, poll_interval=5.0, batch_size=1000):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._watermark = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.warmup_stats = None
+        self.changes_applied = 0
+
+    def _apply_batch(self, active, inactive_ids):
+        # 延迟导入，避免循环依赖
+        from parking_data import reserve_spots, release_reservations
+
+        if active:
+            reserve_spots([(r["id"], r["parking_lot_id"], r["spot_id"]) for r in active])
+            for r in active:
+                expiry_scheduler.schedule(r["id"], r["expiration_time"])
+        if inactive_ids:
+            release_reservations(inactive_ids)
+            for reservation_id in inactive_ids:
+                expiry_scheduler.cancel(reservation_id)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def reservation_created(self, reservation_id, lot_id, spot_id, expiration_time):
+        """本进程创建预约后立即应用，不必等待下一次增量同步；未启动同步（没有到期处理）时不做任何事"""
+        if not self.running:
+            return
+        self._apply_batch(
+            [{"id": reservation_id, "parking_lot_id": lot_id,
+              "spot_id": spot_id, "expiration_time": expiration_time}],
+            []
+        )
+
+    def reservation_ended(self, reservation_id):
+        """本进程取消预约后立即释放车位"""
+        if not self.running:
+            return
+        self._apply_batch([], [reservation_id])
+
+    def warm_up(self):
+        """流式加载所有有效预约，返回并记录预热耗时"""
+        import database
+
+        started = time.perf_counter()
+        # 先记录起点，预热期间发生的变化由第一次增量同步补上（应用是幂等的）
+        self._watermark = (database.get_db_time(), "")
+
+        count = 0
+        batch = []
+        for reservation in database.iter_active_reservations(self.batch_size):
+            batch.append(reservation)
+            if len(batch) >= self.batch_size:
+                self._apply_batch(batch, [])
+                count += len(batch)
+                batch = []
+        if batch:
+            self._apply_batch(batch, [])
+            count += len(batch)
+
+        elapsed = time.perf_counter() - started
+        self.warmup_stats = {
+            "reservations": count,
+            "seconds": round(elapsed, 3),
+            "reservations_per_second": int(count / elapsed) if elapsed > 0 else count
+        }
+        logger.info(f"Reservation warm-up applied {count} active reservations in {elapsed:.3f}s")
+        return self.warmup_stats
+
+    def poll(self):
+        """拉取上次同步之后变化的预约并应用，返回应用的条数"""
+        import database
+
+        if self._watermark is None or self._watermark[0] is None:
+            self._watermark = (database.get_db_time(), "")
+            return 0
+
+        applied = 0
+        while True:
+            since, since_id = self._watermark
+            result = database.get_reservation_changes(since, self.batch_size, since_id)
+            if result["status"] == "error":
+                logger.error(f"Failed to fetch reservation changes: {result['message']}")
+                break
+            rows = result["data"]
+            if not rows:
+                break
+
+            active = [r for r in rows if r["status"] == "active"]
+            inactive_ids = [r["id"] for r in rows if r["status"] != "active"]
+            self._apply_batch(active, inactive_ids)
+            applied += len(rows)
+
+            # 水位为(updated_at, id)键集，同一时间戳上超过一批的行在下一页继续读取
+            self._watermark = (rows[-1]["updated_at"], rows[-1]["id"])
+            if len(rows) < self.batch_size:
+                break
+
+        self.changes_applied += applied
+        return applied
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Reservation reconciliation failed: {e}", exc_info=True)
+
+    def start(self):
+        """预热后启动后台增量同步线程"""
+        if self._thread is not None:
+            return
+        self.warm_up()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reservation-reconcile", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def snapshot(self):
+        from parking_data import reserved_count
+
+        return {
+            "active_reservations": reserved_count(),
+            "scheduled_expiries": len(expiry_scheduler),
+            "expired_total": expiry_scheduler.expired_total,
+            "changes_applied": self.changes_applied,
+            "warmup": self.warmup_stats
+        }
+
+
+reservation_reconciler = ReservationReconciler(
+    poll_interval=float(os.environ.get('RESERVATION_SYNC_INTERVAL', 5)),
+    batch_size=int(os.environ.get('RESERVATION_SYNC_BATCH', 1000))
+)
@@ -0,0 +1,273 @@
+import os
+import threading
+import time
+import logging
+from utils import metrics, tracing
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """在途请求数已达到自适应上限，调用被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后打开，冷却后进入半开状态放行少量探测请求，
+    探测成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._total_failures = 0
+        self._total_rejections = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        # 调用方需持有锁
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_in_flight = 0
+            logger.info(f"Circuit '{self.name}' half-open, probing dependency")
+
+    def allow_request(self):
+        """判断是否允许本次调用；半开状态下只放行有限个探测请求"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            self._total_rejections += 1
+            return False
+
+    def release_probe(self):
+        """归还未实际使用的半开探测名额"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_in_flight > 0:
+                self._half_open_in_flight -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                logger.info(f"Circuit '{self.name}' closed after successful probe")
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._half_open_in_flight = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._total_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(
+                        f"Circuit '{self.name}' opened after {self._consecutive_failures} consecutive failures"
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._half_open_in_flight = 0
+
+    def snapshot(self):
+        with self._lock:
+            self._maybe_half_open()
+            retry_in = 0.0
+            if self._state == self.OPEN:
+                retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "total_failures": self._total_failures,
+                "total_rejections": self._total_rejections,
+                "retry_in_seconds": round(retry_in, 1)
+            }
+
+
+class AdaptiveLimiter:
+    """
+    AIMD自适应并发限制：请求成功且延迟正常时上限缓慢增加（每个"窗口"加1），
+    失败或延迟超标时上限按比例收缩
+    """
+
+    def __init__(self, initial_limit=10, min_limit=1, max_limit=100,
+                 latency_threshold=5.0, backoff_ratio=0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold = latency_threshold
+        self.backoff_ratio = backoff_ratio
+
+        self._lock = threading.Lock()
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._total_rejections = 0
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def try_acquire(self):
+        with self._lock:
+            if self._in_flight >= int(self._limit):
+                self._total_rejections += 1
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self, latency, success):
+        with self._lock:
+            self._in_flight -= 1
+            if success and latency <= self.latency_threshold:
+                # 加性增长：大约每完成limit个请求上限加1
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+            else:
+                # 乘性减少
+                self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "limit": int(self._limit),
+                "in_flight": self._in_flight,
+                "total_rejections": self._total_rejections
+            }
+
+
+class DependencyGuard:
+    """
+    外部依赖保护层：组合熔断器、自适应并发限制与单次调用超时。
+    不健康时直接抛出异常，让调用方立即走确定性的回退逻辑
+    """
+
+    def __init__(self, name, breaker, limiter, timeout):
+        self.name = name
+        self.breaker = breaker
+        self.limiter = limiter
+        self.timeout = timeout
+
+    def _before_call(self):
+        if not self.breaker.allow_request():
+            metrics.dependency_errors.labels(self.name, "rejected").inc()
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        if not self.limiter.try_acquire():
+            # 未真正发起调用，不计入熔断失败，但需归还半开探测名额
+            self.breaker.release_probe()
+            metrics.dependency_errors.labels(self.name, "rejected").inc()
+            raise ConcurrencyLimitExceeded(
+                f"{self.name} concurrency limit reached ({self.limiter.limit})"
+            )
+
+    def _after_call(self, started, success):
+        latency = time.monotonic() - started
+        self.limiter.release(latency, success)
+        metrics.observe_dependency(self.name, "call", latency, not success)
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def call(self, fn, *args, **kwargs):
+        """执行同步调用；超时需由fn自身遵守（如向SDK传入timeout=guard.timeout）"""
+        with tracing.span(f"{self.name}.call", timeout=self.timeout):
+            self._before_call()
+            started = time.monotonic()
+            success = False
+            try:
+                result = fn(*args, **kwargs)
+                success = True
+                return result
+            finally:
+                self._after_call(started, success)
+
+    async def call_async(self, fn, *args, **kwargs):
+        """执行异步调用，语义与call相同"""
+        with tracing.span(f"{self.name}.call", timeout=self.timeout):
+            self._before_call()
+            started = time.monotonic()
+            success = False
+            try:
+                result = await fn(*args, **kwargs)
+                success = True
+                return result
+            finally:
+                self._after_call(started, success)
+
+    def snapshot(self):
+        return {
+            "circuit": self.breaker.snapshot(),
+            "concurrency": self.limiter.snapshot(),
+            "timeout_seconds": self.timeout
+        }
+
+
+# 所有依赖保护实例，用于导出状态
+_guards = {}
+
+
+def register_guard(guard):
+    _guards[guard.name] = guard
+    return guard
+
+
+def get_dependency_states():
+    """导出所有外部依赖的熔断器与并发限制状态"""
+    return {name: guard.snapshot() for name, guard in _guards.items()}
+
+
+def _circuit_states():
+    return [((name,), 0 if guard.breaker.state == CircuitBreaker.CLOSED else 1)
+            for name, guard in _guards.items()]
+
+
+def _concurrency_limits():
+    return [((name,), guard.limiter.limit) for name, guard in _guards.items()]
+
+
+metrics.callback("smartpark_dependency_circuit_open",
+                 "1 when the dependency circuit breaker is open or half-open", ("dependency",), _circuit_states)
+metrics.callback("smartpark_dependency_concurrency_limit",
+                 "Current adaptive concurrency limit", ("dependency",), _concurrency_limits)
+
+
+# DeepSeek共享保护层，参数可通过环境变量调整
+deepseek_guard = register_guard(DependencyGuard(
+    "deepseek",
+    CircuitBreaker(
+        "deepseek",
+        failure_threshold=int(os.environ.get('DEEPSEEK_BREAKER_FAILURES', 5)),
+        recovery_timeout=float(os.environ.get('DEEPSEEK_BREAKER_RECOVERY', 30))
+    ),
+    AdaptiveLimiter(
+        initial_limit=int(os.environ.get('DEEPSEEK_CONCURRENCY_INITIAL', 10)),
+        max_limit=int(os.environ.get('DEEPSEEK_CONCURRENCY_MAX', 50)),
+        latency_threshold=float(os.environ.get('DEEPSEEK_SLOW_CALL_SECONDS', 8))
+    ),
+    timeout=float(os.environ.get('DEEPSEEK_TIMEOUT', 10))
+))
@@ -0,0 +1,191 @@
+import os
+import time
+import threading
+from array import array
+from collections import OrderedDict
+
+# 占用历史的采样粒度（秒）与保留时长（秒），默认每分钟一个样本、保留7天
+OCCUPANCY_SERIES_RESOLUTION = int(os.environ.get('OCCUPANCY_SERIES_RESOLUTION', 60))
+OCCUPANCY_SERIES_RETENTION = int(os.environ.get('OCCUPANCY_SERIES_RETENTION', 7 * 24 * 3600))
+# 最多跟踪的停车场序列数，超出时淘汰最久没有变化的序列（默认约40MB）
+OCCUPANCY_SERIES_MAX_LOTS = int(os.environ.get('OCCUPANCY_SERIES_MAX_LOTS', 1000))
+# 查询返回的最大点数，未指定步长时据此自动选择
+OCCUPANCY_SERIES_MAX_POINTS = int(os.environ.get('OCCUPANCY_SERIES_MAX_POINTS', 500))
+
+
+def _typecode(total):
+    # 车位数不超过65535时每个值2字节
+    return "H" if total <= 0xFFFF else "I"
+
+
+class OccupancySeries:
+    """
+    单个停车场的占用时间序列：固定长度的环形数组，每个时间桶记录桶结束时的占用数和桶内峰值，
+    没有变化的桶沿用上一个值。内存在创建时确定，不随时间增长
+    """
+
+    __slots__ = ("resolution", "capacity", "total", "current", "_last", "_peak", "_first", "_head")
+
+    def __init__(self, resolution, capacity, total, occupied, now):
+        self.resolution = resolution
+        self.capacity = capacity
+        self.total = total
+        self.current = occupied
+        typecode = _typecode(total)
+        self._last = array(typecode, [0]) * capacity
+        self._peak = array(typecode, [0]) * capacity
+        # 第一个和最新的桶编号（绝对编号，time // resolution）
+        self._first = self._head = int(now // resolution)
+        i = self._head % capacity
+        self._last[i] = self._peak[i] = occupied
+
+    @property
+    def nbytes(self):
+        return (len(self._last) + len(self._peak)) * self._last.itemsize
+
+    def record(self, now, occupied):
+        """记录now时刻的占用数"""
+        bucket = int(now // self.resolution)
+        if bucket > self._head:
+            # 中间没有变化的桶沿用当前值，最多回填一整圈
+            current = self.current
+            for missing in range(max(self._head + 1, bucket - self.capacity + 1), bucket):
+                i = missing % self.capacity
+                self._last[i] = self._peak[i] = current
+            i = bucket % self.capacity
+            self._last[i] = occupied
+            self._peak[i] = max(current, occupied)
+            self._head = bucket
+        else:
+            # 同一个桶内（或时钟回拨）合并到最新的桶
+            i = self._head % self.capacity
+            self._last[i] = occupied
+            if occupied > self._peak[i]:
+                self._peak[i] = occupied
+        self.current = occupied
+
+    def query(self, start, end, step):
+        """
+        将[start, end]内的样本按step秒（resolution的整数倍）降采样，
+        返回(时间戳, 平均占用, 峰值占用)列表；超出保留范围或早于首个样本的部分不返回
+        """
+        step_buckets = max(1, step // self.resolution)
+        lo = max(int(start // self.resolution), self._first, self._head - self.capacity + 1)
+        hi = min(int(end // self.resolution), self._head)
+        points = []
+        group = None
+        for bucket in range(lo, hi + 1):
+            i = bucket % self.capacity
+            g = bucket // step_buckets
+            if g != group:
+                if group is not None:
+                    points.append((group * step_buckets * self.resolution, total / count, peak))
+                group, total, count, peak = g, 0, 0, 0
+            total += self._last[i]
+            count += 1
+            if self._peak[i] > peak:
+                peak = self._peak[i]
+        if group is not None:
+            points.append((group * step_buckets * self.resolution, total / count, peak))
+        return points
+
+
+class OccupancyHistory:
+    """所有停车场的占用时间序列，最多max_lots个，按最近写入顺序淘汰"""
+
+    def __init__(self, resolution=OCCUPANCY_SERIES_RESOLUTION, retention=OCCUPANCY_SERIES_RETENTION,
+                 max_lots=OCCUPANCY_SERIES_MAX_LOTS):
+        self.resolution = resolution
+        self.capacity = max(1, retention // resolution)
+        self.max_lots = max(1, max_lots)
+        self.evicted = 0
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bytes_per_lot(self, total=0):
+        """每个停车场序列数据占用的字节数（不含对象开销）"""
+        return 2 * self.capacity * array(_typecode(total)).itemsize
+
+    def max_bytes(self, total=0):
+        """max_lots个序列的数据上限"""
+        return self.max_lots * self.bytes_per_lot(total)
+
+    def tracks(self, lot_id):
+        return lot_id in self._series
+
+    def observe(self, lot_id, occupied, total, now=None):
+        """记录停车场当前的占用数（首次记录时创建序列）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            series = self._series.get(lot_id)
+            if series is None or series.total != total:
+                self._series[lot_id] = OccupancySeries(self.resolution, self.capacity, total, occupied, now)
+                self._series.move_to_end(lot_id)
+                while len(self._series) > self.max_lots:
+                    self._series.popitem(last=False)
+                    self.evicted += 1
+            else:
+                series.record(now, occupied)
+                self._series.move_to_end(lot_id)
+
+    def apply_delta(self, lot_id, delta, now=None):
+        """按占用数变化量记录，停车场尚未有序列时忽略"""
+        now = time.time() if now is None else now
+        with self._lock:
+            series = self._series.get(lot_id)
+            if series is not None:
+                series.record(now, series.current + delta)
+                self._series.move_to_end(lot_id)
+
+    def discard(self, lot_id):
+        """停车场移出本进程时一并丢弃它的序列"""
+        with self._lock:
+            self._series.pop(lot_id, None)
+
+    def query(self, lot_id, window, step=None, now=None):
+        """最近window秒的降采样序列；停车场没有记录时返回None"""
+        now = time.time() if now is None else now
+        if step is None:
+            step = max(self.resolution, -(-window // OCCUPANCY_SERIES_MAX_POINTS))
+        # 步长向上取整为采样粒度的整数倍
+        step = -(-int(step) // self.resolution) * self.resolution
+        with self._lock:
+            series = self._series.get(lot_id)
+            if series is None:
+                return None
+            # 查询前把没有变化的时间补齐到当前时刻
+            series.record(now, series.current)
+            points = series.query(now - window, now, step)
+            return {
+                "lot_id": lot_id,
+                "total_spots": series.total,
+                "resolution": self.resolution,
+                "step": step,
+                "timestamps": [t for t, _, _ in points],
+                "avg_occupied": [round(avg, 2) for _, avg, _ in points],
+                "max_occupied": [peak for _, _, peak in points]
+            }
+
+    def lot_ids(self):
+        with self._lock:
+            return list(self._series)
+
+    def samples(self, lot_id, since, now=None):
+        """
+        since之后（含）已结束的时间桶，返回(车位总数, [(桶起始时间, 桶结束时占用, 峰值), ...])，
+        按采样粒度不降采样，供归档导出；停车场没有记录时返回None
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            series = self._series.get(lot_id)
+            if series is None:
+                return None
+            series.record(now, series.current)
+            # 当前桶尚未结束，留到下一次导出
+            end = int(now // self.resolution) * self.resolution - 1
+            points = series.query(since, end, self.resolution)
+            return series.total, [(t, int(last), peak) for t, last, peak in points]
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(series.nbytes for series in self._series.values())
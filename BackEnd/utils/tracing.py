@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import random
+import atexit
+import threading
+import contextvars
+import logging
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# 导出方式：none（默认，span为空操作）、file（JSON Lines文件）、otlp（OTLP/HTTP JSON收集器）
+TRACE_EXPORTER = os.environ.get('TRACE_EXPORTER', 'none').lower()
+TRACE_FILE = os.environ.get('TRACE_FILE', 'traces.jsonl')
+OTLP_ENDPOINT = os.environ.get('OTLP_ENDPOINT', 'http://localhost:4318')
+# 没有上游traceparent时新建trace的采样率
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 1.0))
+SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'smartpark-backend')
+
+TRACEPARENT_HEADER = "traceparent"
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """一个计时区间；结束时交给导出器"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes",
+                 "start_ns", "end_ns", "status", "error", "_token")
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes) if attributes else {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = "ok"
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status = "error"
+        self.error = message
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        self.end()
+        return False
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                # 在其他上下文中结束（如框架在不同任务中调用结束钩子）
+                pass
+            self._token = None
+        _exporter.export(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """未启用追踪或当前trace未采样时使用，所有操作为空"""
+
+    trace_id = None
+    traceparent = None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, message):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class FileExporter:
+    """每个span一行JSON，追加写入本地文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def shutdown(self):
+        with self._lock:
+            self._file.close()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter:
+    """批量以OTLP/HTTP JSON格式发送到收集器的/v1/traces，发送失败时丢弃该批"""
+
+    def __init__(self, endpoint, flush_interval=2.0, max_batch=512, max_queue=8192):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._queue = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return
+            self._queue.append(span)
+
+    def _payload(self, spans):
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "smartpark"},
+                "spans": [{
+                    "traceId": s.trace_id,
+                    "spanId": s.span_id,
+                    "parentSpanId": s.parent_id or "",
+                    "name": s.name,
+                    "kind": 1,
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                    "status": {"code": 2, "message": s.error or ""} if s.status == "error" else {"code": 1}
+                } for s in spans]
+            }]
+        }]}
+
+    def flush(self):
+        # urllib.request较重（连带http.client、email等），只在实际导出时导入
+        import urllib.request
+        while True:
+            with self._lock:
+                batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            if not batch:
+                return
+            request = urllib.request.Request(
+                self.url, data=json.dumps(self._payload(batch)).encode("utf-8"),
+                headers={"Content-Type": "application/json"}, method="POST"
+            )
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.warning(f"Failed to export {len(batch)} spans to {self.url}: {e}")
+                return
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def shutdown(self):
+        self._stop.set()
+        self.flush()
+
+
+class _NoopExporter:
+
+    def export(self, span):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+def _create_exporter():
+    if TRACE_EXPORTER == "file":
+        return FileExporter(TRACE_FILE)
+    if TRACE_EXPORTER == "otlp":
+        return OTLPExporter(OTLP_ENDPOINT)
+    return None
+
+
+_exporter = _create_exporter()
+ENABLED = _exporter is not None
+if not ENABLED:
+    _exporter = _NoopExporter()
+atexit.register(lambda: _exporter.shutdown())
+
+
+def set_exporter(exporter):
+    """替换导出器（需要实现export(span)和shutdown()），传入None关闭追踪"""
+    global _exporter, ENABLED
+    ENABLED = exporter is not None
+    _exporter = exporter if exporter is not None else _NoopExporter()
+
+
+def parse_traceparent(header):
+    """解析W3C traceparent，返回(trace_id, parent_span_id, sampled)，格式不合法时返回None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+def start_request(name, traceparent=None, attributes=None):
+    """
+    为一个入站请求创建根span：有合法的traceparent时延续上游trace，否则按采样率新建。
+    返回的span需要调用end()（或作为上下文管理器使用）
+    """
+    if not ENABLED:
+        return NOOP_SPAN
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id = "%032x" % random.getrandbits(128), None
+        sampled = random.random() < TRACE_SAMPLE_RATE
+    if not sampled:
+        return NOOP_SPAN
+    span = Span(name, trace_id, parent_id, attributes)
+    span._token = _current.set(span)
+    return span
+
+
+def span(name, **attributes):
+    """在当前trace下创建子span；没有进行中的trace时为空操作"""
+    parent = _current.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def traced(name):
+    """函数级span装饰器"""
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_traceparent():
+    """当前span的traceparent，用于向下游传递；没有进行中的trace时返回None"""
+    current = _current.get()
+    return current.traceparent if current is not None else None